@@ -0,0 +1,40 @@
+-- Table + indexes for one extra corpus from Database_Code/corpora.py.
+-- {table} is filled in by create_corpus_table(); same columns as swebench_data
+-- so ingestion and retrieval work unchanged, but only the fields every source
+-- has are required.
+CREATE TABLE IF NOT EXISTS {table}(
+id BIGSERIAL PRIMARY KEY,
+
+instance_id TEXT NOT NULL UNIQUE,
+repo TEXT NOT NULL DEFAULT '',
+base_commit TEXT,
+version TEXT,
+environment_setup_commit TEXT,
+
+problem_statement TEXT NOT NULL,
+hint TEXT,
+
+patch TEXT NOT NULL DEFAULT '',
+test_patch TEXT,
+
+created_at TEXT,
+
+fail_to_pass JSONB NOT NULL DEFAULT '[]',
+pass_to_pass JSONB NOT NULL DEFAULT '[]',
+
+error_types TEXT[] NOT NULL DEFAULT '{{}}',
+ps_tokens TEXT[] NOT NULL DEFAULT '{{}}',
+touched_files TEXT[] NOT NULL DEFAULT '{{}}',
+
+embedding vector(1536)
+);
+
+CREATE INDEX IF NOT EXISTS {embedding_idx}
+ON {table}
+USING hnsw (embedding vector_cosine_ops);
+
+CREATE INDEX IF NOT EXISTS {repo_idx}
+ON {table} (repo);
+
+CREATE INDEX IF NOT EXISTS {error_types_idx}
+ON {table} USING gin (error_types);
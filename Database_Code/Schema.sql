@@ -1,5 +1,6 @@
 -- PGvector extension 
 CREATE EXTENSION IF NOT EXISTS vector;
+DROP TABLE IF EXISTS patch_symbols;
 DROP TABLE IF EXISTS swebench_data;
 CREATE TABLE IF NOT EXISTS swebench_data(
 id BIGSERIAL PRIMARY KEY, 
@@ -23,6 +24,13 @@ test_patch TEXT NOT NULL,
 --time
 created_at TEXT NOT NULL, 
 
+-- Rerank features (precomputed at ingestion, see Database_Code/features.py)
+error_types TEXT[] NOT NULL DEFAULT '{}',
+ps_tokens TEXT[] NOT NULL DEFAULT '{}',
+
+-- Files the patch changes, for exact path lookups (see features.touched_files)
+touched_files TEXT[] NOT NULL DEFAULT '{}',
+
 -- Test cases 
 fail_to_pass JSONB NOT NULL, 
 pass_to_pass JSONB NOT NULL, 
@@ -37,6 +45,17 @@ embedding vector(1536) -- 200 is a placeholder, will change once embedding code
 
 
 );
+-- Embedding model per table. No row means the default model in
+-- Database_Code/embeddings.py; Database_Code/reembed.py writes a row when it
+-- switches a table to a new model.
+CREATE TABLE IF NOT EXISTS embedding_config(
+table_name TEXT PRIMARY KEY,
+model TEXT NOT NULL,
+dimensions INT NOT NULL,
+switched_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+DELETE FROM embedding_config WHERE table_name = 'swebench_data';
+
 -- Vector index 
 CREATE INDEX IF NOT EXISTS swebench_data_embedding_idx
 ON swebench_data
@@ -49,3 +68,64 @@ ON swebench_data (repo);
 
 CREATE INDEX IF NOT EXISTS swebench_data_base_commit_idx
 ON swebench_data (base_commit);
+
+-- Exception-type facet (error_types && ARRAY[...])
+CREATE INDEX IF NOT EXISTS swebench_data_error_types_idx
+ON swebench_data USING gin (error_types);
+
+-- Exact lookups (LLM_Code/exact_match.py): failing test IDs (fail_to_pass ?| ARRAY[...])
+-- and library files from a traceback (touched_files && ARRAY[...])
+CREATE INDEX IF NOT EXISTS swebench_data_fail_to_pass_idx
+ON swebench_data USING gin (fail_to_pass);
+
+CREATE INDEX IF NOT EXISTS swebench_data_pass_to_pass_idx
+ON swebench_data USING gin (pass_to_pass);
+
+CREATE INDEX IF NOT EXISTS swebench_data_touched_files_idx
+ON swebench_data USING gin (touched_files);
+
+-- Inverted index of the classes / functions each patch touches (filled by
+-- backfill_patch_symbols() in ingest_data.py, see features.patch_symbols).
+-- The primary key doubles as the symbol -> instances lookup index used by
+-- LLM_Code/symbol_search.py.
+CREATE TABLE IF NOT EXISTS patch_symbols(
+symbol TEXT NOT NULL,
+instance_id TEXT NOT NULL,
+kind TEXT NOT NULL, -- class | function | method (Class.method)
+PRIMARY KEY (symbol, instance_id)
+);
+
+CREATE INDEX IF NOT EXISTS patch_symbols_instance_id_idx
+ON patch_symbols (instance_id);
+
+-- Per-repo partial vector indexes are created after ingestion by
+-- create_facet_indexes() in ingest_data.py, since the repo list comes from the data.
+
+-- Rerank score (lower is better). Same formula the Python rerank in
+-- Testing/llm_testing.py used, so the whole candidate pool can be scored in SQL.
+CREATE OR REPLACE FUNCTION rerank_score(
+    distance DOUBLE PRECISION,
+    row_repo TEXT,
+    row_error_types TEXT[],
+    row_tokens TEXT[],
+    repo_hints TEXT[],
+    error_type TEXT,
+    error_words TEXT[],
+    code_words TEXT[],
+    w_repo DOUBLE PRECISION,
+    w_error_type DOUBLE PRECISION,
+    w_error_word DOUBLE PRECISION,
+    max_error_words DOUBLE PRECISION,
+    w_code_word DOUBLE PRECISION,
+    max_code_words DOUBLE PRECISION
+) RETURNS DOUBLE PRECISION
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT distance
+        - CASE WHEN row_repo = ANY(repo_hints) THEN w_repo ELSE 0 END
+        - CASE WHEN error_type <> '' AND error_type = ANY(row_error_types) THEN w_error_type ELSE 0 END
+        - LEAST(w_error_word * cardinality(ARRAY(
+              SELECT unnest(row_tokens) INTERSECT SELECT unnest(error_words))), max_error_words)
+        - LEAST(w_code_word * cardinality(ARRAY(
+              SELECT unnest(row_tokens) INTERSECT SELECT unnest(code_words))), max_code_words);
+$$;
@@ -0,0 +1,102 @@
+import json
+import struct
+
+import numpy as np
+
+# Encoders for PostgreSQL's binary COPY format, so rows can be streamed into
+# Postgres without formatting every value (especially every float) as text.
+# https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+COPY_TRAILER = struct.pack(">h", -1)
+
+TEXT_OID = 25
+
+
+def encode_text(value) -> bytes:
+    return str(value).encode("utf-8")
+
+
+def encode_jsonb(value) -> bytes:
+    # jsonb binary format is a version byte followed by the JSON text
+    text = value if isinstance(value, str) else json.dumps(value)
+    return b"\x01" + text.encode("utf-8")
+
+
+def encode_text_array(values) -> bytes:
+    values = list(values or [])
+    if not values:
+        return struct.pack(">iii", 0, 0, TEXT_OID)
+
+    parts = [struct.pack(">iiiii", 1, 0, TEXT_OID, len(values), 1)]
+    for v in values:
+        b = encode_text(v)
+        parts.append(struct.pack(">i", len(b)))
+        parts.append(b)
+    return b"".join(parts)
+
+
+def encode_vector(values) -> bytes:
+    # pgvector's vector_send: int16 dim, int16 unused, then big-endian float4s
+    arr = np.asarray(values, dtype=">f4")
+    return struct.pack(">hh", arr.shape[0], 0) + arr.tobytes()
+
+
+def decode_vector(data) -> np.ndarray:
+    """
+    Inverse of encode_vector, for vector_send(embedding) results read as bytea.
+    """
+    dim, _ = struct.unpack_from(">hh", data)
+    return np.frombuffer(data, dtype=">f4", count=dim, offset=4).astype(np.float32)
+
+
+def encode_row(values, encoders) -> bytes:
+    parts = [struct.pack(">h", len(values))]
+    for value, encode in zip(values, encoders):
+        if value is None:
+            parts.append(struct.pack(">i", -1))
+        else:
+            b = encode(value)
+            parts.append(struct.pack(">i", len(b)))
+            parts.append(b)
+    return b"".join(parts)
+
+
+class CopyStream:
+    """
+    File-like object that copy_expert() reads from, encoding rows lazily so the
+    whole COPY payload never has to sit in memory.
+    """
+
+    def __init__(self, rows, encoders):
+        self._chunks = self._generate(rows, encoders)
+        self._buffer = b""
+
+    @staticmethod
+    def _generate(rows, encoders):
+        yield COPY_HEADER
+        for row in rows:
+            yield encode_row(row, encoders)
+        yield COPY_TRAILER
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+
+        if size < 0:
+            size = len(self._buffer)
+        out, self._buffer = self._buffer[:size], self._buffer[size:]
+        return out
+
+
+def copy_rows(cur, table: str, columns: list[str], encoders, rows):
+    """
+    Binary COPY rows (iterables of values, in column order) into table.
+    """
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT binary)",
+        CopyStream(rows, encoders),
+    )
@@ -0,0 +1,194 @@
+import json
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from psycopg2 import sql
+
+# -----------------------------
+# Corpus registry
+# -----------------------------
+# Every corpus lives in its own table with its own vector index, so each one can
+# be re-ingested or reindexed without touching the others. Retrieval fans out
+# over the selected corpora (see LLM_Code/federated.py).
+#
+# source "hf"    -> Hugging Face dataset in SWE-bench format
+# source "jsonl" -> one JSON object per line with at least instance_id and
+#                   problem_statement (repo, patch, hint, ... are optional)
+# source "workspace" -> .py files under root, one row per function/class
+#
+# weight scales a corpus' merged score (< 1 favours it, > 1 penalises it).
+#
+# Usage:
+#   python Database_Code/corpora.py ingest <corpus>
+#   python Database_Code/corpora.py reindex <corpus>
+
+CORPORA = {
+    "swebench_verified": {
+        "table": "swebench_data",  # created by Schema.sql
+        "source": "hf",
+        "dataset": "SWE-bench/SWE-bench_Verified",
+        "split": "test",
+        "limit": 500,
+        "weight": 1.0,
+    },
+    "swebench_lite": {
+        "table": "corpus_swebench_lite",
+        "source": "hf",
+        "dataset": "SWE-bench/SWE-bench_Lite",
+        "split": "test",
+        "limit": None,
+        "weight": 1.0,
+    },
+    "swebench_full": {
+        "table": "corpus_swebench_full",
+        "source": "hf",
+        "dataset": "SWE-bench/SWE-bench",
+        "split": "test",
+        "limit": None,
+        "weight": 1.0,
+    },
+    "bug_tracker": {
+        "table": "corpus_bug_tracker",
+        "source": "jsonl",
+        "path": os.getenv("BUG_TRACKER_EXPORT", os.path.join(PROJECT_ROOT, "data", "bug_tracker.jsonl")),
+        "weight": 1.0,
+    },
+    "assistant_sessions": {
+        "table": "corpus_assistant_sessions",
+        "source": "jsonl",
+        "path": os.getenv("ASSISTANT_SESSIONS_EXPORT", os.path.join(PROJECT_ROOT, "data", "assistant_sessions.jsonl")),
+        "weight": 1.0,
+    },
+    # the developer's own project, chunked by function (Database_Code/workspace_index.py);
+    # root is only what `ingest workspace` indexes: searches are limited to the
+    # workspace folder each request names (LLM_Code/federated.py)
+    "workspace": {
+        "table": "corpus_workspace",
+        "source": "workspace",
+        "root": os.getenv("WORKSPACE_ROOT", os.getcwd()),
+        "weight": 1.0,
+    },
+}
+
+DEFAULT_CORPUS = "swebench_verified"
+
+SWEBENCH_FIELDS = [
+    "instance_id", "repo", "base_commit", "version", "environment_setup_commit",
+    "problem_statement", "hints_text", "patch", "test_patch", "created_at",
+]
+
+
+def get_corpus(name: str) -> dict:
+    if name not in CORPORA:
+        raise KeyError(f"Unknown corpus '{name}'. Known corpora: {', '.join(CORPORA)}")
+    return CORPORA[name]
+
+
+def selected_corpora() -> list[str]:
+    """
+    Corpora to search, from ASSISTANT_CORPORA (comma-separated), default SWE-bench Verified only.
+    """
+    names = [n.strip() for n in os.getenv("ASSISTANT_CORPORA", DEFAULT_CORPUS).split(",") if n.strip()]
+    for name in names:
+        get_corpus(name)
+    return names
+
+
+def create_corpus_table(conn, name: str):
+    table = get_corpus(name)["table"]
+    if table == "swebench_data":
+        # owned by Schema.sql / run_schema()
+        return
+
+    schema_path = os.path.join(os.path.dirname(__file__), "Corpus_Schema.sql")
+    with open(schema_path, "r") as f:
+        template = f.read()
+
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL(template).format(
+            table=sql.Identifier(table),
+            embedding_idx=sql.Identifier(f"{table}_embedding_idx"),
+            repo_idx=sql.Identifier(f"{table}_repo_idx"),
+            error_types_idx=sql.Identifier(f"{table}_error_types_idx"),
+        ))
+    conn.commit()
+
+
+def load_jsonl(path: str):
+    """
+    Read an export (bug tracker, resolved assistant sessions, ...) and map it
+    onto the SWE-bench field names transform_dataset() expects.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            row = {field: record.get(field) or "" for field in SWEBENCH_FIELDS}
+            row["hints_text"] = row["hints_text"] or record.get("hint") or ""
+            for field in ("FAIL_TO_PASS", "PASS_TO_PASS"):
+                value = record.get(field) or record.get(field.lower()) or []
+                row[field] = value if isinstance(value, str) else json.dumps(value)
+            yield row
+
+
+def ingest_corpus(conn, name: str):
+    from Database_Code.ingest_data import insert_data, insert_rows, transform_dataset
+
+    corpus = get_corpus(name)
+    if corpus["source"] == "workspace":
+        from Database_Code.workspace_index import create_workspace_tables, index_workspace
+
+        create_workspace_tables(conn)
+        index_workspace(conn, corpus["root"])
+        return
+
+    create_corpus_table(conn, name)
+
+    if corpus["source"] == "hf":
+        insert_data(conn, corpus["split"], table=corpus["table"],
+                    dataset=corpus["dataset"], limit=corpus["limit"])
+    else:
+        insert_rows(conn, transform_dataset(load_jsonl(corpus["path"]), limit=None), corpus["table"])
+
+
+def reindex_corpus(conn, name: str):
+    """
+    Rebuild one corpus' indexes without blocking reads of it (or any other corpus).
+    """
+    table = get_corpus(name)["table"]
+    old_autocommit = conn.autocommit
+    conn.autocommit = True  # REINDEX CONCURRENTLY cannot run inside a transaction
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("REINDEX TABLE CONCURRENTLY {};").format(sql.Identifier(table)))
+            cur.execute(sql.SQL("ANALYZE {};").format(sql.Identifier(table)))
+    finally:
+        conn.autocommit = old_autocommit
+
+
+def main():
+    from Database_Code.db import connection
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ("ingest", "reindex"):
+        print(f"Usage: python Database_Code/corpora.py ingest|reindex <{'|'.join(CORPORA)}>")
+        sys.exit(1)
+
+    command, name = sys.argv[1], sys.argv[2]
+    conn = connection()
+    try:
+        if command == "ingest":
+            ingest_corpus(conn, name)
+        else:
+            reindex_corpus(conn, name)
+        print(f"{command} {name} complete.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import os
+import psycopg2
+from pgvector.psycopg2 import register_vector
+
+# Bump whenever Schema.sql changes the swebench_data columns; corpus snapshots
+# record it and refuse to load into a different schema.
+SCHEMA_VERSION = 4
+
+
+# connects the postgresql database to this codebase 
+def connection():
+    conn = psycopg2.connect(
+        dbname="swe_bench", # change to your database name if needed 
+        user = "postgres", # change to your user if needed 
+        password = "password", # change this to the password for postgres on your local machine 
+        host = "localhost", #or host.docker.internal if you are using docker to run it 
+        port = 5432, # This is the port that your postgres is running on you local machine. change if needed 
+        
+    )
+    with conn.cursor() as cur:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+    conn.commit()
+    register_vector(conn) #for pgvector extension 
+    load_embedding_model(conn)
+    
+    return conn
+
+
+def embedding_model(conn, table: str = "swebench_data") -> tuple[str, int | None] | None:
+    """
+    (model, dimensions) recorded for table in embedding_config, or None if the
+    table still uses the default model.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('embedding_config') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            row = None
+        else:
+            cur.execute("SELECT model, dimensions FROM embedding_config WHERE table_name = %s;", (table,))
+            row = cur.fetchone()
+    conn.commit()
+    return row
+
+
+# queries must be embedded with the model the stored vectors were built with
+def load_embedding_model(conn):
+    from Database_Code.embeddings import OPENAI_MODEL, use_model
+
+    row = embedding_model(conn)
+    if row:
+        use_model(*row)
+    else:
+        use_model(OPENAI_MODEL)
+
+def run_schema(conn):
+    with conn.cursor() as cur:
+        schema_path = os.path.join(os.path.dirname(__file__), "Schema.sql")
+        with open(schema_path, "r") as f: 
+            sql = f.read()
+            cur.execute(sql)
+    conn.commit()
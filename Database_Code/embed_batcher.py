@@ -0,0 +1,195 @@
+from __future__ import annotations
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from Database_Code import embeddings
+
+# -----------------------------
+# Embedding micro-batcher
+# -----------------------------
+# Every request embeds a handful of short strings, one embeddings.create call
+# each. The batcher queues those calls from all threads of the process (the
+# runner answers several requests at once, and one request submits all its
+# retrieval queries together), waits at most EMBED_BATCH_WINDOW_MS after the
+# first one, and sends everything queued as a single API request per model,
+# so API request count and per-request overhead stop growing with load.
+# Batches go out on a small pool, so a slow reply does not hold up the next
+# window.
+#
+# One line per batch goes to LOG_PATH (size, queueing delay each text added,
+# API latency):
+#
+#   python Database_Code/embed_batcher.py stats
+
+# API requests in flight at once
+SEND_WORKERS = int(os.getenv("EMBED_BATCH_SEND_WORKERS", "4"))
+
+LOG_PATH = os.getenv("EMBED_BATCH_LOG", os.path.join(os.path.dirname(__file__), "embed_batch_log.jsonl"))
+
+
+class Pending:
+    def __init__(self, text: str, params: dict, timeout: float | None):
+        self.text = text
+        self.params = params
+        self.queued_at = time.monotonic()
+        self.expires_at = self.queued_at + timeout if timeout is not None else None
+        self.future = Future()
+
+
+class EmbedBatcher:
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=SEND_WORKERS, thread_name_prefix="embed-send")
+        self._thread = threading.Thread(target=self._collect, name="embed-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str, timeout: float | None, params: dict) -> Future:
+        """
+        Queue an already truncated text; the Future gets its float32 vector,
+        or the API error of the batch it went out in. The batch may outlast
+        timeout, so wait with future.result(timeout=...).
+        """
+        item = Pending(text, params, timeout)
+        self._queue.put(item)
+        return item.future
+
+    def _collect(self):
+        while True:
+            first = self._queue.get()
+            batch = [first]
+            flush_at = first.queued_at + embeddings.EMBED_BATCH_WINDOW_MS / 1000
+            while len(batch) < embeddings.EMBED_BATCH_MAX_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, flush_at - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            # one API request per model / dimensions
+            groups = {}
+            for item in batch:
+                groups.setdefault(tuple(sorted(item.params.items())), []).append(item)
+            for group in groups.values():
+                self._pool.submit(self._send, group)
+
+    def _send(self, group: list[Pending]):
+        sent_at = time.monotonic()
+        # callers whose timeout already ran out have stopped waiting
+        for item in group:
+            if item.expires_at is not None and item.expires_at <= sent_at:
+                item.future.set_exception(FutureTimeout("embedding timed out in the batch queue"))
+        group = [item for item in group if not item.future.done()]
+        if not group:
+            return
+
+        # the most patient caller bounds the batch (no bound if one has no
+        # timeout); the others stop waiting on their own with
+        # future.result(timeout=...)
+        client = embeddings.get_client()
+        if all(item.expires_at is not None for item in group):
+            client = client.with_options(timeout=max(item.expires_at for item in group) - sent_at, max_retries=0)
+
+        error = None
+        try:
+            resp = client.embeddings.create(
+                input=[item.text for item in group],
+                encoding_format="base64",
+                **group[0].params,
+            )
+            # results carry their input index; do not rely on response order
+            for d in resp.data:
+                group[d.index].future.set_result(embeddings.decode_embedding(d.embedding))
+        except Exception as e:
+            error = e
+            for item in group:
+                if not item.future.done():
+                    item.future.set_exception(e)
+
+        log_batch({
+            "timestamp": time.time(),
+            "size": len(group),
+            "model": group[0].params["model"],
+            "queue_delay_ms": [round((sent_at - item.queued_at) * 1000, 2) for item in group],
+            "api_ms": round((time.monotonic() - sent_at) * 1000, 2),
+            "ok": error is None,
+        })
+
+
+_batcher = None
+_batcher_pid = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher() -> EmbedBatcher:
+    global _batcher, _batcher_pid
+    with _batcher_lock:
+        # a forked child (LLM_Code/runner.py) does not inherit the threads
+        if _batcher is None or _batcher_pid != os.getpid():
+            _batcher, _batcher_pid = EmbedBatcher(), os.getpid()
+        return _batcher
+
+
+def log_batch(record: dict):
+    try:
+        with open(LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"Could not write embed batch log: {e}")
+
+
+def batch_stats() -> dict:
+    """
+    API requests sent, texts embedded, batch size distribution and the
+    queueing delay the window added per text.
+    """
+    import numpy as np
+
+    records = []
+    try:
+        with open(LOG_PATH, "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        pass
+    if not records:
+        return {"batches": 0}
+
+    sizes = [r["size"] for r in records]
+    delays = [d for r in records for d in r["queue_delay_ms"]]
+    api = [r["api_ms"] for r in records]
+
+    def pct(values, q):
+        return round(float(np.percentile(values, q)), 2)
+
+    return {
+        "batches": len(records),
+        "failed": sum(not r["ok"] for r in records),
+        "texts": sum(sizes),
+        "batch_size_mean": round(float(np.mean(sizes)), 2),
+        "batch_size_p95": pct(sizes, 95),
+        "batch_size_max": max(sizes),
+        "queue_delay_ms_p50": pct(delays, 50),
+        "queue_delay_ms_p95": pct(delays, 95),
+        "api_ms_p50": pct(api, 50),
+    }
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "stats":
+        print(json.dumps(batch_stats(), indent=2))
+        return
+
+    print("Usage: python Database_Code/embed_batcher.py stats")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,52 @@
+from __future__ import annotations
+import base64
 import os
-from openai import OpenAI
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
-import tiktoken
 import time
 load_dotenv()
 
+if TYPE_CHECKING:
+    import numpy as np
+
 # open ai model being used
 OPENAI_MODEL = "text-embedding-3-small"
 
 MAX_TOKENS = 8000
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise RuntimeError("OPENAI_API_KEY not set")
-    
-client = OpenAI(api_key=api_key)
 
-enc = tiktoken.get_encoding("cl100k_base")
+# Model (and output dimensions, None = the model's default) that queries and new
+# rows are embedded with. db.connection() switches these to what the database
+# records in embedding_config, so a re-embedding migration
+# (Database_Code/reembed.py) takes effect without code changes.
+ACTIVE_MODEL = OPENAI_MODEL
+ACTIVE_DIMENSIONS = None
+
+# tiktoken downloads the cl100k_base BPE file on first use. Point it at a cache
+# inside the repo (pre-filled by the Dockerfile) so startup never needs network.
+TOKENIZER_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".tiktoken_cache")
+os.environ.setdefault("TIKTOKEN_CACHE_DIR", TOKENIZER_CACHE_DIR)
+
+
+# client and tokenizer are created on first use rather than at import time,
+# so importing this module is cheap and does not fail without an API key
+@lru_cache(maxsize=None)
+def get_client():
+    from openai import OpenAI
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY not set")
+    return OpenAI(api_key=api_key)
+
+
+@lru_cache(maxsize=None)
+def get_encoder():
+    import tiktoken
+
+    return tiktoken.get_encoding("cl100k_base")
+
 
 def truncate(text: str, max_tokens: int = MAX_TOKENS) -> str:
     
@@ -23,6 +54,7 @@ def truncate(text: str, max_tokens: int = MAX_TOKENS) -> str:
     if not text:
         # embedding input cannot be empty 
         text = " "
+    enc = get_encoder()
     tokens = enc.encode(text)
     if len(tokens) <= max_tokens:
         return text
@@ -30,11 +62,116 @@ def truncate(text: str, max_tokens: int = MAX_TOKENS) -> str:
     return enc.decode(tokens[:max_tokens])
 
 
-def embed_text(text: str) -> list[float]:
+def use_model(model: str, dimensions: int | None = None):
+    global ACTIVE_MODEL, ACTIVE_DIMENSIONS
+    ACTIVE_MODEL, ACTIVE_DIMENSIONS = model, dimensions
+
+
+def model_params(model: str | None, dimensions: int | None) -> dict:
+    params = {"model": model or ACTIVE_MODEL}
+    dimensions = dimensions if model else (dimensions or ACTIVE_DIMENSIONS)
+    if dimensions:
+        params["dimensions"] = dimensions
+    return params
+
+
+def decode_embedding(data: str) -> np.ndarray:
+    """
+    base64 embedding from the API -> float32 vector, straight from the raw bytes
+    (no JSON float list, no Python float objects).
+    """
+    import numpy as np
+
+    return np.frombuffer(base64.b64decode(data), dtype="<f4")
+
+
+# Single embed_text calls from all threads of a process are collected for up to
+# EMBED_BATCH_WINDOW_MS (or EMBED_BATCH_MAX_SIZE texts) and sent as one API
+# request (Database_Code/embed_batcher.py). 0 sends every call on its own.
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "64"))
+
+
+def embed_text(
+    text: str, timeout: float | None = None, model: str | None = None, dimensions: int | None = None,
+) -> np.ndarray:
+    """
+    Returns a float32 numpy vector. Bind it directly as a query parameter or
+    COPY value; register_vector() in db.connection() adapts ndarrays to vector.
+    """
+    return submit_embedding(text, timeout, model, dimensions).result(timeout=timeout)
+
+
+def submit_embedding(
+    text: str, timeout: float | None = None, model: str | None = None, dimensions: int | None = None,
+) -> Future:
+    """
+    embed_text without waiting: a Future of the vector. Texts submitted
+    together (by one request or several) share an API call when batching is on;
+    that call may run longer than timeout, so the caller waits with
+    future.result(timeout=...) or its own deadline.
+    """
+    if EMBED_BATCH_WINDOW_MS > 0:
+        from Database_Code.embed_batcher import get_batcher
+
+        return get_batcher().submit(truncate(text), timeout, model_params(model, dimensions))
+
+    future = Future()
+    try:
+        future.set_result(embed_text_direct(text, timeout, model, dimensions))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def embed_text_direct(
+    text: str, timeout: float | None = None, model: str | None = None, dimensions: int | None = None,
+) -> np.ndarray:
+    """
+    One API request for one text, bypassing the batcher.
+    """
     text = truncate(text)
+    client = get_client()
+    if timeout is not None:
+        # per-request deadline; no retries, the caller decides what to do instead
+        client = client.with_options(timeout=timeout, max_retries=0)
+    # asking for base64 explicitly makes the SDK hand back the raw string
+    # instead of converting it to a list of Python floats
     resp = client.embeddings.create(
-        model=OPENAI_MODEL,
         input=text,
+        encoding_format="base64",
+        **model_params(model, dimensions),
     )
-    embedding = resp.data[0].embedding
-    return embedding
\ No newline at end of file
+    return decode_embedding(resp.data[0].embedding)
+
+
+# inputs per embeddings request; the API accepts up to 2048 (and ~300k tokens)
+EMBED_BATCH_SIZE = 100
+
+
+def embed_texts(
+    texts: list[str], timeout: float | None = None, batch_size: int = EMBED_BATCH_SIZE,
+    model: str | None = None, dimensions: int | None = None,
+) -> np.ndarray:
+    """
+    Embed many texts with one request per batch_size inputs.
+    Returns a float32 matrix with one row per text, in input order.
+    """
+    import numpy as np
+
+    client = get_client()
+    if timeout is not None:
+        client = client.with_options(timeout=timeout, max_retries=0)
+
+    rows = []
+    for i in range(0, len(texts), batch_size):
+        resp = client.embeddings.create(
+            input=[truncate(t) for t in texts[i:i + batch_size]],
+            encoding_format="base64",
+            **model_params(model, dimensions),
+        )
+        # results carry their input index; do not rely on response order
+        for item in sorted(resp.data, key=lambda d: d.index):
+            rows.append(decode_embedding(item.embedding))
+
+    return np.vstack(rows) if rows else np.zeros((0, dimensions or ACTIVE_DIMENSIONS or 1536), dtype=np.float32)
@@ -0,0 +1,125 @@
+import builtins
+import re
+
+# Builtin exceptions outside the *Error / *Exception / *Warning convention
+# (StopIteration, KeyboardInterrupt, SystemExit, GeneratorExit, ...).
+BUILTIN_EXCEPTION_NAMES = sorted(
+    name for name, obj in vars(builtins).items()
+    if isinstance(obj, type) and issubclass(obj, BaseException)
+    and not name.endswith(("Error", "Exception", "Warning"))
+)
+
+# Exception class names as they appear in problem statements and tracebacks:
+# anything named *Error / *Exception / *Warning, plus the builtins above.
+ERROR_TYPE_RE = re.compile(
+    r"\b([A-Za-z_][A-Za-z0-9_]*(?:Error|Exception|Warning)|"
+    + "|".join(BUILTIN_EXCEPTION_NAMES)
+    + r")\b"
+)
+TOKEN_RE = re.compile(r"[A-Za-z_]+")
+
+# "diff --git a/path b/path" / "+++ b/path" lines of a unified diff.
+DIFF_FILE_RE = re.compile(r"^(?:diff --git a/\S+ b/|\+\+\+ b/)(\S+)", re.MULTILINE)
+
+# "@@ -a,b +c,d @@ <enclosing line>" hunk header of a unified diff.
+HUNK_HEADER_RE = re.compile(r"^@@ [^@]* @@ ?(.*)$")
+
+# "def name" / "class Name" source line (diff prefix already removed).
+DEF_LINE_RE = re.compile(r"^(\s*)(?:async\s+)?(def|class)\s+([A-Za-z_]\w*)")
+
+# Source roots that are not part of the installed package path
+# (lib/matplotlib/... is installed as matplotlib/..., src/_pytest/... as _pytest/...).
+SOURCE_ROOTS = ("src/", "lib/")
+
+# Library names that show up in user code/errors -> SWE-bench repo.
+REPO_KEYWORDS = {
+    "django": "django/django",
+    "pytest": "pytest-dev/pytest",
+    "sphinx": "sphinx-doc/sphinx",
+    "sympy": "sympy/sympy",
+    "xarray": "pydata/xarray",
+    "astropy": "astropy/astropy",
+    "matplotlib": "matplotlib/matplotlib",
+    "sklearn": "scikit-learn/scikit-learn",
+    "scikit-learn": "scikit-learn/scikit-learn",
+}
+
+
+def tokenize(text: str) -> set[str]:
+    return set(TOKEN_RE.findall((text or "").lower()))
+
+
+def extract_error_types(text: str) -> list[str]:
+    """
+    Return the lowercased, de-duplicated exception class names mentioned in text.
+    """
+    return sorted({m.lower() for m in ERROR_TYPE_RE.findall(text or "")})
+
+
+def touched_files(patch: str) -> list[str]:
+    """
+    Files a patch changes, each also without its src/ or lib/ root, so a path
+    from an installed package's traceback matches with a plain array overlap.
+    """
+    paths = set()
+    for path in DIFF_FILE_RE.findall(patch or ""):
+        paths.add(path)
+        if path.startswith(SOURCE_ROOTS):
+            paths.add(path.split("/", 1)[1])
+    return sorted(paths)
+
+
+def patch_symbols(patch: str) -> list[tuple[str, str]]:
+    """
+    (symbol, kind) for the classes and functions a patch touches in .py
+    files, from hunk headers and from def/class lines inside the hunks.
+    Methods are stored both as "Class.method" (kind "method") and by their
+    bare name (kind "function"). Names keep their case.
+    """
+    symbols = {}
+    path, cls = None, None
+
+    def add(indent: str, word: str, name: str, from_header: bool = False):
+        nonlocal cls
+        if word == "class":
+            symbols.setdefault(name, "class")
+            if not indent:
+                cls = name
+        elif indent and cls:
+            symbols.setdefault(f"{cls}.{name}", "method")
+            symbols.setdefault(name, "function")
+        else:
+            symbols.setdefault(name, "function")
+            # headers drop the indentation, so a def there says nothing about the class
+            if not indent and not from_header:
+                cls = None
+
+    for line in (patch or "").splitlines():
+        if line.startswith("diff --git"):
+            m = DIFF_FILE_RE.match(line)
+            path, cls = (m.group(1) if m else None), None
+            continue
+        if not path or not path.endswith(".py") or line.startswith(("--- ", "+++ ")):
+            continue
+        if line.startswith("@@"):
+            m = HUNK_HEADER_RE.match(line)
+            d = DEF_LINE_RE.match(m.group(1)) if m else None
+            if d:
+                add(*d.groups(), from_header=True)
+            continue
+        d = DEF_LINE_RE.match(line[1:])
+        if d:
+            add(*d.groups())
+
+    return sorted(symbols.items())
+
+
+def rerank_features(problem_statement: str) -> dict:
+    """
+    Features stored next to each row at ingestion so the rerank can run in SQL
+    (see rerank_score in Schema.sql) instead of re-tokenizing on every query.
+    """
+    return {
+        "error_types": extract_error_types(problem_statement),
+        "ps_tokens": sorted(tokenize(problem_statement)),
+    }
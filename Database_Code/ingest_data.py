@@ -1,44 +1,25 @@
-from datasets import load_dataset
-import psycopg2
-from pgvector.psycopg2 import register_vector
-from psycopg2.extras import Json
+from psycopg2 import sql
 from datetime import datetime
 import json
-import os
-from Database_Code.embeddings import embed_text
-
-
-# connects the postgresql database to this codebase 
-def connection():
-    conn = psycopg2.connect(
-        dbname="swe_bench", # change to your database name if needed 
-        user = "postgres", # change to your user if needed 
-        password = "password", # change this to the password for postgres on your local machine 
-        host = "localhost", #or host.docker.internal if you are using docker to run it 
-        port = 5432, # This is the port that your postgres is running on you local machine. change if needed 
-        
-    )
-    with conn.cursor() as cur:
-        cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
-    conn.commit()
-    register_vector(conn) #for pgvector extension 
-    
-    return conn
+import re
+from Database_Code.copy_binary import (
+    copy_rows, encode_jsonb, encode_text, encode_text_array, encode_vector,
+)
+from Database_Code.db import connection, run_schema  # re-exported for existing scripts
+from Database_Code.embeddings import EMBED_BATCH_SIZE, embed_texts
+from Database_Code.features import patch_symbols, rerank_features, touched_files
 
-def run_schema(conn):
-    with conn.cursor() as cur:
-        schema_path = os.path.join(os.path.dirname(__file__), "Schema.sql")
-        with open(schema_path, "r") as f: 
-            sql = f.read()
-            cur.execute(sql)
-    conn.commit()
 
+SWEBENCH_DATASET = 'SWE-bench/SWE-bench_Verified'
 
 
+def load_swebench(split, dataset=SWEBENCH_DATASET):
+    # imported here so that importing this module (or anything that only needs
+    # connection()) does not pull in datasets/pyarrow/pandas
+    from datasets import load_dataset
 
-def load_swebench(split):
     # Load lite database 
-    sbl = load_dataset('SWE-bench/SWE-bench_Verified', split=split)
+    sbl = load_dataset(dataset, split=split)
     
     return sbl
 
@@ -77,13 +58,26 @@ Test patch:
 
 #function to transform raw data in to a easily manipulated state 
 def transform_dataset(sbl, limit=500):
+    # rows are embedded EMBED_BATCH_SIZE at a time, one API request per batch
+    # (the request-serving micro-batcher would only add its window to each row)
+    batch = []
     for i, row in enumerate(sbl):
-        if i >= limit:
+        if limit is not None and i >= limit:
             break
+        batch.append(row)
+        if len(batch) == EMBED_BATCH_SIZE:
+            yield from transform_batch(batch)
+            batch = []
+    yield from transform_batch(batch)
+
+
+def transform_batch(rows):
+    if not rows:
+        return
+    embeddings = embed_texts([make_embedding_text(row) for row in rows])
+    for row, emb in zip(rows, embeddings):
+        features = rerank_features(row["problem_statement"])
 
-        text = make_embedding_text(row)
-        emb = embed_text(text)
-        
         yield {
             "instance_id": row["instance_id"],
             "repo": row["repo"],
@@ -97,6 +91,9 @@ def transform_dataset(sbl, limit=500):
             "created_at": row["created_at"],
             "fail_to_pass": row["FAIL_TO_PASS"],
             "pass_to_pass": row["PASS_TO_PASS"],
+            "error_types": features["error_types"],
+            "ps_tokens": features["ps_tokens"],
+            "touched_files": touched_files(row["patch"]),
             "embedding": emb,  
         }
 
@@ -132,48 +129,171 @@ def parse_json_list(s: str):
         return [s]
 
 
-def insert_data(conn, split):
-    sbl = load_swebench(split)
+def insert_data(conn, split, table="swebench_data", dataset=SWEBENCH_DATASET, limit=500):
+    sbl = load_swebench(split, dataset)
+    insert_rows(conn, transform_dataset(sbl, limit=limit), table)
+    if table == "swebench_data":
+        backfill_patch_symbols(conn)
+
+
+ROW_COLUMNS = [
+    "instance_id", "repo", "base_commit", "version", "environment_setup_commit",
+    "problem_statement", "hint", "patch", "test_patch", "created_at",
+    "fail_to_pass", "pass_to_pass", "error_types", "ps_tokens", "touched_files", "embedding",
+]
+ROW_ENCODERS = (
+    [encode_text] * 10
+    + [encode_jsonb] * 2
+    + [encode_text_array] * 3
+    + [encode_vector]
+)
+
+
+# inserts rows produced by transform_dataset into any corpus table
+# (swebench_data or one of the tables in Database_Code/corpora.py).
+# Rows are binary COPYed into a temporary staging table (the float32 embedding
+# goes over the wire as raw bytes, never as text) and then moved across with
+# ON CONFLICT, which COPY itself does not support.
+def insert_rows(conn, rows, table="swebench_data"):
+    staging = f"{table}_staging"
+
+    def copy_values():
+        for row in rows:
+            values = dict(
+                row,
+                fail_to_pass=parse_json_list(row["fail_to_pass"]),
+                pass_to_pass=parse_json_list(row["pass_to_pass"]),
+            )
+            yield [values[c] for c in ROW_COLUMNS]
+
+    columns = sql.SQL(", ").join(map(sql.Identifier, ROW_COLUMNS))
 
     with conn.cursor() as cur:
-        for row in transform_dataset(sbl):
+        # same column types (vector(1536) included), no constraints or defaults
+        cur.execute(
+            sql.SQL("""
+                CREATE TEMP TABLE {} ON COMMIT DROP AS
+                SELECT {} FROM {} WITH NO DATA;
+            """).format(sql.Identifier(staging), columns, sql.Identifier(table))
+        )
+        copy_rows(cur, staging, ROW_COLUMNS, ROW_ENCODERS, copy_values())
+
+        cur.execute(
+            sql.SQL("""
+                INSERT INTO {} ({})
+                SELECT {} FROM {}
+                ON CONFLICT (instance_id) DO NOTHING;
+            """).format(sql.Identifier(table), columns, columns, sql.Identifier(staging))
+        )
+
+    conn.commit()
+    create_facet_indexes(conn, table)
+
 
-           
-            fail_list = parse_json_list(row["fail_to_pass"])
-            pass_list = parse_json_list(row["pass_to_pass"])
+# builds one partial vector index per repo so a repo-filtered search only
+# walks that repo's slice of the table (used by the faceted retrieval in
+# Testing/llm_testing.py). Safe to re-run; existing indexes are kept.
+# concurrently=True builds them without blocking writes (needs autocommit).
+def create_facet_indexes(conn, table="swebench_data", column="embedding", concurrently=False):
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("SELECT DISTINCT repo FROM {};").format(sql.Identifier(table)))
+        repos = [r[0] for r in cur.fetchall() if r[0]]
 
+        for repo in repos:
+            slug = re.sub(r"[^a-z0-9]+", "_", repo.lower()).strip("_")
             cur.execute(
-                """
-                INSERT INTO swebench_data (
-                    instance_id, repo, base_commit, version, environment_setup_commit,
-                    problem_statement, hint, patch, test_patch, created_at,
-                    fail_to_pass, pass_to_pass, embedding
-                )
-                VALUES (%s, %s, %s, %s, %s,
-                        %s, %s, %s, %s, %s,
-                        %s, %s, %s)
-                ON CONFLICT (instance_id) DO NOTHING;
-                """,
-                (
-                    row["instance_id"],
-                    row["repo"],
-                    row["base_commit"],
-                    row["version"],
-                    row["environment_setup_commit"],
-                    row["problem_statement"],
-                    row["hint"],
-                    row["patch"],
-                    row["test_patch"],
-                    row["created_at"],
-                    Json(fail_list),
-                    Json(pass_list),
-                    row["embedding"],
+                sql.SQL("""
+                    CREATE INDEX {} IF NOT EXISTS {}
+                    ON {}
+                    USING hnsw ({} vector_cosine_ops)
+                    WHERE repo = {};
+                """).format(
+                    sql.SQL("CONCURRENTLY" if concurrently else ""),
+                    sql.Identifier(f"{table}_{column}_{slug}_idx"[:63]),
+                    sql.Identifier(table),
+                    sql.Identifier(column),
+                    sql.Literal(repo),
                 )
             )
 
     conn.commit()
+    return repos
+
+
+# fills the rerank feature columns for rows ingested before they existed,
+# without re-downloading or re-embedding anything
+def backfill_rerank_features(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            ALTER TABLE swebench_data
+            ADD COLUMN IF NOT EXISTS error_types TEXT[] NOT NULL DEFAULT '{}',
+            ADD COLUMN IF NOT EXISTS ps_tokens TEXT[] NOT NULL DEFAULT '{}';
+        """)
+        cur.execute("SELECT id, problem_statement FROM swebench_data WHERE ps_tokens = '{}';")
+        rows = cur.fetchall()
+
+        for row_id, problem_statement in rows:
+            features = rerank_features(problem_statement)
+            cur.execute(
+                "UPDATE swebench_data SET error_types = %s, ps_tokens = %s WHERE id = %s;",
+                (features["error_types"], features["ps_tokens"], row_id),
+            )
+
+    conn.commit()
+    return len(rows)
 
 
+# fills touched_files for rows ingested before the column existed
+def backfill_touched_files(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            ALTER TABLE swebench_data
+            ADD COLUMN IF NOT EXISTS touched_files TEXT[] NOT NULL DEFAULT '{}';
+        """)
+        cur.execute("SELECT id, patch FROM swebench_data WHERE touched_files = '{}';")
+        rows = cur.fetchall()
+
+        for row_id, patch in rows:
+            cur.execute(
+                "UPDATE swebench_data SET touched_files = %s WHERE id = %s;",
+                (touched_files(patch), row_id),
+            )
+
+        cur.execute("CREATE INDEX IF NOT EXISTS swebench_data_touched_files_idx ON swebench_data USING gin (touched_files);")
+        cur.execute("CREATE INDEX IF NOT EXISTS swebench_data_fail_to_pass_idx ON swebench_data USING gin (fail_to_pass);")
+        cur.execute("CREATE INDEX IF NOT EXISTS swebench_data_pass_to_pass_idx ON swebench_data USING gin (pass_to_pass);")
+
+    conn.commit()
+    return len(rows)
 
 
+# indexes the touched classes / functions of every swebench_data row that has
+# no patch_symbols entries yet (all rows on a fresh table); safe to re-run
+def backfill_patch_symbols(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS patch_symbols(
+                symbol TEXT NOT NULL,
+                instance_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                PRIMARY KEY (symbol, instance_id)
+            );
+            CREATE INDEX IF NOT EXISTS patch_symbols_instance_id_idx ON patch_symbols (instance_id);
+        """)
+        cur.execute("""
+            SELECT d.instance_id, d.patch
+            FROM swebench_data d
+            WHERE NOT EXISTS (SELECT 1 FROM patch_symbols s WHERE s.instance_id = d.instance_id);
+        """)
+        rows = cur.fetchall()
+
+        values = [
+            [symbol, instance_id, kind]
+            for instance_id, patch in rows
+            for symbol, kind in patch_symbols(patch)
+        ]
+        copy_rows(cur, "patch_symbols", ["symbol", "instance_id", "kind"], [encode_text] * 3, values)
+        cur.execute("ANALYZE patch_symbols;")
 
+    conn.commit()
+    return len(values)
@@ -0,0 +1,416 @@
+import os
+import re
+import sys
+import time
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from psycopg2 import sql
+
+from Database_Code.corpora import CORPORA
+from Database_Code.db import connection, embedding_model
+from Database_Code.embeddings import OPENAI_MODEL, embed_texts
+
+# -----------------------------
+# Re-embedding migration
+# -----------------------------
+# Moves a corpus table to a new embedding model (or dimension) while it keeps
+# serving queries, without re-downloading the source data:
+#   1. add a shadow column embedding_next vector(<dims>)
+#   2. stream the rows through a server-side cursor, rebuild each row's
+#      embedding text from its own columns and write the new vectors in
+#      batches; progress is committed per batch, so a killed job resumes where
+#      it stopped, and REEMBED_MAX_ROWS_PER_SEC throttles the API / DB load
+#   3. build copies of every vector index on the shadow column CONCURRENTLY
+#   4. cut over in one transaction: embedding -> embedding_prev,
+#      embedding_next -> embedding, swap the index names, record the model in
+#      embedding_config (which db.connection() reads for query embeddings)
+#   5. finalize later: drop embedding_prev once the new model looks good
+#
+# Usage:
+#   python Database_Code/reembed.py run <corpus|table> <model> [dimensions]
+#   python Database_Code/reembed.py status <corpus|table>
+#   python Database_Code/reembed.py finalize <corpus|table>
+#
+# Only SWE-bench-format tables can be migrated (the embedding text is rebuilt
+# from their columns; the workspace corpus is re-indexed instead). Query
+# embeddings follow swebench_data's entry in embedding_config and one query
+# vector is searched against every corpus, so another corpus can only move to
+# the model swebench_data already uses: migrate swebench_data first.
+
+SHADOW_COLUMN = "embedding_next"
+PREVIOUS_COLUMN = "embedding_prev"
+
+REEMBED_BATCH_SIZE = int(os.getenv("REEMBED_BATCH_SIZE", "100"))
+# 0 = as fast as the API allows
+REEMBED_MAX_ROWS_PER_SEC = float(os.getenv("REEMBED_MAX_ROWS_PER_SEC", "20"))
+
+TEXT_COLUMNS = [
+    "id", "repo", "problem_statement", "hint", "fail_to_pass", "pass_to_pass", "patch", "test_patch",
+]
+
+# the table query embeddings are configured from (db.load_embedding_model)
+QUERY_TABLE = "swebench_data"
+DEFAULT_DIMENSIONS = 1536
+
+MIGRATIONS_SQL = """
+    CREATE TABLE IF NOT EXISTS embedding_migrations(
+    table_name TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    dimensions INT NOT NULL,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    rows_done BIGINT NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'backfill',
+    started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+INDEXES_ON_COLUMN_SQL = """
+    SELECT i.relname, pg_get_indexdef(i.oid)
+    FROM pg_index x
+    JOIN pg_class i ON i.oid = x.indexrelid
+    JOIN pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = ANY(x.indkey)
+    WHERE x.indrelid = %s::regclass AND a.attname = %s;
+"""
+
+
+def row_embedding_text(row: tuple) -> str:
+    """
+    The text the row was originally embedded from (make_embedding_text), rebuilt
+    from the stored columns.
+    """
+    import json
+
+    from Database_Code.ingest_data import make_embedding_text
+
+    _, repo, problem_statement, hint, fail_to_pass, pass_to_pass, patch, test_patch = row
+    return make_embedding_text({
+        "repo": repo,
+        "problem_statement": problem_statement,
+        "hints_text": hint,
+        "FAIL_TO_PASS": json.dumps(fail_to_pass) if fail_to_pass else "",
+        "PASS_TO_PASS": json.dumps(pass_to_pass) if pass_to_pass else "",
+        "patch": patch,
+        "test_patch": test_patch,
+    })
+
+
+def shadow_index_name(name: str) -> str:
+    return f"{name[:58]}_next"
+
+
+def previous_index_name(name: str) -> str:
+    return f"{name[:58]}_prev"
+
+
+# -----------------------------
+# Steps
+# -----------------------------
+
+def check_migratable(conn, table: str, model: str, dimensions: int):
+    """
+    Raise RuntimeError unless table holds SWE-bench-format rows, whose
+    embedding text is rebuilt from their columns, and (for any table but
+    QUERY_TABLE) model and dimensions match what queries are embedded with.
+    """
+    sources = {c["source"] for c in CORPORA.values() if c["table"] == table}
+    if "workspace" in sources:
+        # same columns, but its rows embed source code chunks (workspace_index.py)
+        raise RuntimeError(
+            f"{table} is the workspace corpus; re-index it with the new model instead "
+            f"(Database_Code/workspace_index.py index <root>)"
+        )
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = %s;", (table,))
+        columns = {r[0] for r in cur.fetchall()}
+    conn.commit()
+    if not columns:
+        raise RuntimeError(f"Table {table} does not exist")
+    missing = [c for c in TEXT_COLUMNS if c not in columns]
+    if missing:
+        raise RuntimeError(
+            f"{table} is not a SWE-bench-format table (no {', '.join(missing)}); "
+            f"its embedding text cannot be rebuilt from its columns"
+        )
+
+    if table == QUERY_TABLE:
+        return
+    query_model, query_dimensions = embedding_model(conn, QUERY_TABLE) or (OPENAI_MODEL, None)
+    if (query_model, query_dimensions or DEFAULT_DIMENSIONS) != (model, dimensions):
+        raise RuntimeError(
+            f"Queries are embedded with {query_model} ({query_dimensions or DEFAULT_DIMENSIONS} dims), "
+            f"the model of {QUERY_TABLE}; migrate {QUERY_TABLE} to {model} ({dimensions} dims) first"
+        )
+
+
+def get_migration(conn, table: str):
+    with conn.cursor() as cur:
+        cur.execute(MIGRATIONS_SQL)
+        cur.execute(
+            "SELECT model, dimensions, last_id, rows_done, status FROM embedding_migrations WHERE table_name = %s;",
+            (table,),
+        )
+        row = cur.fetchone()
+    conn.commit()
+    return row
+
+
+def prepare(conn, table: str, model: str, dimensions: int):
+    migration = get_migration(conn, table)
+    if migration and migration[4] != "done" and (migration[0], migration[1]) != (model, dimensions):
+        raise RuntimeError(
+            f"{table} is already migrating to {migration[0]} ({migration[1]} dims); "
+            f"finish or finalize that migration first"
+        )
+
+    with conn.cursor() as cur:
+        cur.execute(
+            sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS {} vector({});").format(
+                sql.Identifier(table), sql.Identifier(SHADOW_COLUMN), sql.Literal(dimensions)
+            )
+        )
+        if not migration or migration[4] == "done":
+            cur.execute("""
+                INSERT INTO embedding_migrations (table_name, model, dimensions)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (table_name) DO UPDATE
+                SET model = EXCLUDED.model, dimensions = EXCLUDED.dimensions, last_id = 0,
+                    rows_done = 0, status = 'backfill', started_at = now(), updated_at = now();
+            """, (table, model, dimensions))
+    conn.commit()
+
+
+def backfill(conn, table: str, model: str, dimensions: int, catch_up: bool = False) -> int:
+    """
+    Re-embed every row whose shadow column is still empty, in id order from the
+    last committed batch. catch_up=True rescans from the start for rows
+    inserted behind the cursor while the job ran.
+    """
+    _, _, last_id, rows_done, _ = get_migration(conn, table)
+    if catch_up:
+        last_id = 0
+
+    # the named cursor lives on its own connection: its transaction stays open
+    # for the whole scan while the writer commits after every batch
+    reader = connection()
+    done = 0
+    try:
+        with reader.cursor(name="reembed_scan") as scan, conn.cursor() as cur:
+            scan.itersize = REEMBED_BATCH_SIZE
+            scan.execute(
+                sql.SQL("""
+                    SELECT {}
+                    FROM {}
+                    WHERE id > %s AND {} IS NULL AND embedding IS NOT NULL
+                    ORDER BY id;
+                """).format(
+                    sql.SQL(", ").join(map(sql.Identifier, TEXT_COLUMNS)),
+                    sql.Identifier(table),
+                    sql.Identifier(SHADOW_COLUMN),
+                ),
+                (last_id,),
+            )
+
+            while True:
+                batch_start = time.time()
+                batch = scan.fetchmany(REEMBED_BATCH_SIZE)
+                if not batch:
+                    break
+
+                vectors = embed_texts(
+                    [row_embedding_text(r) for r in batch], model=model, dimensions=dimensions
+                )
+                ids = [r[0] for r in batch]
+                cur.execute(
+                    sql.SQL("""
+                        UPDATE {table} t
+                        SET {column} = v.embedding
+                        FROM unnest(%s::bigint[], %s::vector[]) AS v(id, embedding)
+                        WHERE t.id = v.id;
+                    """).format(table=sql.Identifier(table), column=sql.Identifier(SHADOW_COLUMN)),
+                    (ids, list(vectors)),
+                )
+                done += len(batch)
+                cur.execute("""
+                    UPDATE embedding_migrations
+                    SET last_id = GREATEST(last_id, %s), rows_done = rows_done + %s, updated_at = now()
+                    WHERE table_name = %s;
+                """, (ids[-1], len(batch), table))
+                conn.commit()
+                print(f"Re-embedded {rows_done + done} rows of {table} (id {ids[-1]})")
+
+                if REEMBED_MAX_ROWS_PER_SEC > 0:
+                    time.sleep(max(0.0, len(batch) / REEMBED_MAX_ROWS_PER_SEC - (time.time() - batch_start)))
+    finally:
+        reader.close()
+    return done
+
+
+def build_shadow_indexes(conn, table: str):
+    """
+    Copy every index on embedding onto the shadow column, CONCURRENTLY so
+    reads and writes continue while they build.
+    """
+    with conn.cursor() as cur:
+        cur.execute(INDEXES_ON_COLUMN_SQL, (table, "embedding"))
+        indexes = cur.fetchall()
+    conn.commit()
+
+    old_autocommit = conn.autocommit
+    conn.autocommit = True  # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    try:
+        with conn.cursor() as cur:
+            for name, indexdef in indexes:
+                # CREATE INDEX <name> ON <table> USING <method> (embedding <opclass>) ...
+                definition = indexdef.split(" ON ", 1)[1]
+                definition = re.sub(r"\(embedding\b", f"({SHADOW_COLUMN}", definition, count=1)
+                print(f"Building {shadow_index_name(name)}")
+                cur.execute(
+                    sql.SQL("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON ").format(
+                        sql.Identifier(shadow_index_name(name))
+                    ).as_string(conn) + definition
+                )
+    finally:
+        conn.autocommit = old_autocommit
+
+
+def cutover(conn, table: str, model: str, dimensions: int):
+    """
+    Switch retrieval to the shadow column in one transaction. Writes are blocked
+    for its duration (reads continue until the renames); rows that still have
+    no new embedding are embedded inside it, so nothing is left behind.
+    """
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("LOCK TABLE {} IN SHARE ROW EXCLUSIVE MODE;").format(sql.Identifier(table)))
+
+        cur.execute(
+            sql.SQL("SELECT {} FROM {} WHERE {} IS NULL AND embedding IS NOT NULL;").format(
+                sql.SQL(", ").join(map(sql.Identifier, TEXT_COLUMNS)),
+                sql.Identifier(table),
+                sql.Identifier(SHADOW_COLUMN),
+            )
+        )
+        stragglers = cur.fetchall()
+        if stragglers:
+            vectors = embed_texts([row_embedding_text(r) for r in stragglers], model=model, dimensions=dimensions)
+            cur.execute(
+                sql.SQL("""
+                    UPDATE {table} t SET {column} = v.embedding
+                    FROM unnest(%s::bigint[], %s::vector[]) AS v(id, embedding)
+                    WHERE t.id = v.id;
+                """).format(table=sql.Identifier(table), column=sql.Identifier(SHADOW_COLUMN)),
+                ([r[0] for r in stragglers], list(vectors)),
+            )
+
+        cur.execute(INDEXES_ON_COLUMN_SQL, (table, "embedding"))
+        old_indexes = [r[0] for r in cur.fetchall()]
+        cur.execute(INDEXES_ON_COLUMN_SQL, (table, SHADOW_COLUMN))
+        new_indexes = {r[0] for r in cur.fetchall()}
+
+        rename_column = sql.SQL("ALTER TABLE {} RENAME COLUMN {} TO {};")
+        rename_index = sql.SQL("ALTER INDEX {} RENAME TO {};")
+
+        cur.execute(rename_column.format(
+            sql.Identifier(table), sql.Identifier("embedding"), sql.Identifier(PREVIOUS_COLUMN)))
+        cur.execute(rename_column.format(
+            sql.Identifier(table), sql.Identifier(SHADOW_COLUMN), sql.Identifier("embedding")))
+
+        for name in old_indexes:
+            cur.execute(rename_index.format(sql.Identifier(name), sql.Identifier(previous_index_name(name))))
+            if shadow_index_name(name) in new_indexes:
+                cur.execute(rename_index.format(sql.Identifier(shadow_index_name(name)), sql.Identifier(name)))
+
+        cur.execute("""
+            INSERT INTO embedding_config (table_name, model, dimensions)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (table_name) DO UPDATE
+            SET model = EXCLUDED.model, dimensions = EXCLUDED.dimensions, switched_at = now();
+        """, (table, model, dimensions))
+        cur.execute(
+            "UPDATE embedding_migrations SET status = 'switched', updated_at = now() WHERE table_name = %s;",
+            (table,),
+        )
+        cur.execute(sql.SQL("ANALYZE {};").format(sql.Identifier(table)))
+    conn.commit()
+    print(f"{table} now serves {model} ({dimensions} dims); {len(stragglers)} rows embedded during cutover")
+
+
+def finalize(conn, table: str):
+    with conn.cursor() as cur:
+        # dropping the column drops its (renamed *_prev) indexes with it
+        cur.execute(sql.SQL("ALTER TABLE {} DROP COLUMN IF EXISTS {};").format(
+            sql.Identifier(table), sql.Identifier(PREVIOUS_COLUMN)))
+        cur.execute(
+            "UPDATE embedding_migrations SET status = 'done', updated_at = now() WHERE table_name = %s;",
+            (table,),
+        )
+    conn.commit()
+
+
+def migrate(conn, table: str, model: str, dimensions: int):
+    """
+    Steps 1-4; safe to re-run after an interruption.
+    """
+    start = time.time()
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('embedding_config') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            raise RuntimeError("embedding_config table missing; run Schema.sql first")
+    conn.commit()
+
+    migration = get_migration(conn, table)
+    current = embedding_model(conn, table) or (OPENAI_MODEL, None)
+    if current[0] == model and current[1] in (None, dimensions) and (not migration or migration[4] == "done"):
+        print(f"{table} already uses {model}")
+        return
+
+    if migration and migration[4] == "switched":
+        print(f"{table} already switched to {migration[0]}; run finalize to drop the old column")
+        return
+
+    check_migratable(conn, table, model, dimensions)
+    prepare(conn, table, model, dimensions)
+    rows = backfill(conn, table, model, dimensions)
+    rows += backfill(conn, table, model, dimensions, catch_up=True)
+    build_shadow_indexes(conn, table)
+    cutover(conn, table, model, dimensions)
+    print(f"Migrated {table} ({rows} rows re-embedded this run) in {time.time() - start:.1f}s")
+
+
+def main():
+    usage = "Usage: python Database_Code/reembed.py run <table> <model> [dimensions] | status <table> | finalize <table>"
+    if len(sys.argv) < 3 or sys.argv[1] not in ("run", "status", "finalize"):
+        print(usage)
+        sys.exit(1)
+
+    command, table = sys.argv[1], sys.argv[2]
+    # a corpus name from Database_Code/corpora.py or a table name
+    table = CORPORA[table]["table"] if table in CORPORA else table
+    conn = connection()
+    try:
+        if command == "run":
+            if len(sys.argv) < 4:
+                print(usage)
+                sys.exit(1)
+            dimensions = int(sys.argv[4]) if len(sys.argv) > 4 else DEFAULT_DIMENSIONS
+            migrate(conn, table, sys.argv[3], dimensions)
+        elif command == "status":
+            migration = get_migration(conn, table)
+            if not migration:
+                print(f"No migration recorded for {table}")
+            else:
+                model, dimensions, last_id, rows_done, status = migration
+                print(f"{table}: {status}, {model} ({dimensions} dims), {rows_done} rows done, last id {last_id}")
+        else:
+            finalize(conn, table)
+            print(f"Dropped {PREVIOUS_COLUMN} from {table}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from Database_Code.copy_binary import (
+    copy_rows, decode_vector, encode_jsonb, encode_text, encode_text_array, encode_vector,
+)
+from Database_Code.db import SCHEMA_VERSION, connection, run_schema
+from Database_Code import embeddings
+
+# -----------------------------
+# Pre-embedded corpus snapshots
+# -----------------------------
+# A snapshot directory holds:
+#   manifest.json   - snapshot/schema version, embedding model, shape, checksums
+#   corpus.parquet  - every non-vector column
+#   embeddings.bin  - row-major float32 (or float16) matrix, one row per parquet row
+#
+# Usage:
+#   python Database_Code/snapshot.py export <dir> [float32|float16]
+#   python Database_Code/snapshot.py import <dir> [expected embedding model]
+
+SNAPSHOT_VERSION = 1
+
+MANIFEST_FILE = "manifest.json"
+CORPUS_FILE = "corpus.parquet"
+EMBEDDINGS_FILE = "embeddings.bin"
+
+TEXT_COLUMNS = [
+    "instance_id", "repo", "base_commit", "version", "environment_setup_commit",
+    "problem_statement", "hint", "patch", "test_patch", "created_at",
+]
+JSON_COLUMNS = ["fail_to_pass", "pass_to_pass"]
+ARRAY_COLUMNS = ["error_types", "ps_tokens", "touched_files"]
+ROW_COLUMNS = TEXT_COLUMNS + JSON_COLUMNS + ARRAY_COLUMNS
+
+BATCH_SIZE = 1000
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def export_snapshot(conn, out_dir: str, dtype: str = "float32") -> dict:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if dtype not in ("float32", "float16"):
+        raise ValueError(f"dtype must be float32 or float16, not {dtype}")
+
+    os.makedirs(out_dir, exist_ok=True)
+    corpus_path = os.path.join(out_dir, CORPUS_FILE)
+    emb_path = os.path.join(out_dir, EMBEDDINGS_FILE)
+
+    schema = pa.schema(
+        [(c, pa.string()) for c in TEXT_COLUMNS + JSON_COLUMNS]
+        + [(c, pa.list_(pa.string())) for c in ARRAY_COLUMNS]
+    )
+
+    rows = 0
+    dim = None
+    writer = pq.ParquetWriter(corpus_path, schema, compression="zstd")
+
+    # named (server-side) cursor so the table is streamed, not fetched at once;
+    # vector_send() returns the binary vector representation, so embeddings are
+    # never printed as text by Postgres nor parsed back here
+    with conn.cursor(name="snapshot_export") as cur, open(emb_path, "wb") as emb_file:
+        cur.itersize = BATCH_SIZE
+        cur.execute(f"""
+            SELECT {', '.join(TEXT_COLUMNS)},
+                   {', '.join(f'{c}::text' for c in JSON_COLUMNS)},
+                   {', '.join(ARRAY_COLUMNS)},
+                   vector_send(embedding)
+            FROM swebench_data
+            WHERE embedding IS NOT NULL
+            ORDER BY id;
+        """)
+
+        while True:
+            batch = cur.fetchmany(BATCH_SIZE)
+            if not batch:
+                break
+
+            columns = list(zip(*batch))
+            writer.write_table(pa.table(
+                {name: list(columns[i]) for i, name in enumerate(ROW_COLUMNS)},
+                schema=schema,
+            ))
+
+            matrix = np.stack([decode_vector(e) for e in columns[-1]])
+            dim = matrix.shape[1]
+            emb_file.write(matrix.astype(dtype).tobytes())
+            rows += len(batch)
+
+    writer.close()
+
+    manifest = {
+        "snapshot_version": SNAPSHOT_VERSION,
+        "schema_version": SCHEMA_VERSION,
+        "embedding_model": embeddings.ACTIVE_MODEL,
+        "dimension": dim,
+        "dtype": dtype,
+        "rows": rows,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "files": {
+            CORPUS_FILE: file_sha256(corpus_path),
+            EMBEDDINGS_FILE: file_sha256(emb_path),
+        },
+    }
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def read_manifest(snapshot_dir: str, model: str | None = None) -> dict:
+    """
+    Load and verify manifest.json. model, if given, is the embedding model the
+    snapshot must have been built with; None accepts whichever it records
+    (import_snapshot makes that the table's model in embedding_config).
+    """
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    if manifest.get("snapshot_version") != SNAPSHOT_VERSION:
+        raise RuntimeError(f"Unsupported snapshot version {manifest.get('snapshot_version')}")
+    if manifest.get("schema_version") != SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Snapshot schema version {manifest.get('schema_version')} "
+            f"does not match Schema.sql version {SCHEMA_VERSION}"
+        )
+    if not manifest.get("embedding_model") or not manifest.get("dimension"):
+        raise RuntimeError("Snapshot manifest does not record its embedding model and dimension")
+    if model is not None and manifest["embedding_model"] != model:
+        raise RuntimeError(
+            f"Snapshot was embedded with {manifest['embedding_model']}, "
+            f"but {model} was expected"
+        )
+
+    for name, digest in manifest["files"].items():
+        if file_sha256(os.path.join(snapshot_dir, name)) != digest:
+            raise RuntimeError(f"Checksum mismatch for {name}")
+
+    return manifest
+
+
+def snapshot_rows(snapshot_dir: str, manifest: dict):
+    """
+    Yield rows in ROW_COLUMNS + [embedding] order, reading parquet batches and
+    the matching slice of the memory-mapped embedding blob.
+    """
+    import pyarrow.parquet as pq
+
+    embeddings = np.memmap(
+        os.path.join(snapshot_dir, EMBEDDINGS_FILE),
+        dtype=manifest["dtype"],
+        mode="r",
+        shape=(manifest["rows"], manifest["dimension"]),
+    )
+
+    offset = 0
+    for batch in pq.ParquetFile(os.path.join(snapshot_dir, CORPUS_FILE)).iter_batches(BATCH_SIZE):
+        columns = [batch.column(c).to_pylist() for c in ROW_COLUMNS]
+        for i, values in enumerate(zip(*columns)):
+            yield (*values, embeddings[offset + i])
+        offset += batch.num_rows
+
+
+def import_snapshot(conn, snapshot_dir: str, model: str | None = None) -> int:
+    """
+    Recreate swebench_data from a snapshot: binary COPY into the empty table with
+    its secondary indexes dropped, then rebuild those indexes once at the end.
+    The snapshot's embedding model and dimension (e.g. after a
+    Database_Code/reembed.py migration) become the table's, recorded in
+    embedding_config so queries are embedded to match.
+    """
+    from Database_Code.ingest_data import backfill_patch_symbols, create_facet_indexes
+
+    manifest = read_manifest(snapshot_dir, model)
+    run_schema(conn)
+
+    with conn.cursor() as cur:
+        # every index that does not back a constraint (pkey / unique instance_id)
+        cur.execute("""
+            SELECT i.indexname, i.indexdef
+            FROM pg_indexes i
+            WHERE i.tablename = 'swebench_data'
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname);
+        """)
+        indexes = cur.fetchall()
+        for name, _ in indexes:
+            cur.execute(f'DROP INDEX IF EXISTS "{name}";')
+        # Schema.sql creates vector(1536); the table is empty, so this is instant
+        cur.execute(f"ALTER TABLE swebench_data ALTER COLUMN embedding TYPE vector({int(manifest['dimension'])});")
+
+        encoders = (
+            [encode_text] * len(TEXT_COLUMNS)
+            + [encode_jsonb] * len(JSON_COLUMNS)
+            + [encode_text_array] * len(ARRAY_COLUMNS)
+            + [encode_vector]
+        )
+        copy_rows(cur, "swebench_data", ROW_COLUMNS + ["embedding"], encoders,
+                  snapshot_rows(snapshot_dir, manifest))
+
+        for _, indexdef in indexes:
+            cur.execute(indexdef)
+        cur.execute("ANALYZE swebench_data;")
+
+        cur.execute("""
+            INSERT INTO embedding_config (table_name, model, dimensions)
+            VALUES ('swebench_data', %s, %s)
+            ON CONFLICT (table_name) DO UPDATE
+            SET model = EXCLUDED.model, dimensions = EXCLUDED.dimensions, switched_at = now();
+        """, (manifest["embedding_model"], manifest["dimension"]))
+
+    conn.commit()
+    embeddings.use_model(manifest["embedding_model"], manifest["dimension"])
+    create_facet_indexes(conn)
+    # derived from the patches, so rebuilt rather than shipped in the snapshot
+    backfill_patch_symbols(conn)
+    return manifest["rows"]
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in ("export", "import"):
+        print("Usage: python Database_Code/snapshot.py export <dir> [float32|float16] | import <dir> [model]")
+        sys.exit(1)
+
+    command, snapshot_dir = sys.argv[1], sys.argv[2]
+    conn = connection()
+    start = time.time()
+    try:
+        if command == "export":
+            dtype = sys.argv[3] if len(sys.argv) > 3 else "float32"
+            manifest = export_snapshot(conn, snapshot_dir, dtype)
+            print(f"Exported {manifest['rows']} rows to {snapshot_dir}")
+        else:
+            rows = import_snapshot(conn, snapshot_dir, sys.argv[3] if len(sys.argv) > 3 else None)
+            print(f"Imported {rows} rows from {snapshot_dir}")
+    finally:
+        conn.close()
+
+    print(f"Done in {time.time() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
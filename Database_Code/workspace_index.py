@@ -0,0 +1,366 @@
+from __future__ import annotations
+import ast
+import hashlib
+import os
+import sys
+import time
+from collections import Counter
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from psycopg2 import sql
+
+from Database_Code import embeddings
+from Database_Code.corpora import create_corpus_table, get_corpus
+
+# -----------------------------
+# Workspace index
+# -----------------------------
+# Makes the developer's own project searchable next to SWE-bench: every .py
+# file under a workspace root is split into function / method / class chunks
+# (plus one chunk for the module-level code) and embedded into the "workspace"
+# corpus table, so retrieval picks it up through ASSISTANT_CORPORA like any
+# other corpus (LLM_Code/federated.py).
+#
+# Updates are incremental at two levels:
+#   - files whose size and mtime are unchanged are not even read, and files
+#     whose content hash is unchanged are not chunked;
+#   - inside a changed file only chunks whose text hash changed are
+#     re-embedded; chunks that merely moved get their line numbers updated.
+# So an edit costs one embedding per edited function, whatever the repo size.
+#
+# Usage:
+#   python Database_Code/workspace_index.py index <root>
+#   python Database_Code/workspace_index.py update <root> <file> [<file> ...]
+#   python Database_Code/workspace_index.py forget <root>
+#
+# update is what the extension runs on save; it does nothing for roots that
+# were never indexed, so indexing a project is opt-in.
+
+CORPUS = "workspace"
+
+WORKSPACE_EXTENSIONS = (".py",)
+SKIP_DIRS = {
+    ".git", ".hg", ".venv", "venv", "env", "__pycache__", "node_modules",
+    "site-packages", ".tox", ".nox", ".mypy_cache", ".pytest_cache", "build", "dist",
+}
+
+# Files bigger than this are generated or vendored, not the user's code.
+MAX_FILE_BYTES = 512 * 1024
+
+# Files that do not parse are cut into windows of this many lines.
+FALLBACK_CHUNK_LINES = 60
+
+WORKSPACE_SCHEMA = """
+    ALTER TABLE {table}
+        ADD COLUMN IF NOT EXISTS path TEXT,
+        ADD COLUMN IF NOT EXISTS start_line INT,
+        ADD COLUMN IF NOT EXISTS end_line INT,
+        ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+    CREATE INDEX IF NOT EXISTS {path_idx} ON {table} (repo, path);
+
+    CREATE TABLE IF NOT EXISTS workspace_files(
+        root TEXT NOT NULL,
+        path TEXT NOT NULL,
+        size BIGINT NOT NULL,
+        mtime DOUBLE PRECISION NOT NULL,
+        file_hash TEXT NOT NULL,
+        indexed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (root, path)
+    );
+"""
+
+
+def workspace_table() -> str:
+    return get_corpus(CORPUS)["table"]
+
+
+def create_workspace_tables(conn):
+    create_corpus_table(conn, CORPUS)
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL(WORKSPACE_SCHEMA).format(
+            table=sql.Identifier(workspace_table()),
+            path_idx=sql.Identifier(f"{workspace_table()}_path_idx"),
+        ))
+    conn.commit()
+
+
+# -----------------------------
+# Chunking
+# -----------------------------
+
+def chunk_source(code: str) -> list[dict]:
+    """
+    {"name", "kind", "start", "end"} for every top-level function, every
+    method (or the whole class if it has none), and one "<module>" chunk with
+    the remaining module-level lines (imports, constants, script code).
+    Names are qualified ("Class.method") so they stay stable when code moves.
+    """
+    lines = code.splitlines()
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return [
+            {"name": f"<lines {start}>", "kind": "lines", "start": start,
+             "end": min(len(lines), start + FALLBACK_CHUNK_LINES - 1)}
+            for start in range(1, len(lines) + 1, FALLBACK_CHUNK_LINES)
+        ]
+
+    def start_of(node) -> int:
+        return min([node.lineno] + [d.lineno for d in node.decorator_list])
+
+    chunks = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            chunks.append({"name": node.name, "kind": "function", "start": start_of(node), "end": node.end_lineno})
+        elif isinstance(node, ast.ClassDef):
+            methods = [n for n in node.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+            # with methods, the class line and class attributes go with the module chunk
+            for m in methods:
+                chunks.append({"name": f"{node.name}.{m.name}", "kind": "method",
+                               "start": start_of(m), "end": m.end_lineno})
+            if not methods:
+                chunks.append({"name": node.name, "kind": "class", "start": start_of(node), "end": node.end_lineno})
+
+    covered = {n for c in chunks for n in range(c["start"], c["end"] + 1)}
+
+    module_lines = [i for i in range(1, len(lines) + 1) if i not in covered and lines[i - 1].strip()]
+    if module_lines:
+        chunks.append({"name": "<module>", "kind": "module", "start": module_lines[0],
+                       "end": module_lines[-1], "lines": module_lines})
+    return chunks
+
+
+def chunk_text(lines: list[str], chunk: dict) -> str:
+    numbers = chunk.get("lines") or range(chunk["start"], chunk["end"] + 1)
+    return "\n".join(lines[n - 1] for n in numbers)
+
+
+def content_hash(text: str) -> str:
+    # a different embedding model invalidates every stored vector
+    return hashlib.sha256(f"{embeddings.ACTIVE_MODEL}\n{text}".encode("utf-8")).hexdigest()
+
+
+def file_chunks(root: str, path: str, code: str) -> list[dict]:
+    """
+    Chunks of one file as table rows (without embeddings).
+    """
+    lines = code.splitlines()
+    full_path = os.path.join(root, path).replace(os.sep, "/")
+    rows = []
+    seen = Counter()
+    for chunk in chunk_source(code):
+        source = chunk_text(lines, chunk)
+        if not source.strip():
+            continue
+        # embedded text leaves out line numbers, so code that only moved keeps its vector
+        label = f"File {path.replace(os.sep, '/')}: {chunk['kind']} {chunk['name']}"
+        text = f"{label}\n{source}"
+        # same-named definitions (a property getter and its setter, redefined
+        # functions) get #2, #3, ... in file order so their ids stay distinct
+        seen[chunk["name"]] += 1
+        occurrence = f"#{seen[chunk['name']]}" if seen[chunk["name"]] > 1 else ""
+        rows.append({
+            "instance_id": f"{full_path}::{chunk['name']}{occurrence}",
+            "path": path,
+            "start_line": chunk["start"],
+            "end_line": chunk["end"],
+            "problem_statement": f"{label} (lines {chunk['start']}-{chunk['end']})",
+            "patch": source,
+            "text": text,
+            "content_hash": content_hash(text),
+        })
+    return rows
+
+
+# -----------------------------
+# Files
+# -----------------------------
+
+def workspace_files(root: str) -> list[str]:
+    """
+    Paths (relative to root) of every indexable file.
+    """
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS and not d.startswith("."))
+        for name in sorted(filenames):
+            if name.endswith(WORKSPACE_EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(dirpath, name), root))
+    return found
+
+
+def known_files(conn, root: str) -> dict[str, tuple]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT path, size, mtime, file_hash FROM workspace_files WHERE root = %s;", (root,))
+        return {path: (size, mtime, file_hash) for path, size, mtime, file_hash in cur.fetchall()}
+
+
+def is_indexed(conn, root: str) -> bool:
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('workspace_files') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            return False
+        cur.execute("SELECT 1 FROM workspace_files WHERE root = %s LIMIT 1;", (root,))
+        return cur.fetchone() is not None
+
+
+def remove_file(conn, root: str, path: str):
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("DELETE FROM {} WHERE repo = %s AND path = %s;").format(
+            sql.Identifier(workspace_table())), (root, path))
+        cur.execute("DELETE FROM workspace_files WHERE root = %s AND path = %s;", (root, path))
+
+
+# -----------------------------
+# Indexing
+# -----------------------------
+
+def index_workspace(conn, root: str, paths: list[str] | None = None) -> dict:
+    """
+    Bring the index of root up to date. With paths, only those files are
+    looked at (on-save updates); without, the whole tree is walked and files
+    that disappeared are dropped.
+    """
+    start = time.time()
+    root = os.path.abspath(root)
+    table = sql.Identifier(workspace_table())
+    known = known_files(conn, root)
+
+    if paths is None:
+        candidates = workspace_files(root)
+        for gone in set(known) - set(candidates):
+            remove_file(conn, root, gone)
+    else:
+        candidates = [os.path.relpath(os.path.abspath(p), root) for p in paths]
+        candidates = [p for p in candidates if not p.startswith("..") and p.endswith(WORKSPACE_EXTENSIONS)]
+
+    stats = {"files": len(candidates), "files_changed": 0, "chunks_embedded": 0,
+             "chunks_moved": 0, "chunks_removed": 0}
+    to_embed, file_updates = [], []
+
+    for path in candidates:
+        full = os.path.join(root, path)
+        if not os.path.isfile(full) or os.path.getsize(full) > MAX_FILE_BYTES:
+            if path in known:
+                remove_file(conn, root, path)
+            continue
+
+        st = os.stat(full)
+        previous = known.get(path)
+        if previous and previous[0] == st.st_size and previous[1] == st.st_mtime:
+            continue
+
+        with open(full, "rb") as f:
+            data = f.read()
+        file_hash = hashlib.sha256(data).hexdigest()
+        file_updates.append((root, path, st.st_size, st.st_mtime, file_hash))
+        if previous and previous[2] == file_hash:
+            continue  # touched, not changed
+        stats["files_changed"] += 1
+
+        rows = file_chunks(root, path, data.decode("utf-8", errors="replace"))
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("SELECT instance_id, content_hash FROM {} WHERE repo = %s AND path = %s;").format(table),
+                        (root, path))
+            stored = dict(cur.fetchall())
+
+            current = {r["instance_id"] for r in rows}
+            removed = [iid for iid in stored if iid not in current]
+            if removed:
+                cur.execute(sql.SQL("DELETE FROM {} WHERE instance_id = ANY(%s);").format(table), (removed,))
+                stats["chunks_removed"] += len(removed)
+
+            for row in rows:
+                if stored.get(row["instance_id"]) == row["content_hash"]:
+                    # same code, maybe new line numbers
+                    cur.execute(
+                        sql.SQL("UPDATE {} SET start_line = %s, end_line = %s, problem_statement = %s "
+                                "WHERE instance_id = %s;").format(table),
+                        (row["start_line"], row["end_line"], row["problem_statement"], row["instance_id"]),
+                    )
+                    stats["chunks_moved"] += 1
+                else:
+                    to_embed.append(row)
+
+    if to_embed:
+        vectors = embeddings.embed_texts([r["text"] for r in to_embed])
+        with conn.cursor() as cur:
+            for row, vec in zip(to_embed, vectors):
+                cur.execute(
+                    sql.SQL("""
+                    INSERT INTO {}
+                        (instance_id, repo, path, start_line, end_line, problem_statement, patch,
+                         content_hash, embedding)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (instance_id) DO UPDATE SET
+                        start_line = EXCLUDED.start_line, end_line = EXCLUDED.end_line,
+                        problem_statement = EXCLUDED.problem_statement, patch = EXCLUDED.patch,
+                        content_hash = EXCLUDED.content_hash, embedding = EXCLUDED.embedding;
+                    """).format(table),
+                    (row["instance_id"], root, row["path"], row["start_line"], row["end_line"],
+                     row["problem_statement"], row["patch"], row["content_hash"], vec),
+                )
+        stats["chunks_embedded"] = len(to_embed)
+
+    with conn.cursor() as cur:
+        for update in file_updates:
+            cur.execute(
+                """
+                INSERT INTO workspace_files (root, path, size, mtime, file_hash) VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (root, path) DO UPDATE SET
+                    size = EXCLUDED.size, mtime = EXCLUDED.mtime, file_hash = EXCLUDED.file_hash, indexed_at = now();
+                """,
+                update,
+            )
+    conn.commit()
+
+    stats["seconds"] = round(time.time() - start, 3)
+    return stats
+
+
+def forget_workspace(conn, root: str):
+    root = os.path.abspath(root)
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("DELETE FROM {} WHERE repo = %s;").format(sql.Identifier(workspace_table())), (root,))
+        cur.execute("DELETE FROM workspace_files WHERE root = %s;", (root,))
+    conn.commit()
+
+
+def main():
+    from Database_Code.db import connection
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ("index", "update", "forget"):
+        print("Usage: python Database_Code/workspace_index.py index <root> | update <root> <file>... | forget <root>")
+        sys.exit(1)
+
+    command, root = sys.argv[1], os.path.abspath(sys.argv[2])
+    conn = connection()
+    try:
+        if command == "forget":
+            forget_workspace(conn, root)
+            print(f"Removed {root} from the workspace index")
+            return
+
+        if command == "update":
+            if not is_indexed(conn, root):
+                return  # never indexed: on-save updates are opt-in
+            stats = index_workspace(conn, root, sys.argv[3:])
+        else:
+            create_workspace_tables(conn)
+            stats = index_workspace(conn, root)
+
+        print(
+            f"Workspace {root}: {stats['files_changed']}/{stats['files']} files changed, "
+            f"{stats['chunks_embedded']} chunks embedded, {stats['chunks_moved']} moved, "
+            f"{stats['chunks_removed']} removed in {stats['seconds']:.2f}s"
+        )
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
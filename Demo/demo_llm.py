@@ -100,8 +100,7 @@ def retrieve_topk(conn, code: str, error: str, query: str, k: int = 3) -> List[R
         if not q or not q.strip():
             continue
 
-        q_emb = embed_text(q)
-        q_vec = "[" + ",".join(map(str, q_emb)) + "]"
+        q_vec = embed_text(q)
 
         with conn.cursor() as cur:
             query_start = time.time()
@@ -10,7 +10,7 @@ PROJECT_ROOT = Path(__file__).resolve().parent.parent
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.append(str(PROJECT_ROOT))
 
-from Database_Code.ingest_data import connection
+from Database_Code.db import connection
 from LLM_Code.llm import rag_answer
 
 
@@ -0,0 +1,325 @@
+from __future__ import annotations
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from Database_Code.embeddings import embed_texts
+from LLM_Code.code_context import PROMPT_CONTEXT_TOKENS, RETRIEVAL_CONTEXT_TOKENS, extract_context
+from LLM_Code.llm import build_answer_prompt, call_llm
+from LLM_Code.model_router import route
+from LLM_Code.quick_answers import FRAME_RE, parse_error, quick_answer
+
+# -----------------------------
+# Batch triage
+# -----------------------------
+# Answers a whole CI run at once instead of one process per failure:
+#   1. parse every failure out of a directory of logs or a JSONL of cases
+#   2. group failures by a normalised error signature
+#   3. embed one query per group in batched requests, and search them all in
+#      a single SQL statement
+#   4. answer each group once (quick answer if a local rule applies, else the
+#      LLM) and write the group's answer for every failure in it
+#
+# Usage:
+#   python LLM_Code/batch_triage.py <logs_dir | cases.jsonl> <results.jsonl>
+#
+# JSONL cases: {"id", "error", "code" or "code_path", "line_nums"} (only error is required).
+
+LOG_EXTENSIONS = (".log", ".txt", ".out")
+
+# Parallel LLM calls, one per distinct group.
+BATCH_WORKERS = int(os.getenv("BATCH_TRIAGE_WORKERS", "4"))
+
+TRACEBACK_START = "Traceback (most recent call last):"
+# CI runners prefix lines with timestamps, e.g. "2025-03-01T10:00:00.1234567Z "
+CI_PREFIX_RE = re.compile(r"^\d{4}-\d\d-\d\dT[\d:.]+Z?\s")
+# pytest's short test summary, e.g. "FAILED tests/test_a.py::test_b - KeyError: 'x'"
+PYTEST_FAILED_RE = re.compile(r"^(?:FAILED|ERROR) (\S+) - (.+)$")
+
+# Parts of an error message that change between otherwise identical failures.
+NORMALIZE_RULES = [
+    (re.compile(r"0x[0-9a-fA-F]+"), "<addr>"),
+    (re.compile(r"(['\"]).*?\1"), "<str>"),
+    (re.compile(r"(?:[A-Za-z]:)?[\\/][\w.\\/-]+"), "<path>"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "<num>"),
+]
+
+BATCH_SEARCH_SQL = """
+    SELECT q.idx, r.instance_id, r.repo, r.problem_statement, r.patch, r.distance
+    FROM unnest(%s::vector[]) WITH ORDINALITY AS q(vec, idx)
+    CROSS JOIN LATERAL (
+        SELECT instance_id, repo, problem_statement, patch, embedding <=> q.vec AS distance
+        FROM swebench_data
+        WHERE embedding IS NOT NULL
+        ORDER BY embedding <=> q.vec
+        LIMIT %s
+    ) r
+    ORDER BY q.idx, r.distance;
+"""
+
+
+# -----------------------------
+# Parsing
+# -----------------------------
+
+def parse_log(text: str) -> list[str]:
+    """
+    Every Python traceback in a log. Logs without tracebacks fall back to
+    pytest's FAILED/ERROR summary lines.
+    """
+    lines = [CI_PREFIX_RE.sub("", l.rstrip("\n")) for l in text.splitlines()]
+    errors = []
+
+    i = 0
+    while i < len(lines):
+        if lines[i].strip() != TRACEBACK_START:
+            i += 1
+            continue
+        block = [lines[i].strip()]
+        i += 1
+        # frames and their source lines are indented; the exception line is not
+        while i < len(lines) and (lines[i].startswith((" ", "\t")) or not lines[i].strip()):
+            if lines[i].strip():
+                block.append(lines[i])
+            i += 1
+        if i < len(lines):
+            block.append(lines[i].strip())
+            i += 1
+        errors.append("\n".join(block))
+
+    if not errors:
+        for line in lines:
+            m = PYTEST_FAILED_RE.match(line.strip())
+            if m:
+                errors.append(f"{m.group(1)}\n{m.group(2)}")
+    return errors
+
+
+def read_frame_file(error: str) -> str:
+    """
+    Source of the deepest frame's file if it exists locally (CI logs carry
+    no code); "" otherwise.
+    """
+    for m in reversed([FRAME_RE.match(l) for l in error.splitlines()]):
+        if m and os.path.isfile(m.group(1)) and "site-packages" not in m.group(1):
+            with open(m.group(1), "r", encoding="utf-8", errors="replace") as f:
+                return f.read()
+    return ""
+
+
+def load_failures(source: str) -> list[dict]:
+    """
+    Failures as {"id", "source", "code", "error", "line_nums"}.
+    """
+    failures = []
+
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if not name.endswith(LOG_EXTENSIONS):
+                    continue
+                path = os.path.join(root, name)
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    errors = parse_log(f.read())
+                for n, error in enumerate(errors):
+                    failures.append({
+                        "id": f"{os.path.relpath(path, source)}#{n + 1}",
+                        "source": path,
+                        "code": read_frame_file(error),
+                        "error": error,
+                        "line_nums": "",
+                    })
+        return failures
+
+    with open(source, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f):
+            if not line.strip():
+                continue
+            case = json.loads(line)
+            code = case.get("code")
+            if code is None and case.get("code_path"):
+                with open(case["code_path"], "r", encoding="utf-8", errors="replace") as cf:
+                    code = cf.read()
+            failures.append({
+                "id": str(case.get("id", n + 1)),
+                "source": source,
+                "code": code or "",
+                "error": case["error"],
+                "line_nums": str(case.get("line_nums", "")),
+            })
+    return failures
+
+
+# -----------------------------
+# Grouping
+# -----------------------------
+
+def normalize_message(message: str) -> str:
+    for pattern, placeholder in NORMALIZE_RULES:
+        message = pattern.sub(placeholder, message)
+    return message.strip()
+
+
+def error_signature(error: str) -> str:
+    """
+    Exception type + normalised message + the deepest frame's file name and
+    function, so the same bug hit by many tests gets one signature.
+    """
+    error_type, message = parse_error(error)
+    where = ""
+    frames = [l for l in error.splitlines() if FRAME_RE.match(l)]
+    if frames:
+        m = re.search(r'File "(.+?)", line \d+(?:, in (\S+))?', frames[-1])
+        where = f"{os.path.basename(m.group(1))}:{m.group(2) or ''}"
+    return f"{error_type or 'UnknownError'}|{normalize_message(message)}|{where}"
+
+
+def group_failures(failures: list[dict]) -> dict[str, list[dict]]:
+    groups = {}
+    for failure in failures:
+        groups.setdefault(error_signature(failure["error"]), []).append(failure)
+    return groups
+
+
+# -----------------------------
+# Retrieval + answers
+# -----------------------------
+
+def group_query(failure: dict) -> str:
+    context = extract_context(failure["code"], failure["error"], failure["line_nums"], RETRIEVAL_CONTEXT_TOKENS)
+    return f"Python error: {failure['error']}\n\n{context}".strip()
+
+
+def batch_search(conn, vectors, k: int = 5) -> list[list[tuple]]:
+    """
+    Nearest rows for every query vector in one statement.
+    Returns one list of (instance_id, repo, problem_statement, patch, distance) per vector.
+    """
+    results = [[] for _ in range(len(vectors))]
+    if not len(vectors):
+        return results
+    with conn.cursor() as cur:
+        cur.execute(BATCH_SEARCH_SQL, (list(vectors), k))
+        for idx, *row in cur.fetchall():
+            results[idx - 1].append(tuple(row))
+    conn.commit()
+    return results
+
+
+def answer_group(failure: dict, rows: list[tuple]) -> dict:
+    code, error, line_nums = failure["code"], failure["error"], failure["line_nums"]
+
+    quick = quick_answer(code, error, line_nums) if code else None
+    if quick:
+        return {"answer": quick, "path": "quick", "model": None}
+
+    question = (
+        f"The following Python code has an error:\n\n"
+        f"{extract_context(code, error, line_nums, PROMPT_CONTEXT_TOKENS)}\n\n"
+        f"Error:\n{error}\n\n"
+        f"Please explain the error and suggest a fix."
+    )
+    choice = route("answer", code, error, best_distance=min((r[4] for r in rows), default=None))
+    try:
+        answer = call_llm(
+            build_answer_prompt([r[:4] for r in rows], question),
+            choice["model"], max_output_tokens=choice["max_output_tokens"], route=choice,
+        )
+    except Exception as e:
+        answer = f"No answer: {e}"
+    return {"answer": answer, "path": "llm", "model": choice["model"]}
+
+
+def triage(conn, failures: list[dict], k: int = 5, workers: int = BATCH_WORKERS) -> tuple[list[dict], dict]:
+    """
+    Answer every failure, paying for retrieval and the LLM once per distinct
+    error signature. Returns (per-failure results, stats).
+    """
+    timings = {}
+    start = time.time()
+
+    groups = group_failures(failures)
+    signatures = list(groups)
+    representatives = [groups[s][0] for s in signatures]
+    timings["group_sec"] = time.time() - start
+
+    stage = time.time()
+    vectors = embed_texts([group_query(f) for f in representatives])
+    timings["embed_sec"] = time.time() - stage
+
+    stage = time.time()
+    retrieved = batch_search(conn, vectors, k=k)
+    timings["search_sec"] = time.time() - stage
+
+    stage = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        answers = list(pool.map(answer_group, representatives, retrieved))
+    timings["answer_sec"] = time.time() - stage
+
+    results = []
+    for n, signature in enumerate(signatures):
+        for failure in groups[signature]:
+            results.append({
+                "id": failure["id"],
+                "source": failure["source"],
+                "signature": signature,
+                "group": n + 1,
+                "group_size": len(groups[signature]),
+                "representative": failure is representatives[n],
+                "retrieved": [{"instance_id": r[0], "repo": r[1], "distance": r[4]} for r in retrieved[n]],
+                **answers[n],
+            })
+
+    total = time.time() - start
+    stats = {
+        "failures": len(failures),
+        "groups": len(groups),
+        "llm_calls": sum(1 for a in answers if a["path"] == "llm"),
+        "total_sec": round(total, 3),
+        "failures_per_sec": round(len(failures) / total, 3) if total > 0 else None,
+        **{key: round(value, 3) for key, value in timings.items()},
+    }
+    return results, stats
+
+
+def main():
+    from Database_Code.db import connection
+
+    if len(sys.argv) < 3:
+        print("Usage: python LLM_Code/batch_triage.py <logs_dir | cases.jsonl> <results.jsonl>")
+        sys.exit(1)
+
+    source, out_path = sys.argv[1], sys.argv[2]
+    failures = load_failures(source)
+    if not failures:
+        print(f"No failures found in {source}")
+        return
+    print(f"Parsed {len(failures)} failures from {source}")
+
+    conn = connection()
+    try:
+        results, stats = triage(conn, failures)
+    finally:
+        conn.close()
+
+    with open(out_path, "w", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    print(f"Saved {len(results)} results to {out_path}")
+    print(
+        f"{stats['failures']} failures in {stats['groups']} groups, {stats['llm_calls']} LLM calls, "
+        f"{stats['total_sec']:.2f}s total ({stats['failures_per_sec']} failures/s; "
+        f"embed {stats['embed_sec']:.2f}s, search {stats['search_sec']:.2f}s, answer {stats['answer_sec']:.2f}s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+from __future__ import annotations
+import json
+import os
+import sys
+import threading
+import time
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from LLM_Code.deadline import Cancelled, Deadline
+
+# -----------------------------
+# Request cancellation
+# -----------------------------
+# A run of a file supersedes the assistant request still answering an earlier
+# run of the same file: LLM_Code/runner.py cancels it in-process, and for the
+# one-shot Main.py path the extension writes CANCEL_COMMAND to its stdin.
+# Either way the request's Deadline is cancelled (LLM_Code/deadline.py), which
+# stops further embedding calls, cancels the running Postgres query and closes
+# the open LLM connections. Every cancelled request is logged here with the
+# stage it reached and the work it aborted:
+#
+#   python LLM_Code/cancellation.py stats
+
+CANCEL_COMMAND = "cancel"
+
+LOG_PATH = os.getenv("CANCEL_LOG", os.path.join(os.path.dirname(__file__), "cancel_log.jsonl"))
+
+
+def watch_stdin(deadline: Deadline, reason: str = "cancelled by the extension") -> threading.Thread:
+    """
+    Cancel deadline when a CANCEL_COMMAND line arrives on stdin. EOF does not
+    cancel: stdin may just be closed or /dev/null.
+    """
+    def watch():
+        try:
+            for line in sys.stdin:
+                if line.strip() == CANCEL_COMMAND:
+                    print(f"Cancelling: {reason}")
+                    deadline.cancel(reason)
+                    return
+        except (OSError, ValueError):
+            pass
+
+    thread = threading.Thread(target=watch, name="cancel-watch", daemon=True)
+    thread.start()
+    return thread
+
+
+def log_cancelled(request_id: str, source: str, error: Cancelled, deadline: Deadline):
+    record = {
+        "timestamp": time.time(),
+        "request_id": request_id,
+        "source": source,
+        "stage": error.stage,
+        "reason": error.reason,
+        "elapsed_sec": round(deadline.elapsed(), 4),
+        # budget left when it stopped: the upper bound of the time it would have kept running
+        "remaining_sec": round(deadline.remaining(), 4),
+        "aborted": deadline.aborted,
+    }
+    print(f"Request {request_id} cancelled during {error.stage} after {deadline.elapsed():.2f}s")
+    try:
+        with open(LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"Could not write cancel log: {e}")
+
+
+def cancel_stats() -> dict:
+    """
+    Cancelled requests by stage, with the time they had run, the budget
+    they still had, and how many LLM calls / database queries were cut off.
+    """
+    records = []
+    try:
+        with open(LOG_PATH, "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        pass
+
+    by_stage = {}
+    for r in records:
+        by_stage[r["stage"]] = by_stage.get(r["stage"], 0) + 1
+
+    return {
+        "cancelled": len(records),
+        "by_stage": by_stage,
+        "elapsed_sec_total": round(sum(r["elapsed_sec"] for r in records), 2),
+        "remaining_sec_total": round(sum(r["remaining_sec"] for r in records), 2),
+        "llm_calls_aborted": sum(r["aborted"].count("llm") for r in records),
+        "queries_cancelled": sum(r["aborted"].count("database") for r in records),
+    }
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "stats":
+        print(json.dumps(cancel_stats(), indent=2))
+        return
+
+    print("Usage: python LLM_Code/cancellation.py stats")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
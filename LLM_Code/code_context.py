@@ -0,0 +1,244 @@
+from __future__ import annotations
+import ast
+import re
+from functools import lru_cache
+
+from Database_Code.embeddings import get_encoder
+from LLM_Code.quick_answers import FRAME_RE
+
+# -----------------------------
+# Error-location-aware code context
+# -----------------------------
+# Instead of the top of the file, retrieval and prompts get the code around the
+# failing lines: the enclosing function/class of every error line, then the
+# imports and module-level definitions that code refers to, in that priority,
+# until the token budget is used up. Chunks are emitted in file order with
+# their line numbers so "Error on lines: N" still makes sense to the model.
+
+# Budgets (tokens) for the different consumers.
+RETRIEVAL_CONTEXT_TOKENS = 150   # one embedded query
+EXPANSION_CONTEXT_TOKENS = 350   # LLM query expansion prompt
+PROMPT_CONTEXT_TOKENS = 2000     # answer prompt
+
+# Lines kept on each side of the error line when its block does not fit, or
+# when the file does not parse.
+WINDOW_LINES = 8
+
+# Frames in these files are library code, not the user's file.
+LIBRARY_PATH_RE = re.compile(r"site-packages|dist-packages|[\\/]lib[\\/]python\d|<frozen|<string>")
+
+DEF_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoder().encode(text))
+
+
+def target_lines(code: str, error: str, line_nums: str = "") -> list[int]:
+    """
+    Lines of the user's file that raised, deepest first: the extension's line
+    numbers if given, else the traceback frames that are not library code.
+    """
+    n_lines = len(code.splitlines())
+    nums = [int(n) for n in re.findall(r"\d+", line_nums or "")]
+    if not nums:
+        for m in map(FRAME_RE.match, (error or "").splitlines()):
+            if m and not LIBRARY_PATH_RE.search(m.group(1)):
+                nums.append(int(m.group(2)))
+    # the extension's line numbers and the traceback both list the outermost frame first
+    nums.reverse()
+    if not nums:
+        # SyntaxError output has no frames, only "line N"
+        nums = [int(n) for n in re.findall(r"\bline (\d+)", error or "")]
+    return [n for n in dict.fromkeys(nums) if 1 <= n <= n_lines]
+
+
+@lru_cache(maxsize=8)
+def parse_code(code: str) -> ast.Module:
+    # LLM_Code/prefetch.py asks for the context of every line of one file
+    return ast.parse(code)
+
+
+@lru_cache(maxsize=8)
+def walk_nodes(tree: ast.AST) -> list:
+    return list(ast.walk(tree))
+
+
+def enclosing_node(tree: ast.AST, line: int):
+    """
+    Innermost function, else class, else top-level statement containing line.
+    """
+    best = None
+    for node in walk_nodes(tree):
+        if isinstance(node, DEF_NODES) and node_start(node) <= line <= node.end_lineno:
+            if best is None or node_start(node) >= node_start(best):
+                best = node
+    if best is not None:
+        return best
+    for node in getattr(tree, "body", []):
+        if node_start(node) <= line <= node.end_lineno:
+            return node
+    return None
+
+
+def node_start(node) -> int:
+    # include decorators
+    return min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+
+
+def indent_block(lines: list[str], line: int) -> tuple[int, int]:
+    """
+    Tolerant fallback for files that do not parse: the nearest def/class above
+    line with less indentation, down to the next line indented at or below it.
+    """
+    def indent(s: str) -> int:
+        return len(s) - len(s.lstrip())
+
+    target = indent(lines[line - 1])
+    start = None
+    for i in range(line - 1, -1, -1):
+        stripped = lines[i].lstrip()
+        if stripped.startswith(("def ", "async def ", "class ")) and (indent(lines[i]) < target or i == line - 1):
+            start = i + 1
+            break
+    if start is None:
+        return max(1, line - WINDOW_LINES), min(len(lines), line + WINDOW_LINES)
+
+    base = indent(lines[start - 1])
+    end = start
+    for i in range(start, len(lines)):
+        if lines[i].strip() and indent(lines[i]) <= base:
+            break
+        end = i + 1
+    return start, end
+
+
+def referenced_names(tree: ast.AST, start: int, end: int) -> list[str]:
+    names = []
+    for node in walk_nodes(tree):
+        if not start <= getattr(node, "lineno", 0) <= end:
+            continue
+        if isinstance(node, ast.Name):
+            names.append(node.id)
+        elif isinstance(node, ast.Attribute):
+            names.append(node.attr)
+    return list(dict.fromkeys(names))
+
+
+def module_definitions(tree: ast.Module) -> dict[str, tuple[int, int]]:
+    """
+    name -> (start, end) of the module-level statement (or method) defining it.
+    """
+    defs = {}
+    for node in tree.body:
+        span = (node_start(node), node.end_lineno)
+        if isinstance(node, DEF_NODES):
+            defs[node.name] = span
+            if isinstance(node, ast.ClassDef):
+                for item in node.body:
+                    if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                        defs.setdefault(item.name, (node_start(item), item.end_lineno))
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                defs[(alias.asname or alias.name).split(".")[0]] = span
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                for n in ast.walk(target):
+                    if isinstance(n, ast.Name):
+                        defs[n.id] = span
+    return defs
+
+
+def render(lines: list[str], spans: list[tuple[int, int]], marks: set[int]) -> str:
+    """
+    Merge overlapping spans and print them in file order with line numbers.
+    """
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    out = []
+    for start, end in merged:
+        out.append(f"# --- lines {start}-{end} ---")
+        for n in range(start, end + 1):
+            suffix = "  # <-- error" if n in marks else ""
+            out.append(f"{lines[n - 1]}{suffix}")
+    return "\n".join(out)
+
+
+def extract_context(code: str, error: str, line_nums: str = "", max_tokens: int = PROMPT_CONTEXT_TOKENS,
+                    mark_errors: bool = True) -> str:
+    """
+    The parts of code relevant to the error, within max_tokens. Files that fit
+    the budget are returned whole; without any usable error line the head of
+    the file is used, as before. mark_errors=False leaves out the
+    "# <-- error" markers.
+    """
+    code = code or ""
+    if not code.strip() or count_tokens(code) <= max_tokens:
+        return code
+
+    lines = code.splitlines()
+    targets = target_lines(code, error, line_nums)
+    if not targets:
+        return truncate_tokens(code, max_tokens)
+
+    try:
+        tree = parse_code(code)
+    except (SyntaxError, ValueError):
+        tree = None
+
+    # candidate spans, most important first
+    candidates = []
+    for line in targets:
+        node = enclosing_node(tree, line) if tree else None
+        candidates.append((node_start(node), node.end_lineno) if node else indent_block(lines, line))
+
+    if tree:
+        defs = module_definitions(tree)
+        for start, end in list(candidates):
+            for name in referenced_names(tree, start, end):
+                if name in defs:
+                    candidates.append(defs[name])
+
+    spans, marks = [], set(targets) if mark_errors else set()
+    for i, (start, end) in enumerate(candidates):
+        trial = render(lines, spans + [(start, end)], marks)
+        if count_tokens(trial) <= max_tokens:
+            spans.append((start, end))
+        elif i < len(targets):
+            # the error's own block is too big: keep a window around the line,
+            # plus the block's first line (the def/class signature)
+            line = targets[i]
+            window = [(start, start), (max(start, line - WINDOW_LINES), min(end, line + WINDOW_LINES))]
+            if count_tokens(render(lines, spans + window, marks)) <= max_tokens:
+                spans.extend(window)
+
+    if not spans:
+        line = targets[0]
+        spans = [(max(1, line - WINDOW_LINES), min(len(lines), line + WINDOW_LINES))]
+        return truncate_tokens(render(lines, spans, marks), max_tokens)
+
+    return render(lines, spans, marks)
+
+
+def retrieval_context(code: str, error: str, line_nums: str = "") -> str:
+    """
+    The code-side retrieval query: the context of the deepest error line only,
+    so a multi-frame traceback gives the same text as that one line and
+    LLM_Code/prefetch.py can cache it per line. Unmarked, so every line of a
+    function that fits the budget gives the same text too.
+    """
+    targets = target_lines(code, error, line_nums)
+    deepest = str(targets[0]) if targets else ""
+    return extract_context(code, "", deepest, RETRIEVAL_CONTEXT_TOKENS, mark_errors=False)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    enc = get_encoder()
+    tokens = enc.encode(text)
+    return text if len(tokens) <= max_tokens else enc.decode(tokens[:max_tokens])
@@ -0,0 +1,156 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from functools import lru_cache
+
+from LLM_Code.profiler import propagate
+
+# -----------------------------
+# Local cross-encoder reranker (optional)
+# -----------------------------
+# Scores (query, candidate) pairs with a small sentence-transformers
+# CrossEncoder on the CPU and reorders the vector-search candidates. All pairs
+# go through the model in one batched forward pass, with inputs cut to
+# CROSS_ENCODER_MAX_LENGTH tokens. Scoring runs on a worker thread under a hard
+# time budget: when the budget is exceeded (or the model is still loading, or
+# a previous call is still running) the candidates keep their vector order.
+#
+# Off by default; enable with CROSS_ENCODER=1. Only the warm runner
+# (LLM_Code/runner.py) uses it: it starts loading the model at startup via
+# warm_up(). A one-shot Main.py process would spend the whole budget importing
+# torch, so requests there skip the rerank (see preloaded()).
+
+CROSS_ENCODER_ENABLED = os.getenv("CROSS_ENCODER", "0") == "1"
+CROSS_ENCODER_MODEL = os.getenv("CROSS_ENCODER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+# Dynamic int8 quantization of the Linear layers: ~2-3x faster on CPU for a
+# small loss in ranking quality.
+CROSS_ENCODER_INT8 = os.getenv("CROSS_ENCODER_INT8", "0") == "1"
+
+CROSS_ENCODER_BUDGET_SEC = float(os.getenv("CROSS_ENCODER_BUDGET_SEC", "0.5"))
+
+# Candidates fetched from the vector search for the cross-encoder to reorder.
+CROSS_ENCODER_POOL = int(os.getenv("CROSS_ENCODER_POOL", "20"))
+
+# Tokens per (query, candidate) pair seen by the model.
+CROSS_ENCODER_MAX_LENGTH = 256
+
+# Characters kept from each side before tokenizing; the model never sees more
+# than MAX_LENGTH tokens anyway, so tokenizing whole patches is wasted time.
+QUERY_CHARS = 1000
+CANDIDATE_CHARS = 1500
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cross-encoder")
+# the load or scoring call in flight; read and replaced under _running_lock
+_running = None
+_running_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def load_cross_encoder(model_name: str = CROSS_ENCODER_MODEL, int8: bool = CROSS_ENCODER_INT8):
+    # sentence-transformers / torch are imported here, never at startup
+    import torch
+    from sentence_transformers import CrossEncoder
+
+    model = CrossEncoder(model_name, max_length=CROSS_ENCODER_MAX_LENGTH, device="cpu")
+    if int8:
+        model.model = torch.quantization.quantize_dynamic(model.model, {torch.nn.Linear}, dtype=torch.qint8)
+    model.model.eval()
+    return model
+
+
+def candidate_text(row) -> str:
+    """
+    (instance_id, repo, problem_statement, patch, ...) -> text for the model.
+    """
+    _, repo, problem_statement, patch = row[:4]
+    return f"{repo}\n{problem_statement or ''}\n{patch or ''}"[:CANDIDATE_CHARS]
+
+
+def score_pairs(query: str, texts: list[str], model_name: str = CROSS_ENCODER_MODEL,
+                int8: bool = CROSS_ENCODER_INT8) -> list[float]:
+    model = load_cross_encoder(model_name, int8)
+    pairs = [(query[:QUERY_CHARS], t) for t in texts]
+    # one batch: every pair in a single forward pass
+    return [float(s) for s in model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)]
+
+
+def rerank(
+    query: str,
+    rows: list,
+    k: int,
+    budget: float = CROSS_ENCODER_BUDGET_SEC,
+    model_name: str = CROSS_ENCODER_MODEL,
+    int8: bool = CROSS_ENCODER_INT8,
+) -> tuple[list, dict]:
+    """
+    Top-k rows by cross-encoder score, or the first k rows in their original
+    order if scoring does not finish within budget seconds.
+    Returns (rows, info) where info says which path was taken and how long it took.
+    """
+    global _running
+
+    start = time.time()
+    if len(rows) <= 1:
+        return rows[:k], {"used": False, "reason": "nothing to rerank", "latency_sec": 0.0}
+
+    with _running_lock:
+        busy = _running if _running is not None and not _running.done() else None
+    if busy is not None:
+        # model still loading (warm_up) or an earlier call still scoring
+        wait([busy], timeout=budget)
+
+    texts = [candidate_text(r) for r in rows]
+    with _running_lock:
+        if _running is not None and not _running.done():
+            latency = round(time.time() - start, 4)
+            return rows[:k], {"used": False, "reason": "model busy (loading or scoring)", "latency_sec": latency}
+        future = _running = _executor.submit(propagate(score_pairs), query, texts, model_name, int8)
+    try:
+        scores = future.result(timeout=max(0.0, budget - (time.time() - start)))
+    except FutureTimeout:
+        # the forward pass cannot be interrupted; it finishes in the background
+        # (warming the model for the next call) and its result is dropped
+        latency = time.time() - start
+        print(f"Cross-encoder over its {budget:.2f}s budget, keeping vector order")
+        return rows[:k], {"used": False, "reason": "budget exceeded", "latency_sec": round(latency, 4)}
+    except Exception as e:
+        print(f"Cross-encoder unavailable, keeping vector order: {e}")
+        return rows[:k], {"used": False, "reason": f"error: {e}", "latency_sec": round(time.time() - start, 4)}
+
+    order = sorted(range(len(rows)), key=lambda i: scores[i], reverse=True)
+    latency = time.time() - start
+    return [rows[i] for i in order[:k]], {"used": True, "reason": "ok", "latency_sec": round(latency, 4)}
+
+
+def warm_up():
+    """
+    Start loading the model in the background (runner startup), so the first
+    rerank does not pay for the import and load.
+    """
+    global _running
+
+    with _running_lock:
+        if _running is None:
+            _running = _executor.submit(load_cross_encoder)
+
+
+def in_flight() -> bool:
+    """
+    Whether the worker thread is still loading the model or scoring (the
+    runner does not fork then).
+    """
+    with _running_lock:
+        return _running is not None and not _running.done()
+
+
+def preloaded() -> bool:
+    """
+    Whether warm_up() was called in this process, i.e. reranking can fit its
+    budget; false in one-shot Main.py processes.
+    """
+    with _running_lock:
+        return _running is not None
@@ -0,0 +1,109 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+# Overall time budget for one assistant request, shared by every stage
+# (embedding, SQL, query expansion, answer generation).
+DEFAULT_DEADLINE_SEC = float(os.getenv("ASSISTANT_DEADLINE_SEC", "90"))
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, stage: str):
+        super().__init__(f"deadline exceeded during {stage}")
+        self.stage = stage
+
+
+class Cancelled(Exception):
+    """
+    The request was cancelled (e.g. superseded by a newer run of the same
+    file); unlike DeadlineExceeded nobody is waiting for a partial answer.
+    """
+
+    def __init__(self, stage: str, reason: str = ""):
+        super().__init__(f"cancelled during {stage}" + (f": {reason}" if reason else ""))
+        self.stage = stage
+        self.reason = reason
+
+
+class Deadline:
+    """
+    Absolute per-request deadline. Stages ask for the time left (optionally
+    capped to their own share) and pass it on as a timeout.
+
+    It doubles as the request's cancellation token: cancel() makes the next
+    check() raise Cancelled, resolves the `cancelled` future (so waits on
+    LLM futures wake up) and runs the callbacks in-flight work registered
+    with on_cancel() (closing an HTTP client, conn.cancel() for Postgres).
+    """
+
+    def __init__(self, seconds: float = DEFAULT_DEADLINE_SEC):
+        self.seconds = seconds
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + seconds
+        self.cancelled = Future()
+        self.cancel_reason = None
+        self.aborted = []  # labels of the in-flight work cancel() stopped
+        self._callbacks = {}
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def budget(self, max_seconds: float | None = None) -> float:
+        """
+        Time a stage may use: what is left, capped at max_seconds.
+        """
+        left = self.remaining()
+        return left if max_seconds is None else min(left, max_seconds)
+
+    def check(self, stage: str):
+        self.check_cancelled(stage)
+        if self.expired():
+            raise DeadlineExceeded(stage)
+
+    def check_cancelled(self, stage: str):
+        if self.cancelled.done():
+            raise Cancelled(stage, self.cancel_reason)
+
+    def on_cancel(self, label: str, callback):
+        """
+        Run callback if the request is cancelled while the work labelled
+        label is in flight. Returns a function that unregisters it; if the
+        request is already cancelled, callback runs right away.
+        """
+        key = object()
+        with self._lock:
+            if not self.cancelled.done():
+                self._callbacks[key] = (label, callback)
+                return lambda: self._callbacks.pop(key, None)
+        self._run_callback(label, callback)
+        return lambda: None
+
+    def cancel(self, reason: str = "") -> bool:
+        """
+        Cancel the request. Returns False if it already was.
+        """
+        with self._lock:
+            if self.cancelled.done():
+                return False
+            self.cancel_reason = reason
+            self.cancelled.set_result(reason)
+            callbacks, self._callbacks = list(self._callbacks.values()), {}
+        for label, callback in callbacks:
+            self._run_callback(label, callback)
+        return True
+
+    def _run_callback(self, label: str, callback):
+        self.aborted.append(label)
+        try:
+            callback()
+        except Exception as e:
+            print(f"Cancelling {label} failed: {e}")
@@ -0,0 +1,188 @@
+from __future__ import annotations
+import ast
+import difflib
+import os
+import re
+
+# -----------------------------
+# Diff-mode answers
+# -----------------------------
+# A "Corrected code" section makes the model write the whole file again, and
+# output tokens are the slowest part of an answer. In diff mode the model
+# writes only a unified diff against the code in the prompt, plus a short
+# explanation. The diff is applied here to the user's file (hunks are located
+# by their content, so line-number drift and the context headers of
+# code_context.render() do not matter) and the result must still parse. The
+# user gets the explanation, a clean diff and the corrected file; a diff that
+# does not apply falls back to one full-mode attempt (LLM_Code/llm.py).
+
+# "diff" or "full" (the original whole-file answer)
+ANSWER_MODE = os.getenv("ASSISTANT_ANSWER_MODE", "diff")
+
+DIFF_INSTRUCTIONS = """
+Answer in exactly this format, and do NOT rewrite the whole file:
+
+Explanation:
+<a few sentences: what causes the error and how the change fixes it>
+
+Fix:
+```diff
+--- a/code.py
++++ b/code.py
+@@ -<line>,<count> +<line>,<count> @@
+ <unchanged line>
+-<removed line>
++<added line>
+ <unchanged line>
+```
+
+The diff is applied to the user's code with a patch tool: copy context and
+removed lines exactly from the code above, with 2-3 unchanged lines around
+each change, and keep every hunk as small as possible.
+"""
+
+FULL_INSTRUCTIONS = "Provide an explanation of the issues, one best practice corrected code. "
+
+DIFF_BLOCK_RE = re.compile(r"```(?:diff|patch)?[ \t]*\n(.*?)```", re.DOTALL)
+HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@")
+
+# markers code_context.render() adds to the prompt's copy of the code
+ERROR_MARK_RE = re.compile(r"\s+# <-- error$")
+SPAN_HEADER_RE = re.compile(r"^# --- lines \d+-\d+ ---$")
+
+
+class DiffError(ValueError):
+    pass
+
+
+def split_answer(text: str) -> tuple[str, str]:
+    """
+    (explanation, diff) of a diff-mode reply. Raises DiffError when there is
+    no diff block.
+    """
+    for m in DIFF_BLOCK_RE.finditer(text or ""):
+        if re.search(r"(?m)^@@", m.group(1)):
+            explanation = re.sub(r"(?i)\bfix:\s*$", "", text[:m.start()].strip())
+            explanation = re.sub(r"(?i)^explanation:\s*", "", explanation.strip())
+            return explanation.strip(), m.group(1)
+    raise DiffError("no diff block in the answer")
+
+
+def clean_line(line: str) -> str:
+    return ERROR_MARK_RE.sub("", line).rstrip()
+
+
+def parse_hunks(diff: str) -> list[tuple[int, list[str], list[str]]]:
+    """
+    [(old start line, old lines, new lines)] of a unified diff.
+    """
+    hunks = []
+    blank_tail = 0  # empty context lines at the end of the current hunk so far
+    for line in diff.splitlines():
+        if line.startswith(("--- ", "+++ ", "diff ", "index ", "\\")):
+            continue
+        if line.startswith("@@"):
+            drop_blank_tail(hunks, blank_tail)
+            m = HUNK_HEADER_RE.match(line)
+            hunks.append((int(m.group(1)) if m else 0, [], []))
+            blank_tail = 0
+            continue
+        if not hunks:
+            continue
+        _, old, new = hunks[-1]
+        if line.startswith("-"):
+            old.append(clean_line(line[1:]))
+            blank_tail = 0
+        elif line.startswith("+"):
+            # models copy the error marker onto the line they rewrite too
+            new.append(clean_line(line[1:]))
+            blank_tail = 0
+        else:
+            # context; models often drop the leading space of blank lines
+            text = clean_line(line[1:] if line.startswith(" ") else line)
+            if SPAN_HEADER_RE.match(text.strip()):
+                continue
+            old.append(text)
+            new.append(text)
+            blank_tail = blank_tail + 1 if not line else 0
+    drop_blank_tail(hunks, blank_tail)
+
+    if not any(old != new for _, old, new in hunks):
+        raise DiffError("the diff changes nothing")
+    return hunks
+
+
+def drop_blank_tail(hunks: list, count: int):
+    """
+    Drop the empty context lines ending the last hunk: usually the blank line
+    before the closing fence, not part of the diff (and at the end of the file
+    it matches nothing).
+    """
+    if hunks and count:
+        _, old, new = hunks[-1]
+        del old[-count:], new[-count:]
+
+
+def find_hunk(lines: list[str], old: list[str], start: int, hint: int) -> int:
+    """
+    Index in lines (from start on) where old matches, ignoring trailing
+    whitespace; the match closest to hint wins.
+    """
+    stripped = [l.rstrip() for l in lines]
+    matches = [
+        i for i in range(start, len(lines) - len(old) + 1)
+        if stripped[i:i + len(old)] == old
+    ]
+    if not matches:
+        raise DiffError(f"hunk at line {hint + 1} does not match the code")
+    return min(matches, key=lambda i: abs(i - hint))
+
+
+def apply_diff(code: str, diff: str) -> str:
+    """
+    code with every hunk of diff applied, in order. Raises DiffError when a
+    hunk's context or removed lines are not in the code.
+    """
+    lines = code.splitlines()
+    out, pos = [], 0
+    for old_start, old, new in parse_hunks(diff):
+        hint = max(old_start - 1, pos)
+        if old:
+            at = find_hunk(lines, old, pos, hint)
+        else:
+            # "-N,0": a pure insertion goes after line N
+            at = min(max(old_start, pos), len(lines))
+        out += lines[pos:at] + new
+        pos = at + len(old)
+    out += lines[pos:]
+
+    patched = "\n".join(out)
+    return patched + "\n" if code.endswith("\n") else patched
+
+
+def check_parses(patched: str):
+    try:
+        ast.parse(patched)
+    except SyntaxError as e:
+        raise DiffError(f"patched code does not parse: {e.msg} (line {e.lineno})") from e
+
+
+def build_diff_answer(code: str, reply: str) -> str:
+    """
+    The answer shown to the user for a diff-mode reply: explanation, the diff
+    as actually applied, and the corrected code. Raises DiffError when the
+    reply's diff does not apply or the result does not parse.
+    """
+    explanation, diff = split_answer(reply)
+    patched = apply_diff(code, diff)
+    check_parses(patched)
+
+    applied = "".join(difflib.unified_diff(
+        code.splitlines(keepends=True), patched.splitlines(keepends=True),
+        fromfile="a/code.py", tofile="b/code.py", n=2,
+    ))
+    return (
+        f"{explanation}\n\n"
+        f"Fix:\n```diff\n{applied.rstrip()}\n```\n\n"
+        f"Corrected code:\n```python\n{patched.rstrip()}\n```"
+    )
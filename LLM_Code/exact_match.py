@@ -0,0 +1,106 @@
+from __future__ import annotations
+import re
+import time
+
+from LLM_Code.quick_answers import FRAME_RE
+
+# -----------------------------
+# Exact-match lookups
+# -----------------------------
+# Before the vector search, look for instances the error points at directly:
+#   - a failing pytest / unittest test ID that is in an instance's
+#     fail_to_pass (or pass_to_pass) list;
+#   - a library file from the traceback that an instance's patch changed
+#     (touched_files, see Database_Code/features.py).
+# Both are GIN-indexed array lookups (Schema.sql), so they cost about as much
+# as a primary-key fetch. Hits are returned ahead of the vector results;
+# test-ID hits rank above file hits.
+
+# "tests/test_x.py::TestA::test_b[param]"
+PYTEST_ID_RE = re.compile(r"([\w./-]+\.py::[\w\[\]\-.:/,=]+)")
+# unittest / Django runner: "test_b (app.tests.TestA)", or on Python 3.11+
+# "test_b (app.tests.TestA.test_b)", which test_ids() turns into the former
+# (the form SWE-bench stores)
+UNITTEST_ID_RE = re.compile(r"\b(test\w*) \(([\w.]+)\)")
+
+# Installed-package frames: the path after site-packages is the path in the repo
+# (modulo src/ and lib/, which touched_files also stores without).
+PACKAGE_PATH_RE = re.compile(r"[\\/](?:site|dist)-packages[\\/](.+)$")
+
+# A file that many fixes touched (django/db/models/query.py, ...) says little
+# about which one applies; file matches only count when there are at most this many.
+EXACT_FILE_MAX_HITS = 3
+
+TEST_ID_SQL = """
+    SELECT instance_id, repo, problem_statement, patch
+    FROM swebench_data
+    WHERE fail_to_pass ?| %(tests)s::text[] OR pass_to_pass ?| %(tests)s::text[]
+    ORDER BY fail_to_pass ?| %(tests)s::text[] DESC
+    LIMIT %(k)s;
+"""
+
+FILE_SQL = """
+    SELECT instance_id, repo, problem_statement, patch
+    FROM swebench_data
+    WHERE touched_files && %(files)s::text[]
+    ORDER BY cardinality(ARRAY(SELECT unnest(touched_files) INTERSECT SELECT unnest(%(files)s::text[]))) DESC
+    LIMIT %(limit)s;
+"""
+
+
+def test_ids(error: str) -> list[str]:
+    ids = [m.rstrip(":,") for m in PYTEST_ID_RE.findall(error or "")]
+    for name, where in UNITTEST_ID_RE.findall(error or ""):
+        if where.endswith(f".{name}"):
+            where = where[:-len(name) - 1]
+        ids.append(f"{name} ({where})")
+    return list(dict.fromkeys(ids))
+
+
+def library_files(error: str) -> list[str]:
+    """
+    Repo-relative paths of the installed-package files in the traceback,
+    deepest frame first.
+    """
+    paths = []
+    for m in map(FRAME_RE.match, (error or "").splitlines()):
+        if not m:
+            continue
+        package = PACKAGE_PATH_RE.search(m.group(1))
+        if package:
+            paths.append(package.group(1).replace("\\", "/"))
+    return list(dict.fromkeys(reversed(paths)))
+
+
+def exact_lookup(conn, error: str, k: int = 3) -> list[tuple]:
+    """
+    Instances matched by test ID or touched file, strongest first, as
+    (instance_id, repo, problem_statement, patch, distance) rows with distance
+    0.0 so they sort ahead of any vector hit. [] when the error names neither.
+    """
+    tests, files = test_ids(error), library_files(error)
+    if not tests and not files:
+        return []
+
+    start = time.time()
+    rows = []
+    with conn.cursor() as cur:
+        if tests:
+            cur.execute(TEST_ID_SQL, {"tests": tests, "k": k})
+            rows += cur.fetchall()
+        if files and len(rows) < k:
+            cur.execute(FILE_SQL, {"files": files, "limit": EXACT_FILE_MAX_HITS + 1})
+            file_rows = cur.fetchall()
+            if len(file_rows) <= EXACT_FILE_MAX_HITS:
+                rows += file_rows
+    conn.commit()
+
+    unique = {}
+    for r in rows:
+        unique.setdefault(r[0], r)
+    hits = list(unique.values())[:k]
+    print(
+        f"Exact lookup: {len(hits)} hits for {len(tests)} test IDs / {len(files)} files "
+        f"in {(time.time() - start) * 1000:.1f} ms"
+    )
+    return [(*r, 0.0) for r in hits]
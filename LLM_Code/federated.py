@@ -0,0 +1,130 @@
+from __future__ import annotations
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+from psycopg2 import sql
+
+from Database_Code.corpora import CORPORA, get_corpus
+from Database_Code.db import connection
+from LLM_Code.profiler import propagate
+
+# -----------------------------
+# Federated search over several corpora
+# -----------------------------
+# Each selected corpus is queried in parallel on its own connection, distances
+# are normalised per corpus and the results are merged into one ranking.
+
+# Share of the merged score that comes from the per-corpus normalised distance;
+# the rest is the raw distance normalised over all corpora together. Pure
+# per-corpus normalisation would rank a weak corpus' best hit level with a
+# strong corpus' best hit.
+NORMALIZE_BLEND = 0.5
+
+# Rows fetched from each corpus before merging.
+PER_CORPUS_POOL = 20
+
+_executor = ThreadPoolExecutor(max_workers=len(CORPORA), thread_name_prefix="corpus")
+_local = threading.local()
+
+
+def _thread_connection():
+    # psycopg2 connections must not run concurrent queries, so every worker
+    # thread keeps its own and reuses it for the rest of the process
+    conn = getattr(_local, "conn", None)
+    if conn is None or conn.closed:
+        conn = connection()
+        _local.conn = conn
+    return conn
+
+
+def search_corpus(
+    name: str, q_vec: np.ndarray, pool: int = PER_CORPUS_POOL, timeout: float | None = None,
+    workspace_root: str | None = None,
+) -> list[tuple]:
+    """
+    Nearest rows of one corpus as (instance_id, repo, problem_statement, patch, distance).
+    The workspace corpus holds every indexed project; only workspace_root (the
+    folder of the file being answered) is searched, and nothing without one.
+    """
+    corpus = get_corpus(name)
+    where, params = sql.SQL(""), []
+    if corpus["source"] == "workspace":
+        if not workspace_root:
+            return []
+        where, params = sql.SQL("AND repo = %s"), [os.path.abspath(workspace_root)]
+    query = sql.SQL("""
+        SELECT instance_id, repo, problem_statement, patch, embedding <=> %s::vector AS distance
+        FROM {}
+        WHERE embedding IS NOT NULL {}
+        ORDER BY embedding <=> %s::vector
+        LIMIT %s;
+    """).format(sql.Identifier(corpus["table"]), where)
+
+    conn = _thread_connection()
+    try:
+        with conn.cursor() as cur:
+            if timeout is not None:
+                cur.execute("SET LOCAL statement_timeout = %s;", (max(1, int(timeout * 1000)),))
+            cur.execute(query, (q_vec, *params, q_vec, pool))
+            rows = cur.fetchall()
+        conn.commit()
+        return rows
+    except Exception as e:
+        conn.rollback()
+        print(f"Corpus {name} search failed: {e}")
+        return []
+
+
+def min_max(values: list[float]) -> list[float]:
+    lo, hi = min(values), max(values)
+    if hi - lo < 1e-12:
+        return [0.0 for _ in values]
+    return [(v - lo) / (hi - lo) for v in values]
+
+
+def merge_results(results: dict[str, list[tuple]], k: int) -> list[tuple]:
+    """
+    results maps corpus name -> rows from search_corpus. Returns the top-k rows
+    (with the corpus name appended) ordered by blended, weighted score;
+    duplicates across corpora (e.g. Lite is a subset of full) keep their best score.
+    """
+    all_distances = [r[4] for rows in results.values() for r in rows]
+    if not all_distances:
+        return []
+    lo, hi = min(all_distances), max(all_distances)
+    span = hi - lo if hi - lo > 1e-12 else 1.0
+
+    best = {}
+    for name, rows in results.items():
+        if not rows:
+            continue
+        weight = get_corpus(name).get("weight", 1.0)
+        local = min_max([r[4] for r in rows])
+        for row, local_norm in zip(rows, local):
+            global_norm = (row[4] - lo) / span
+            score = weight * (NORMALIZE_BLEND * local_norm + (1 - NORMALIZE_BLEND) * global_norm)
+            if row[0] not in best or score < best[row[0]][0]:
+                best[row[0]] = (score, (*row, name))
+
+    ranked = sorted(best.values(), key=lambda x: x[0])
+    return [row for _, row in ranked[:k]]
+
+
+def federated_search(
+    q_vec: np.ndarray, corpora: list[str], k: int = 5, pool: int = PER_CORPUS_POOL,
+    timeout: float | None = None, workspace_root: str | None = None,
+) -> list[tuple]:
+    """
+    Query every corpus in parallel and merge. Rows are
+    (instance_id, repo, problem_statement, patch, distance, corpus).
+    Corpora that have not answered within timeout are left out of the merge.
+    workspace_root scopes the workspace corpus (see search_corpus).
+    """
+    futures = {
+        name: _executor.submit(propagate(search_corpus), name, q_vec, max(pool, k), timeout, workspace_root)
+        for name in corpora
+    }
+    wait(futures.values(), timeout=timeout)
+    return merge_results({name: f.result() for name, f in futures.items() if f.done()}, k)
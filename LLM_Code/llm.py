@@ -3,14 +3,45 @@ import json
 import os
 from typing import List, Tuple
 
-from openai import OpenAI
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from openai import APITimeoutError, OpenAI
 import psycopg2  # only used for type hints / cursor usage
 from pgvector.psycopg2 import register_vector
 
-from Database_Code.embeddings import embed_text
+from Database_Code.corpora import DEFAULT_CORPUS, selected_corpora
+from Database_Code.embeddings import submit_embedding
+from LLM_Code import cross_encoder
+from LLM_Code.code_context import (
+    EXPANSION_CONTEXT_TOKENS, extract_context, retrieval_context,
+)
+from LLM_Code.deadline import Deadline, DeadlineExceeded
+from LLM_Code.diff_answer import (
+    ANSWER_MODE, DIFF_INSTRUCTIONS, FULL_INSTRUCTIONS, DiffError, build_diff_answer,
+)
+from LLM_Code.exact_match import exact_lookup
+from LLM_Code.federated import federated_search
+from LLM_Code.model_router import log_route, route
+from LLM_Code.prefetch import lookup_prefetched
+from LLM_Code.profiler import propagate, stage
+from LLM_Code.query_planner import log_decision, plan_queries
+from LLM_Code.quick_answers import quick_answer
+from LLM_Code.shadow import maybe_shadow
+from LLM_Code.symbol_search import fuse, symbol_lookup
 
 import time
 
+# If the answer model has not replied after this many seconds, the same prompt
+# is also sent to HEDGE_MODEL and whichever finishes first is used.
+HEDGE_MODEL = os.getenv("ASSISTANT_HEDGE_MODEL", "gpt-5-nano-2025-08-07")
+HEDGE_AFTER_SEC = float(os.getenv("ASSISTANT_HEDGE_AFTER_SEC", "15"))
+
+# Query expansion is only worth a small slice of the request's deadline.
+EXPANSION_MAX_SEC = 10
+
+_llm_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm")
+
 # OpenAI client + LLM call
 
 def get_openai_client() -> OpenAI:
@@ -25,25 +56,69 @@ def get_openai_client() -> OpenAI:
     return OpenAI(api_key=api_key)
 
 
-def call_llm(prompt: str, model: str = "gpt-5-mini-2025-08-07") -> str:
+def call_llm(
+    prompt: str,
+    model: str = "gpt-5-mini-2025-08-07",
+    timeout: float | None = None,
+    max_output_tokens: int = 1000,
+    route: dict | None = None,
+    usage: dict | None = None,
+    deadline: Deadline | None = None,
+) -> str:
     """
     Send a prompt to an LLM and return the model's text output.
 
     Note:
     - This uses the OpenAI Responses API.
     - 'resp.output_text' is a convenience property that returns the concatenated text output.
+    - timeout (seconds) bounds the request; it raises openai.APITimeoutError when hit.
+    - route is the model_router decision behind this call; its outcome gets logged,
+      and its reasoning_effort (if any) is sent with the request.
+    - usage, if given, is filled with the reply's model, token counts and latency.
+    - cancelling deadline closes the connection and raises Cancelled.
     """
     
     client = get_openai_client()
+    if timeout is not None:
+        client = client.with_options(timeout=timeout, max_retries=0)
 
-    resp = client.responses.create(
-        model=model,
-        input=prompt,
-        max_output_tokens=1000
-    )
+    # max_output_tokens counts reasoning tokens too
+    extra = {}
+    if route and route.get("reasoning_effort"):
+        extra["reasoning"] = {"effort": route["reasoning_effort"]}
+
+    start = time.time()
+    unregister = deadline.on_cancel("llm", client.close) if deadline else (lambda: None)
+    try:
+        resp = client.responses.create(
+            model=model,
+            input=prompt,
+            max_output_tokens=max_output_tokens,
+            **extra,
+        )
+    except Exception:
+        if route:
+            log_route(dict(route, model=model), time.time() - start, ok=False)
+        if deadline:
+            deadline.check_cancelled(route["task"] if route else "llm")
+        raise
+    finally:
+        unregister()
+
+    resp_usage = getattr(resp, "usage", None)
+    if route:
+        log_route(dict(route, model=model), time.time() - start, resp_usage)
+    if usage is not None:
+        usage.update(
+            model=model,
+            input_tokens=getattr(resp_usage, "input_tokens", None),
+            output_tokens=getattr(resp_usage, "output_tokens", None),
+            latency_sec=round(time.time() - start, 4),
+        )
 
     # output_text is typically present for text-only requests
-    text = (resp.output_text or "").strip()
+    with stage("read_reply"):
+        text = (resp.output_text or "").strip()
     if not text:
         # Fallback: return something safe instead of empty
         return "No text output returned by the model."
@@ -51,6 +126,67 @@ def call_llm(prompt: str, model: str = "gpt-5-mini-2025-08-07") -> str:
     return text
 
 
+def call_llm_hedged(
+    prompt: str,
+    model: str,
+    deadline: Deadline,
+    hedge_model: str | None = HEDGE_MODEL,
+    hedge_after: float = HEDGE_AFTER_SEC,
+    max_output_tokens: int = 1000,
+    route: dict | None = None,
+    usage: dict | None = None,
+) -> str:
+    """
+    call_llm bounded by the request deadline. If the primary model is still
+    running after hedge_after seconds, a duplicate request goes to hedge_model
+    and the first successful reply wins. Raises DeadlineExceeded when nothing
+    arrives in time, Cancelled as soon as the deadline is cancelled. usage gets
+    the winning reply's call_llm usage.
+    """
+    deadline.check("answer")
+    usages = {}
+    futures = {
+        _llm_pool.submit(
+            propagate(call_llm), prompt, model, deadline.remaining(), max_output_tokens, route,
+            usages.setdefault(model, {}), deadline,
+        ): model
+    }
+
+    # deadline.cancelled is in every wait so a cancel wakes it immediately
+    wait([*futures, deadline.cancelled], timeout=deadline.budget(hedge_after), return_when=FIRST_COMPLETED)
+    deadline.check_cancelled("answer")
+    if not any(f.done() for f in futures) and hedge_model and hedge_model != model and not deadline.expired():
+        print(f"{model} slower than {hedge_after:.1f}s, hedging with {hedge_model}")
+        hedge_route = dict(route, reason=f"hedge for {model}") if route else None
+        futures[_llm_pool.submit(
+            propagate(call_llm), prompt, hedge_model, deadline.remaining(), max_output_tokens, hedge_route,
+            usages.setdefault(hedge_model, {}), deadline,
+        )] = hedge_model
+
+    last_error = None
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending | {deadline.cancelled}, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+        pending.discard(deadline.cancelled)
+        deadline.check_cancelled("answer")
+        if not done:
+            break
+        for future in done:
+            try:
+                text = future.result()
+                print(f"Answer from {futures[future]} after {deadline.elapsed():.2f}s")
+                if usage is not None:
+                    usage.update(usages[futures[future]])
+                return text
+            except Exception as e:
+                print(f"{futures[future]} failed: {e}")
+                last_error = e
+
+    if last_error is None or isinstance(last_error, APITimeoutError) or deadline.expired():
+        raise DeadlineExceeded("answer")
+    raise last_error
+
+
 # -----------------------------
 # Vector retrieval (pgvector)
 # -----------------------------
@@ -59,50 +195,194 @@ RetrievedRow = Tuple[str, str, str, str]
 # (instance_id, repo, problem_statement, patch)
 
 
-def retrieve_topk(conn, code: str, error:str, query: str, k: int = 3) -> List[RetrievedRow]:
+def retrieve_topk(
+    conn, code: str, error:str, query: str, k: int = 3,
+    corpora: List[str] | None = None,
+    deadline: Deadline | None = None,
+    line_nums: str = "",
+    workspace_root: str | None = None,
+) -> List[RetrievedRow]:
+    rows = retrieve_topk_scored(conn, code, error, query, k=k, corpora=corpora, deadline=deadline,
+                                line_nums=line_nums, workspace_root=workspace_root)
+    return [r[:4] for r in rows]
+
+
+def retrieve_topk_scored(
+    conn, code: str, error:str, query: str, k: int = 3,
+    corpora: List[str] | None = None,
+    deadline: Deadline | None = None,
+    line_nums: str = "",
+    workspace_root: str | None = None,
+) -> list[tuple]:
     """
     Retrieve the top-k nearest rows from swebench_data using pgvector.
+    When other corpora are selected (corpora argument or the ASSISTANT_CORPORA
+    env var), every query fans out over them instead (LLM_Code/federated.py);
+    the workspace corpus is searched for workspace_root's code only. The
+    swebench_data shortcuts below (exact matches, prefetched code-side rows,
+    symbol lookup) run whenever the default corpus is among them, and their
+    rows are merged with the federated ones.
+    If the deadline runs out part-way, the rows found so far are returned.
+    Queries are built from the code around the error lines (line_nums, else
+    the traceback), not from the top of the file. Instances matched exactly
+    by a test ID or library file in the error (LLM_Code/exact_match.py) come first;
+    patches that touched the functions named in the error and code
+    (LLM_Code/symbol_search.py) are fused with the vector results.
 
     Requirements:
     - swebench_data.embedding must be a pgvector column (VECTOR type)
     - pgvector extension must be installed: CREATE EXTENSION vector;
     """
-    queries = generate_retrieval_queries(code, error)
+    retrieval_start = time.time()
+    corpora = corpora or selected_corpora()
+    deadline = deadline or Deadline()
+
+    # a test ID or library file in the error can point straight at an instance
+    exact = []
+    if DEFAULT_CORPUS in corpora:
+        try:
+            with stage("exact_lookup"):
+                exact = exact_lookup(conn, error, k=k)
+        except Exception as e:
+            conn.rollback()
+            print(f"Exact lookup unavailable: {e}")
+    if len(exact) >= k:
+        # nothing the vector search finds would rank above these
+        log_decision({"path": "exact_match"}, time.time() - retrieval_start, [r[4] for r in exact])
+        return exact[:k]
+
+    with stage("extract_context"):
+        focused = extract_context(code, error, line_nums, EXPANSION_CONTEXT_TOKENS)
+
+    # local classifier first; the LLM expander only runs when it is unsure
+    with stage("plan_queries"):
+        queries, decision = plan_queries(
+            focused, error,
+            fallback=lambda c, e: generate_retrieval_queries(c, e, deadline=deadline),
+        )
+    # code-side neighbours may already be cached by the on-save prefetch
+    # (LLM_Code/prefetch.py); then only the error text needs embedding
+    prefetched = None
+    if DEFAULT_CORPUS in corpora:
+        try:
+            with stage("prefetch_lookup"):
+                prefetched = lookup_prefetched(conn, code, error, line_nums)
+        except Exception as e:
+            conn.rollback()
+            print(f"Prefetch cache unavailable: {e}")
+
     concat_queries= [
         error,
         f"Python error: {error}",
-        code[:500],  # small snippet
+        # small snippet
+        # from the raw file: error line numbers do not index into the rendered `focused`
+        retrieval_context(code, error, line_nums),
         *queries
     ]
-    
+    # corpora each query searches; prefetched rows stand in for the snippet's
+    # swebench_data search, so it only goes to the other corpora (if any)
+    query_corpora = [corpora] * len(concat_queries)
+    cached_rows = [None] * len(concat_queries)
+    if prefetched is not None:
+        query_corpora[2] = [c for c in corpora if c != DEFAULT_CORPUS]
+        cached_rows[2] = prefetched
 
-    results = []
+    results = list(exact)
 
     sql = """
-        SELECT instance_id, repo, problem_statement, patch
+        SELECT instance_id, repo, problem_statement, patch, embedding <=> %s AS distance
         FROM swebench_data
         WHERE embedding IS NOT NULL
         ORDER BY embedding <=> %s
         LIMIT %s;
     """
 
-    for q in concat_queries:
-        q_emb = embed_text(q)
-        q_vec = "[" + ",".join(map(str, q_emb)) + "]"
-
-        with conn.cursor() as cur:
-            cur.execute(sql, (q_vec, k))
-            rows = cur.fetchall()
-            results.extend(rows)
-
-    # remove duplicates using instance_id
-    unique = {r[0]: r for r in results}
-
-    return list(unique.values())[:k]
-
-def generate_retrieval_queries(code: str, error: str) -> list[str]:
-
-    snippet = code[:1200] 
+    # all query texts are submitted at once, so they share one embeddings request
+    # (Database_Code/embed_batcher.py); each search only waits for its own vector
+    # (truncating each text to the token limit happens here, on this thread)
+    with stage("embed_submit"):
+        vectors = [
+            submit_embedding(q, timeout=deadline.remaining()) if targets else None
+            for q, targets in zip(concat_queries, query_corpora)
+        ]
+
+    for q_future, targets, cached in zip(vectors, query_corpora, cached_rows):
+        if cached is not None:
+            print(f"Using {len(cached)} prefetched code-side rows")
+            results.extend(cached)
+        if q_future is None:
+            continue
+        try:
+            deadline.check("retrieval")
+            # float32 ndarray, bound through pgvector's adapter; like the answer
+            # waits, a cancel wakes this one immediately
+            with stage("embed_wait"):
+                wait([q_future, deadline.cancelled], timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+                deadline.check_cancelled("retrieval")
+                if not q_future.done():
+                    raise DeadlineExceeded("retrieval")
+                q_vec = q_future.result()
+
+            if targets != [DEFAULT_CORPUS]:
+                with stage("federated_search"):
+                    results.extend(federated_search(q_vec, targets, k=k, timeout=deadline.remaining(),
+                                                    workspace_root=workspace_root))
+                continue
+
+            # a cancelled request stops the running query server-side
+            unregister = deadline.on_cancel("database", conn.cancel)
+            try:
+                with stage("vector_sql"), conn.cursor() as cur:
+                    cur.execute("SET LOCAL statement_timeout = %s;", (max(1, int(deadline.remaining() * 1000)),))
+                    cur.execute(sql, (q_vec, q_vec, k))
+                    rows = cur.fetchall()
+                    results.extend(rows)
+            finally:
+                unregister()
+        except (DeadlineExceeded, APITimeoutError, FutureTimeout, psycopg2.errors.QueryCanceled):
+            conn.rollback()
+            # conn.cancel() from a cancelled request also lands here
+            deadline.check_cancelled("retrieval")
+            print(f"Retrieval stopped at the deadline with {len(results)} rows")
+            break
+
+    # patches that changed the functions / classes the traceback and code name
+    symbol_rows = []
+    if DEFAULT_CORPUS in corpora and not deadline.expired():
+        error_future = vectors[0]
+        error_vec = error_future.result() if error_future.done() and not error_future.exception() else None
+        try:
+            with stage("symbol_lookup"):
+                symbol_rows = symbol_lookup(conn, focused, error, error_vec, k=k)
+        except Exception as e:
+            conn.rollback()
+            print(f"Symbol lookup unavailable: {e}")
+
+    # remove duplicates using instance_id (first occurrence wins, so exact hits keep their place)
+    unique = {}
+    for r in results:
+        unique.setdefault(r[0], r)
+    # exact hits stay on top; the cross-encoder only orders the vector and symbol results
+    exact_ids = {r[0] for r in exact}
+    rest = [r for r in unique.values() if r[0] not in exact_ids]
+    if symbol_rows:
+        with stage("fuse"):
+            rest = fuse(rest, [r for r in symbol_rows if r[0] not in exact_ids])
+    # only where the model was preloaded (the runner); loading it here would eat the budget
+    if cross_encoder.CROSS_ENCODER_ENABLED and cross_encoder.preloaded() and len(rest) > k - len(exact) > 0:
+        with stage("cross_encoder"):
+            rest, info = cross_encoder.rerank(f"{error}\n{focused}", rest, k - len(exact))
+        print(f"Cross-encoder rerank: {info['reason']} in {info['latency_sec']:.3f}s")
+    top_rows = (exact + rest)[:k]
+
+    log_decision(decision, time.time() - retrieval_start, [r[4] for r in top_rows])
+
+    # (instance_id, repo, problem_statement, patch, distance)
+    return [r[:5] for r in top_rows]
+
+def generate_retrieval_queries(code: str, error: str, deadline: Deadline | None = None) -> list[str]:
+
+    snippet = extract_context(code, error, max_tokens=EXPANSION_CONTEXT_TOKENS)
 
     prompt = f"""
 You generate search queries for retrieving similar bugs from a dataset of GitHub issues.
@@ -121,7 +401,13 @@ Code snippet:
 {snippet}
 """
 
-    raw = call_llm(prompt)
+    try:
+        timeout = deadline.budget(EXPANSION_MAX_SEC) if deadline else None
+        choice = route("expansion")
+        raw = call_llm(prompt, choice["model"], timeout, choice["max_output_tokens"], choice, deadline=deadline)
+    except APITimeoutError:
+        print("Query expansion timed out, using the error text as the query")
+        raw = ""
 
     #parse raw 
     try:
@@ -139,23 +425,101 @@ def rag_answer(
     conn: psycopg2.extensions.connection, code: str, error: str,
     user_question: str,
     k: int = 5,
-    model: str = "gpt-5-mini-2025-08-07",
+    model: str | None = None,
+    corpora: List[str] | None = None,
+    deadline: Deadline | None = None,
+    line_nums: str = "",
+    workspace_root: str | None = None,
 ) -> str:
- 
-    
-    rows = retrieve_topk(conn, code, error, user_question, k=k)
-    
+    """
+    Retrieve similar issues and answer. model=None lets LLM_Code/model_router.py
+    pick the model and output budget for this error. line_nums (comma-separated,
+    from the extension) points retrieval at the failing code; workspace_root
+    is the user's project folder, for the workspace corpus. Sampled requests
+    are also run through the SHADOW_STRATEGIES (LLM_Code/shadow.py). The
+    answer format follows ASSISTANT_ANSWER_MODE (LLM_Code/diff_answer.py).
+    Raises Cancelled (LLM_Code/deadline.py) once deadline.cancel() is called.
+    """
+    deadline = deadline or Deadline()
+    rows = []
 
+    try:
+        retrieval_start = time.time()
+        with stage("retrieval"):
+            scored = retrieve_topk_scored(conn, code, error, user_question, k=k, corpora=corpora,
+                                          deadline=deadline, line_nums=line_nums,
+                                          workspace_root=workspace_root)
+        rows = [r[:4] for r in scored]
+        # sampled requests are replayed against candidate strategies in the background
+        maybe_shadow(code, error, line_nums, k, scored, time.time() - retrieval_start,
+                     user_question=user_question, corpora=corpora or selected_corpora(),
+                     workspace_root=workspace_root)
+
+        with stage("route"):
+            choice = route(
+                "answer", code, error,
+                best_distance=min((r[4] for r in scored), default=None),
+                latency_budget=deadline.remaining(),
+            )
+        if model:
+            choice = dict(choice, model=model, reason="explicit model")
+
+        with stage("answer"):
+            return generate_answer(code, rows, user_question, choice, deadline)
+    except DeadlineExceeded as e:
+        print(f"Deadline of {deadline.seconds:.0f}s exceeded during {e.stage}")
+        with stage("degraded_answer"):
+            return degraded_answer(code, error, rows, deadline)
+
+
+def generate_answer(
+    code: str, rows: List[RetrievedRow], user_question: str, choice: dict, deadline: Deadline,
+    mode: str = ANSWER_MODE,
+    attempts: list | None = None,
+) -> str:
+    """
+    Ask the routed model for the answer. In diff mode the reply's diff is
+    applied to code and must parse (LLM_Code/diff_answer.py); if it does not,
+    the question is asked once more in full mode. attempts, if given, gets one
+    {"mode", "ok", model, token counts, latency_sec} entry per LLM call.
+    """
+    usage = {}
+    with stage(f"build_prompt_{mode}"):
+        prompt = build_answer_prompt(rows, user_question, mode)
+    with stage(f"llm_{mode}"):
+        reply = call_llm_hedged(
+            prompt, choice["model"], deadline,
+            max_output_tokens=choice["max_output_tokens"], route=choice, usage=usage,
+        )
+    if mode != "diff":
+        if attempts is not None:
+            attempts.append(dict(usage, mode=mode, ok=True))
+        return reply
+
+    try:
+        with stage("apply_diff"):
+            answer = build_diff_answer(code, reply)
+        if attempts is not None:
+            attempts.append(dict(usage, mode="diff", ok=True))
+        return answer
+    except DiffError as e:
+        print(f"Diff answer rejected ({e}), retrying in full mode")
+        if attempts is not None:
+            attempts.append(dict(usage, mode="diff", ok=False, error=str(e)))
+        return generate_answer(code, rows, user_question, choice, deadline, "full", attempts)
+
+
+def build_answer_prompt(rows: List[RetrievedRow], user_question: str, mode: str = "full") -> str:
+    instructions = DIFF_INSTRUCTIONS if mode == "diff" else FULL_INSTRUCTIONS
     if not rows:
         # If retrieval returns nothing, still answer but admit no examples were found.
-        prompt = f"""You are a coding assistant.
+        return f"""You are a coding assistant.
 
 User question:
 {user_question}
 
 No retrieved examples were found in the database. Answer using general best practices.
-"""
-        return call_llm(prompt, model=model)
+{instructions if mode == "diff" else ""}"""
 
     # Build a readable context block from retrieved rows
     context_blocks = []
@@ -173,7 +537,7 @@ No retrieved examples were found in the database. Answer using general best prac
     # Prompt with basic guardrails:
     # - Use the retrieved examples
     # - If unsure, say what is missing
-    prompt = f"""
+    return f"""
 You are a coding assistant.
 
 IMPORTANT:
@@ -188,7 +552,29 @@ IMPORTANT:
 ========== USER QUESTION ==========
 {user_question}
 
-Provide an explanation of the issues, one best practice corrected code. 
+{instructions}
 """
-   
-    return call_llm(prompt, model=model)
\ No newline at end of file
+
+
+def degraded_answer(code: str, error: str, rows: List[RetrievedRow], deadline: Deadline) -> str:
+    """
+    What the user gets when the deadline runs out: a local short answer if one
+    of the quick-answer rules applies, plus the similar issues found so far.
+    """
+    parts = [f"(Partial answer: the full analysis did not finish within {deadline.seconds:.0f}s.)"]
+
+    short = quick_answer(code, error)
+    if short:
+        parts.append(short)
+    else:
+        last_line = (error or "").strip().splitlines()[-1] if (error or "").strip() else "Unknown error"
+        parts.append(f"Cause:\n{last_line}\n\nFix:\nSee the similar issues below, or run the assistant again.")
+
+    if rows:
+        similar = []
+        for (iid, repo, problem_statement, patch) in rows:
+            first_line = next((l.strip() for l in (problem_statement or "").splitlines() if l.strip()), "")
+            similar.append(f"- {iid} ({repo}): {first_line[:150]}")
+        parts.append("Similar issues:\n" + "\n".join(similar))
+
+    return "\n\n".join(parts)
@@ -0,0 +1,128 @@
+from __future__ import annotations
+import json
+import os
+import re
+import time
+
+from Database_Code.features import REPO_KEYWORDS
+
+# -----------------------------
+# Model router
+# -----------------------------
+# Picks the model and max_output_tokens for each LLM call from the task, how
+# complex the error looks, how good the retrieved context is and the time left.
+# Every choice and its outcome is appended to LOG_PATH so the thresholds below
+# can be tuned against benchmark runs.
+
+LOG_PATH = os.getenv("MODEL_ROUTER_LOG", os.path.join(os.path.dirname(__file__), "model_router_log.jsonl"))
+
+# Cheapest first. expected_latency_sec is a rough p50 used against the budget.
+TIERS = {
+    "nano": {"model": "gpt-5-nano-2025-08-07", "max_output_tokens": 1000, "expected_latency_sec": 6},
+    "mini": {"model": "gpt-5-mini-2025-08-07", "max_output_tokens": 1000, "expected_latency_sec": 20},
+    "full": {"model": "gpt-5-2025-08-07", "max_output_tokens": 3000, "expected_latency_sec": 45},
+}
+TIER_ORDER = ["nano", "mini", "full"]
+
+# Query expansion only writes 3 short strings. The nano tier is a reasoning
+# model and max_output_tokens includes its reasoning tokens, so expansion asks
+# for minimal reasoning; otherwise the cap can be used up before any text.
+EXPANSION_MAX_OUTPUT_TOKENS = 300
+EXPANSION_REASONING_EFFORT = "minimal"
+
+# Cosine distance of the best retrieved row below which the context is
+# considered a good match (the model mostly has to adapt a known fix).
+CONFIDENT_DISTANCE = 0.35
+
+FRAME_RE = re.compile(r'^\s*File "(.+?)", line \d+', re.MULTILINE)
+
+
+def error_complexity(code: str, error: str) -> int:
+    """
+    0 (textbook) .. 3 (deep library bug), from traceback depth, code size and
+    whether the error comes from a third-party library.
+    """
+    score = 0
+    frames = FRAME_RE.findall(error or "")
+    if len(frames) > 3:
+        score += 1
+    if any("site-packages" in f or "dist-packages" in f for f in frames):
+        score += 1
+    text = f"{code}\n{error}".lower()
+    if any(key in text for key in REPO_KEYWORDS):
+        score += 1
+    if len((code or "").splitlines()) > 200:
+        score += 1
+    return min(score, 3)
+
+
+def route(
+    task: str,
+    code: str = "",
+    error: str = "",
+    best_distance: float | None = None,
+    latency_budget: float | None = None,
+) -> dict:
+    """
+    task is "expansion" or "answer". Returns {"tier", "model", "max_output_tokens",
+    "reasoning_effort", "reason", ...}; reasoning_effort None keeps the model's default.
+    """
+    effort = None
+    if task == "expansion":
+        tier, reason = "nano", "query expansion"
+        max_tokens = EXPANSION_MAX_OUTPUT_TOKENS
+        effort = EXPANSION_REASONING_EFFORT
+        complexity = None
+    else:
+        complexity = error_complexity(code, error)
+        good_context = best_distance is not None and best_distance <= CONFIDENT_DISTANCE
+
+        if complexity == 0:
+            tier, reason = "nano", "simple error"
+        elif complexity >= 2 and not good_context:
+            tier, reason = "full", "complex error without a close match"
+        else:
+            tier, reason = "mini", "moderate error" if not good_context else "close match retrieved"
+
+        # step down while the tier is not expected to fit the time left
+        while (
+            latency_budget is not None
+            and TIER_ORDER.index(tier) > 0
+            and TIERS[tier]["expected_latency_sec"] > latency_budget
+        ):
+            tier = TIER_ORDER[TIER_ORDER.index(tier) - 1]
+            reason += f", downgraded for {latency_budget:.0f}s budget"
+
+        max_tokens = TIERS[tier]["max_output_tokens"]
+
+    return {
+        "task": task,
+        "tier": tier,
+        "model": TIERS[tier]["model"],
+        "max_output_tokens": max_tokens,
+        "reasoning_effort": effort,
+        "reason": reason,
+        "complexity": complexity,
+        "best_distance": best_distance,
+        "latency_budget": latency_budget,
+    }
+
+
+def log_route(decision: dict, latency: float, usage=None, ok: bool = True):
+    """
+    Append one routing decision with its outcome (latency, token usage, success).
+    """
+    record = dict(
+        decision,
+        timestamp=time.time(),
+        latency_sec=round(latency, 4),
+        ok=ok,
+        input_tokens=getattr(usage, "input_tokens", None),
+        output_tokens=getattr(usage, "output_tokens", None),
+    )
+    print(f"Router: {decision['task']} -> {decision['model']} ({decision['reason']}) in {latency:.2f}s")
+    try:
+        with open(LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"Could not write model router log: {e}")
@@ -0,0 +1,323 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from LLM_Code.code_context import enclosing_node, indent_block, node_start, parse_code, retrieval_context
+
+# -----------------------------
+# Speculative pre-retrieval
+# -----------------------------
+# The extension runs this on every save of a .py file, before anything has
+# failed:
+#   python LLM_Code/prefetch.py <file.py>
+# A "code window" is the code-side retrieval query (code_context.retrieval_context)
+# that an error whose deepest frame is on a given line would produce, so a
+# cached window is exactly the text the live path would embed, however many
+# frames the traceback has. Windows that are not cached yet are embedded (one
+# batched request), widest coverage first, and their top-k neighbours are
+# stored under the sha256 of the window text. When an error arrives, its query
+# is hashed and, on a hit, retrieval reuses the cached neighbours instead of
+# embedding and searching the code again.
+#
+# Speculative work is capped per save (PREFETCH_MAX_WINDOWS) and per hour
+# (PREFETCH_TOKEN_BUDGET embedded tokens). Every prefetch, lookup and eviction
+# is logged to METRICS_PATH; entries evicted without ever being used are the
+# wasted work.
+
+CACHE_DIR = os.getenv("PREFETCH_CACHE_DIR", os.path.join(os.path.dirname(__file__), "prefetch_cache"))
+METRICS_PATH = os.getenv("PREFETCH_LOG", os.path.join(os.path.dirname(__file__), "prefetch_log.jsonl"))
+BUDGET_PATH = os.path.join(CACHE_DIR, "budget.json")
+
+PREFETCH_MAX_WINDOWS = int(os.getenv("PREFETCH_MAX_WINDOWS", "20"))
+PREFETCH_TOKEN_BUDGET = int(os.getenv("PREFETCH_TOKEN_BUDGET", "50000"))
+BUDGET_WINDOW_SEC = 3600
+
+# Cached windows kept; least recently used are evicted first.
+PREFETCH_MAX_ENTRIES = int(os.getenv("PREFETCH_MAX_ENTRIES", "500"))
+
+PREFETCH_K = 5
+
+SEARCH_SQL = """
+    SELECT q.idx, r.instance_id, r.distance
+    FROM unnest(%s::vector[]) WITH ORDINALITY AS q(vec, idx)
+    CROSS JOIN LATERAL (
+        SELECT instance_id, embedding <=> q.vec AS distance
+        FROM swebench_data
+        WHERE embedding IS NOT NULL
+        ORDER BY embedding <=> q.vec
+        LIMIT %s
+    ) r
+    ORDER BY q.idx, r.distance;
+"""
+
+
+# -----------------------------
+# Windows
+# -----------------------------
+
+def line_groups(code: str) -> list[list[int]]:
+    """
+    Non-blank lines grouped by the block extract_context would centre on
+    (innermost function/class or top-level statement; indent block when the
+    file does not parse).
+    """
+    lines = code.splitlines()
+    try:
+        tree = parse_code(code)
+    except (SyntaxError, ValueError):
+        tree = None
+
+    groups = {}
+    for line in range(1, len(lines) + 1):
+        if not lines[line - 1].strip():
+            continue
+        node = enclosing_node(tree, line) if tree else None
+        span = (node_start(node), node.end_lineno) if node else indent_block(lines, line)
+        groups.setdefault(span, []).append(line)
+    return list(groups.values())
+
+
+def code_windows(code: str) -> list[str]:
+    """
+    The distinct code-side queries an error in this file can produce, i.e. the
+    retrieval_context() of its lines, most lines covered first. A block that
+    fits the budget is one window for all its lines; lines of a longer one
+    each get a window around them.
+    """
+    coverage = {}
+    for group in line_groups(code):
+        first, last = (retrieval_context(code, "", str(line)) for line in (group[0], group[-1]))
+        if first == last:
+            coverage[first] = coverage.get(first, 0) + len(group)
+            continue
+        for line in group:
+            window = retrieval_context(code, "", str(line))
+            coverage[window] = coverage.get(window, 0) + 1
+    # sorted() is stable: ties stay in file order
+    return sorted(coverage, key=lambda window: -coverage[window])
+
+
+def window_key(text: str) -> str:
+    # neighbours found with one embedding model are not valid for another
+    from Database_Code import embeddings
+
+    return hashlib.sha256(f"{embeddings.ACTIVE_MODEL}\n{text}".encode("utf-8")).hexdigest()
+
+
+# -----------------------------
+# Cache
+# -----------------------------
+
+def entry_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+
+def write_json(path: str, data: dict):
+    # write-then-rename so a concurrent reader never sees half a file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def log_event(event: str, **fields):
+    record = {"event": event, "timestamp": time.time(), **fields}
+    try:
+        with open(METRICS_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"Could not write prefetch log: {e}")
+
+
+def tokens_left() -> int:
+    try:
+        with open(BUDGET_PATH, "r", encoding="utf-8") as f:
+            budget = json.load(f)
+    except (OSError, ValueError):
+        budget = {}
+    if time.time() - budget.get("window_start", 0) > BUDGET_WINDOW_SEC:
+        return PREFETCH_TOKEN_BUDGET
+    return PREFETCH_TOKEN_BUDGET - budget.get("tokens", 0)
+
+
+def spend_tokens(tokens: int):
+    try:
+        with open(BUDGET_PATH, "r", encoding="utf-8") as f:
+            budget = json.load(f)
+    except (OSError, ValueError):
+        budget = {}
+    if time.time() - budget.get("window_start", 0) > BUDGET_WINDOW_SEC:
+        budget = {"window_start": time.time(), "tokens": 0}
+    budget["tokens"] += tokens
+    write_json(BUDGET_PATH, budget)
+
+
+def evict():
+    entries = [
+        os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR)
+        if name.endswith(".json") and name != os.path.basename(BUDGET_PATH)
+    ]
+    if len(entries) <= PREFETCH_MAX_ENTRIES:
+        return
+
+    entries.sort(key=os.path.getmtime)
+    evicted = unused = 0
+    for path in entries[:len(entries) - PREFETCH_MAX_ENTRIES]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                unused += not json.load(f).get("hits", 0)
+            os.remove(path)
+            evicted += 1
+        except (OSError, ValueError):
+            pass
+    log_event("evict", evicted=evicted, unused=unused)
+
+
+def prefetch_file(conn, code: str, k: int = PREFETCH_K) -> dict:
+    """
+    Embed and search every uncached window of code, within the budgets.
+    """
+    from Database_Code.embeddings import embed_texts, get_encoder
+
+    start = time.time()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    todo, cached = [], 0
+    for text in code_windows(code):
+        if not text.strip():
+            continue
+        key = window_key(text)
+        if os.path.exists(entry_path(key)):
+            os.utime(entry_path(key))  # still in use, keep it away from eviction
+            cached += 1
+        else:
+            todo.append((key, text))
+
+    left = tokens_left()
+    selected, tokens = [], 0
+    for key, text in todo[:PREFETCH_MAX_WINDOWS]:
+        n = len(get_encoder().encode(text))
+        if tokens + n > left:
+            break
+        selected.append((key, text))
+        tokens += n
+
+    if selected:
+        vectors = embed_texts([text for _, text in selected])
+        spend_tokens(tokens)
+
+        neighbours = [[] for _ in selected]
+        with conn.cursor() as cur:
+            cur.execute(SEARCH_SQL, (list(vectors), k))
+            for idx, instance_id, distance in cur.fetchall():
+                neighbours[idx - 1].append([instance_id, distance])
+        conn.commit()
+
+        for (key, _), rows in zip(selected, neighbours):
+            write_json(entry_path(key), {"created_at": time.time(), "hits": 0, "neighbours": rows})
+        evict()
+
+    stats = {
+        "windows": cached + len(todo),
+        "cached": cached,
+        "embedded": len(selected),
+        "skipped_budget": len(todo) - len(selected),
+        "tokens": tokens,
+        "seconds": round(time.time() - start, 4),
+    }
+    log_event("prefetch", **stats)
+    return stats
+
+
+def lookup_prefetched(conn, code: str, error: str, line_nums: str = "") -> list[tuple] | None:
+    """
+    Cached code-side neighbours for the window around the error, as
+    (instance_id, repo, problem_statement, patch, distance) rows, or None on a miss.
+    """
+    text = retrieval_context(code, error, line_nums)
+    if not text.strip():
+        return None
+
+    key = window_key(text)
+    try:
+        with open(entry_path(key), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        log_event("lookup", hit=False)
+        return None
+
+    entry["hits"] = entry.get("hits", 0) + 1
+    write_json(entry_path(key), entry)
+    log_event("lookup", hit=True, age_sec=round(time.time() - entry["created_at"], 1))
+
+    distances = dict(entry["neighbours"])
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT instance_id, repo, problem_statement, patch FROM swebench_data WHERE instance_id = ANY(%s);",
+            (list(distances),),
+        )
+        rows = [(*r, distances[r[0]]) for r in cur.fetchall()]
+    return sorted(rows, key=lambda r: r[4])
+
+
+def prefetch_stats() -> dict:
+    """
+    Totals from METRICS_PATH: work done, hit rate, and work wasted (evicted unused).
+    """
+    totals = {"prefetches": 0, "embedded": 0, "tokens": 0, "skipped_budget": 0,
+              "lookups": 0, "hits": 0, "evicted": 0, "wasted": 0}
+    try:
+        with open(METRICS_PATH, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["event"] == "prefetch":
+                    totals["prefetches"] += 1
+                    totals["embedded"] += record["embedded"]
+                    totals["tokens"] += record["tokens"]
+                    totals["skipped_budget"] += record["skipped_budget"]
+                elif record["event"] == "lookup":
+                    totals["lookups"] += 1
+                    totals["hits"] += record["hit"]
+                elif record["event"] == "evict":
+                    totals["evicted"] += record["evicted"]
+                    totals["wasted"] += record["unused"]
+    except OSError:
+        pass
+    totals["hit_rate"] = round(totals["hits"] / totals["lookups"], 3) if totals["lookups"] else None
+    return totals
+
+
+def main():
+    from Database_Code.db import connection
+
+    if len(sys.argv) < 2:
+        print("Usage: python LLM_Code/prefetch.py <file.py> | stats")
+        sys.exit(1)
+
+    if sys.argv[1] == "stats":
+        print(json.dumps(prefetch_stats(), indent=2))
+        return
+
+    with open(sys.argv[1], "r", encoding="utf-8", errors="replace") as f:
+        code = f.read()
+
+    conn = connection()
+    try:
+        stats = prefetch_file(conn, code)
+    finally:
+        conn.close()
+    print(
+        f"Prefetch: {stats['embedded']} windows embedded, {stats['cached']} cached, "
+        f"{stats['skipped_budget']} over budget in {stats['seconds']:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+from __future__ import annotations
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+# -----------------------------
+# Per-request profiling
+# -----------------------------
+# Off by default. A profiled request gets:
+#   - a sampling profile: every PROFILE_INTERVAL_MS a background thread reads
+#     the stacks (sys._current_frames) of the request's thread and of the pool
+#     threads running tasks for it, so the request itself runs uninstrumented
+#     and other requests answered at the same time stay out of it;
+#   - wall-clock vs CPU time of each stage() block (wall minus CPU is time
+#     spent waiting on the network or the database).
+# Pool tasks are submitted through propagate(), which carries the request's
+# profile and stage path (context variables) over to the worker thread.
+# Both are written to PROFILE_DIR as <request_id>.trace.json, next to
+# <request_id>.folded: collapsed stacks ("frame;frame;frame count") that
+# flamegraph.pl, speedscope and inferno read directly.
+#
+# Turn it on per request (ASSISTANT_PROFILE=1 for a Main.py run, "profile":
+# true in a runner request) or for a sampled share of requests
+# (PROFILE_SAMPLE_RATE=0.05). When a request is not profiled, stage() only
+# costs a context variable lookup and no sampler thread exists.
+#
+# Stage totals over every profiled request so far:
+#
+#   python LLM_Code/profiler.py stats
+#
+# and cat the .folded files together (or pass them to flamegraph.pl) for one
+# flamegraph of many requests.
+
+PROFILE_ALWAYS = os.getenv("ASSISTANT_PROFILE", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(__file__), "profiles"))
+
+# deepest stack kept per sample
+MAX_STACK_DEPTH = 128
+
+# the profile of the request running in this context, and the stage path inside it
+_profile = contextvars.ContextVar("profile", default=None)
+_path = contextvars.ContextVar("profile_path", default=())
+
+
+def frame_label(code) -> str:
+    # the function, not the line, so samples inside one function add up
+    name = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return name.replace(";", ",")
+
+
+def fold(thread_name: str, frame) -> str:
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join([f"thread {thread_name}"] + labels[::-1])
+
+
+class RequestProfile:
+    def __init__(self, request_id: str, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.request_id = request_id
+        self.interval = interval_ms / 1000
+        self.samples = Counter()
+        self.n_samples = 0
+        self.stages = {}  # "parent/child" path -> {"calls", "wall_sec", "cpu_sec"}
+        self._threads = set()  # idents of the threads working for this request
+        self._lock = threading.Lock()  # stages and _threads are updated from pool threads too
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+
+    # --- sampling ---
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                working = self._threads - {own}
+            if working - names.keys():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for ident in working:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.samples[fold(names.get(ident, str(ident)), frame)] += 1
+            self.n_samples += 1
+
+    @contextmanager
+    def working(self):
+        """
+        Sample the current thread while the block runs (a pool task for this request).
+        """
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads.add(ident)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._threads.discard(ident)
+
+    # --- stages ---
+
+    @contextmanager
+    def stage(self, name: str):
+        names = _path.get() + (name,)
+        token = _path.set(names)
+        path = "/".join(names)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            _path.reset(token)
+            with self._lock:
+                entry = self.stages.setdefault(path, {"calls": 0, "wall_sec": 0.0, "cpu_sec": 0.0})
+                entry["calls"] += 1
+                entry["wall_sec"] += wall
+                entry["cpu_sec"] += cpu
+
+    # --- lifecycle ---
+
+    def __enter__(self):
+        self._token = _profile.set(self)
+        self._threads.add(threading.get_ident())
+        self._started_at = time.time()
+        self._wall, self._cpu, self._process_cpu = time.perf_counter(), time.thread_time(), time.process_time()
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._sampler.join()
+        _profile.reset(self._token)
+        try:
+            self.write()
+        except OSError as e:
+            print(f"Could not write profile: {e}")
+        return False
+
+    def write(self) -> str:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, self.request_id)
+
+        with open(base + ".folded", "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+        wall = time.perf_counter() - self._wall
+        trace = {
+            "request_id": self.request_id,
+            "started_at": self._started_at,
+            "wall_sec": round(wall, 4),
+            # request thread only vs every thread of the process (LLM/embedding pools included)
+            "cpu_sec": round(time.thread_time() - self._cpu, 4),
+            "process_cpu_sec": round(time.process_time() - self._process_cpu, 4),
+            "interval_ms": self.interval * 1000,
+            "samples": self.n_samples,
+            "stages": [
+                {
+                    "stage": path,
+                    "calls": s["calls"],
+                    "wall_sec": round(s["wall_sec"], 4),
+                    "cpu_sec": round(s["cpu_sec"], 4),
+                    "wait_sec": round(max(0.0, s["wall_sec"] - s["cpu_sec"]), 4),
+                }
+                for path, s in self.stages.items()
+            ],
+            "flamegraph": os.path.basename(base + ".folded"),
+        }
+        with open(base + ".trace.json", "w", encoding="utf-8") as f:
+            json.dump(trace, f, indent=2)
+
+        print(f"Profile of {self.request_id}: {wall:.2f}s wall, {self.n_samples} samples -> {base}.trace.json")
+        return base + ".trace.json"
+
+
+def request_profile(request_id: str, force: bool = False):
+    """
+    A RequestProfile for this request if profiling is forced, switched on by
+    ASSISTANT_PROFILE or sampled by PROFILE_SAMPLE_RATE; otherwise a no-op
+    context manager.
+    """
+    if force or PROFILE_ALWAYS or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE):
+        return RequestProfile(request_id)
+    return nullcontext()
+
+
+def stage(name: str):
+    """
+    Time a block as stage name of the request being profiled in this context.
+    """
+    profile = _profile.get()
+    return profile.stage(name) if profile else nullcontext()
+
+
+def propagate(fn):
+    """
+    fn as a pool task of the current request: it runs with the request's
+    profile and stage path, and its thread is sampled while it runs. fn
+    itself when the request is not profiled.
+    """
+    profile = _profile.get()
+    if profile is None:
+        return fn
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        with profile.working():
+            return context.run(fn, *args, **kwargs)
+
+    return run
+
+
+def profile_stats() -> dict:
+    """
+    Per stage over all traces in PROFILE_DIR: requests it ran in, and mean
+    wall / CPU / waiting seconds per request, slowest stage first.
+    """
+    traces = []
+    try:
+        names = [n for n in os.listdir(PROFILE_DIR) if n.endswith(".trace.json")]
+    except OSError:
+        names = []
+    for name in names:
+        try:
+            with open(os.path.join(PROFILE_DIR, name), "r", encoding="utf-8") as f:
+                traces.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    if not traces:
+        return {"requests": 0}
+
+    totals = {}
+    for t in traces:
+        for s in t["stages"]:
+            entry = totals.setdefault(s["stage"], {"requests": 0, "wall_sec": 0.0, "cpu_sec": 0.0, "wait_sec": 0.0})
+            entry["requests"] += 1
+            for key in ("wall_sec", "cpu_sec", "wait_sec"):
+                entry[key] += s[key]
+
+    stages = {
+        path: {
+            "requests": e["requests"],
+            "wall_sec_mean": round(e["wall_sec"] / e["requests"], 4),
+            "cpu_sec_mean": round(e["cpu_sec"] / e["requests"], 4),
+            "wait_sec_mean": round(e["wait_sec"] / e["requests"], 4),
+        }
+        for path, e in sorted(totals.items(), key=lambda item: -item[1]["wall_sec"])
+    }
+    return {
+        "requests": len(traces),
+        "wall_sec_mean": round(sum(t["wall_sec"] for t in traces) / len(traces), 4),
+        "cpu_sec_mean": round(sum(t["cpu_sec"] for t in traces) / len(traces), 4),
+        "stages": stages,
+    }
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "stats":
+        print(json.dumps(profile_stats(), indent=2))
+        return
+
+    print("Usage: python LLM_Code/profiler.py stats")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
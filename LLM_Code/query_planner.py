@@ -0,0 +1,324 @@
+from __future__ import annotations
+import builtins
+import json
+import os
+import sys
+import time
+from functools import lru_cache
+from typing import Callable
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from Database_Code.features import ERROR_TYPE_RE, REPO_KEYWORDS
+
+# -----------------------------
+# Local (CPU-only) query planner
+# -----------------------------
+# Classifies the error into the library/repo it most likely comes from and writes
+# the retrieval queries itself. The LLM query expander is only called when the
+# classifier is not confident, which saves a full LLM round trip per request.
+#
+# The model is trained offline and saved next to this file:
+#   python LLM_Code/query_planner.py          (cases + corpus problem statements)
+#   python LLM_Code/query_planner.py cases    (cases only, no database)
+# Training also picks the confidence threshold from held-out predictions
+# (TARGET_PRECISION). Without a saved model every request uses the LLM
+# expander; requests never train a model or import scikit-learn.
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "query_planner.joblib")
+LOG_PATH = os.getenv("QUERY_PLANNER_LOG", os.path.join(os.path.dirname(__file__), "query_planner_log.jsonl"))
+
+# Below this predicted-class probability the LLM expander is used instead.
+# Unset: the threshold calibrated when the model was trained.
+THRESHOLD_OVERRIDE = os.getenv("QUERY_PLANNER_THRESHOLD")
+
+# calibration: lowest threshold whose held-out predictions are this precise
+TARGET_PRECISION = float(os.getenv("QUERY_PLANNER_TARGET_PRECISION", "0.9"))
+MIN_THRESHOLD = 0.5
+CALIBRATION_FOLDS = 5
+
+# every label is downsampled to at most this many examples, so the corpus's
+# largest repos (and the builtin exception docstrings) do not drown the rest
+MAX_PER_CLASS = 60
+
+# Label for plain Python errors that do not belong to any SWE-bench repo.
+PYTHON_LABEL = "python"
+
+CASE_FILES = [
+    os.path.join(PROJECT_ROOT, "Testing", "benchmark_cases.json"),
+    os.path.join(PROJECT_ROOT, "Demo", "demo_cases.json"),
+]
+
+
+def planner_text(code: str, error: str) -> str:
+    return f"{error}\n{(code or '')[:1200]}"
+
+
+def case_label(case: dict) -> str:
+    """
+    Benchmark categories start with the library name (e.g. "django_paginator_...").
+    Demo cases have no category and are plain Python errors.
+    """
+    category = (case.get("expected_category") or "").lower()
+    for key, repo in REPO_KEYWORDS.items():
+        if category.startswith(key):
+            return repo
+    return PYTHON_LABEL
+
+
+def training_examples(conn=None) -> tuple[list[str], list[str]]:
+    texts, labels = [], []
+
+    for path in CASE_FILES:
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for case in json.load(f):
+                texts.append(planner_text(case["code"], case["error"]))
+                labels.append(case_label(case))
+    n_cases = len(texts)
+
+    # every builtin exception (name + docstring) is a small example of a plain Python error
+    for name, obj in vars(builtins).items():
+        if isinstance(obj, type) and issubclass(obj, BaseException):
+            texts.append(f"{name}: {obj.__doc__ or ''}")
+            labels.append(PYTHON_LABEL)
+
+    if conn is not None:
+        with conn.cursor() as cur:
+            cur.execute("SELECT repo, problem_statement FROM swebench_data;")
+            for repo, problem_statement in cur.fetchall():
+                texts.append((problem_statement or "")[:2000])
+                labels.append(repo)
+
+    return balance(texts, labels, keep_first=n_cases)
+
+
+def balance(texts: list[str], labels: list[str], keep_first: int = 0,
+            max_per_class: int = MAX_PER_CLASS) -> tuple[list[str], list[str]]:
+    """
+    Keep at most max_per_class examples of every label: the first keep_first
+    examples (benchmark / demo cases) always, the rest sampled with a fixed seed.
+    """
+    import random
+
+    rng = random.Random(0)
+    keep = list(range(keep_first))
+    counts = {}
+    for i in range(keep_first):
+        counts[labels[i]] = counts.get(labels[i], 0) + 1
+
+    by_label = {}
+    for i in range(keep_first, len(labels)):
+        by_label.setdefault(labels[i], []).append(i)
+    for label, idx in by_label.items():
+        room = max(0, max_per_class - counts.get(label, 0))
+        keep += idx if len(idx) <= room else rng.sample(idx, room)
+
+    keep.sort()
+    return [texts[i] for i in keep], [labels[i] for i in keep]
+
+
+def build_model():
+    from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import FeatureUnion, Pipeline
+
+    return Pipeline([
+        ("features", FeatureUnion([
+            ("tfidf", TfidfVectorizer(
+                lowercase=True,
+                stop_words="english",
+                token_pattern=r"[A-Za-z_][A-Za-z0-9_]+",
+                sublinear_tf=True,
+                max_features=50000,
+            )),
+            # the library named in imports / traceback paths is the strongest
+            # signal, and one that carries over from a handful of examples
+            ("library", CountVectorizer(
+                lowercase=True,
+                token_pattern=r"[A-Za-z][A-Za-z-]+",
+                vocabulary=sorted(REPO_KEYWORDS),
+                binary=True,
+            )),
+        ])),
+        ("clf", LogisticRegression(max_iter=1000, class_weight="balanced", C=10.0)),
+    ])
+
+
+def calibrate_threshold(texts: list[str], labels: list[str]) -> tuple[float, dict]:
+    """
+    Out-of-fold predictions for every example; returns the lowest confidence
+    threshold at which the predictions above it reach TARGET_PRECISION, and
+    the precision / coverage there.
+    """
+    import numpy as np
+    from sklearn.model_selection import KFold
+
+    confidences, correct = [], []
+    folds = KFold(n_splits=CALIBRATION_FOLDS, shuffle=True, random_state=0)
+    for train_idx, test_idx in folds.split(texts):
+        model = build_model().fit([texts[i] for i in train_idx], [labels[i] for i in train_idx])
+        probs = model.predict_proba([texts[i] for i in test_idx])
+        for i, p in zip(test_idx, probs):
+            confidences.append(float(p.max()))
+            correct.append(model.classes_[p.argmax()] == labels[i])
+
+    order = np.argsort(confidences)[::-1]
+    conf = np.asarray(confidences)[order]
+    precision = np.cumsum(np.asarray(correct)[order]) / np.arange(1, len(conf) + 1)
+
+    # the most predictions (lowest threshold) that are still TARGET_PRECISION precise
+    ok = np.flatnonzero((precision >= TARGET_PRECISION) & (conf >= MIN_THRESHOLD))
+    if not ok.size:
+        # never precise enough: the local path stays off
+        return 1.01, {"held_out_precision": None, "held_out_coverage": 0.0}
+    n = int(ok[-1])
+    return float(conf[n]), {
+        "held_out_precision": round(float(precision[n]), 4),
+        "held_out_coverage": round((n + 1) / len(conf), 4),
+    }
+
+
+def train_planner(conn=None) -> dict:
+    """
+    Fit a TF-IDF + library-mention logistic regression classifier and
+    calibrate its threshold. With a connection the corpus problem statements
+    are added to the benchmark/demo cases. Returns {"model", "threshold", ...}.
+    """
+    texts, labels = training_examples(conn)
+    threshold, info = calibrate_threshold(texts, labels)
+    model = build_model().fit(texts, labels)
+    return dict(info, model=model, threshold=threshold, examples=len(texts))
+
+
+@lru_cache(maxsize=None)
+def load_planner() -> dict | None:
+    """
+    The planner saved by `python LLM_Code/query_planner.py`, or None when
+    there is none (then every request uses the LLM expander).
+    """
+    if not os.path.exists(MODEL_PATH):
+        return None
+    import joblib
+
+    return joblib.load(MODEL_PATH)
+
+
+def planner_threshold(planner: dict) -> float:
+    return float(THRESHOLD_OVERRIDE) if THRESHOLD_OVERRIDE else planner["threshold"]
+
+
+def top_terms(model, text: str, n: int = 6, exclude: set[str] = frozenset()) -> list[str]:
+    tfidf = dict(model.named_steps["features"].transformer_list)["tfidf"]
+    row = tfidf.transform([text])
+    vocab = tfidf.get_feature_names_out()
+    ranked = sorted(zip(row.data, row.indices), reverse=True)
+    return [vocab[i] for _, i in ranked if vocab[i] not in exclude][:n]
+
+
+def local_queries(model, code: str, error: str, label: str) -> list[str]:
+    """
+    Three short GitHub-issue-style queries, same shape as the LLM expander output.
+    """
+    error_line = (error or "").strip().splitlines()[-1] if (error or "").strip() else ""
+    match = ERROR_TYPE_RE.search(error or "")
+    error_type = match.group(1) if match else "error"
+    library = "Python" if label == PYTHON_LABEL else label.split("/")[-1]
+    terms = " ".join(top_terms(model, planner_text(code, error), exclude={error_type.lower()}))
+
+    return [
+        f"{library} {error_line}"[:120].strip(),
+        f"{library} {error_type} when {terms}".strip(),
+        f"{terms} raises {error_type}".strip(),
+    ]
+
+
+def plan_queries(
+    code: str,
+    error: str,
+    fallback: Callable[[str, str], list[str]],
+) -> tuple[list[str], dict]:
+    """
+    Return (queries, decision). fallback is the LLM expander and is only
+    called when there is no trained planner or its confidence is below the
+    threshold.
+    """
+    start = time.time()
+
+    label, confidence, threshold, model = PYTHON_LABEL, 0.0, None, None
+    try:
+        planner = load_planner()
+        if planner is not None:
+            model, threshold = planner["model"], planner_threshold(planner)
+            probs = model.predict_proba([planner_text(code, error)])[0]
+            best = probs.argmax()
+            label, confidence = str(model.classes_[best]), float(probs[best])
+    except Exception as e:
+        print(f"Query planner unavailable, using LLM expansion: {e}")
+        model = None
+
+    if model is not None and confidence >= threshold:
+        path = "local"
+        queries = local_queries(model, code, error, label)
+    else:
+        path = "llm"
+        queries = fallback(code, error)
+
+    decision = {
+        "path": path,
+        "label": label,
+        "confidence": round(confidence, 4),
+        "threshold": threshold,
+        "queries": queries,
+        "planning_time_sec": round(time.time() - start, 4),
+    }
+    print(f"Query planner: {path} (label={label}, confidence={confidence:.2f})")
+    return queries, decision
+
+
+def log_decision(decision: dict, retrieval_time: float, distances: list[float]):
+    """
+    Append one planner decision with the latency and retrieval quality of the
+    path that was taken (lower distance = closer neighbours).
+    """
+    record = dict(
+        decision,
+        timestamp=time.time(),
+        retrieval_time_sec=round(retrieval_time, 4),
+        best_distance=round(min(distances), 6) if distances else None,
+        mean_distance=round(sum(distances) / len(distances), 6) if distances else None,
+    )
+    try:
+        with open(LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"Could not write query planner log: {e}")
+
+
+def main():
+    import joblib
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "cases":
+        planner = train_planner()
+    else:
+        from Database_Code.db import connection
+
+        conn = connection()
+        try:
+            planner = train_planner(conn)
+        finally:
+            conn.close()
+
+    joblib.dump(planner, MODEL_PATH)
+    print(
+        f"Trained query planner on {planner['examples']} examples, {len(planner['model'].classes_)} labels; "
+        f"threshold {planner['threshold']:.2f} (held-out precision {planner['held_out_precision']}, "
+        f"coverage {planner['held_out_coverage']}), saved to {MODEL_PATH}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+from __future__ import annotations
+import ast
+import builtins
+import difflib
+import re
+from typing import Callable, Optional
+
+# -----------------------------
+# Local fast path for textbook Python errors
+# -----------------------------
+# Parses the traceback, inspects the offending line with the AST and fills a
+# template in the same "Cause / Why it happens / Fix / Corrected code" format
+# as rag_answer. Returns None when no rule matches so the caller falls back to
+# the full RAG pipeline.
+
+EXCEPTION_LINE_RE = re.compile(r"^([A-Za-z_][\w.]*)(?::\s?(.*))?$")
+FRAME_RE = re.compile(r'^\s*File "(.+?)", line (\d+)')
+
+
+def parse_error(error: str) -> tuple[str, str]:
+    """
+    Return (exception type, message) from the last line of a traceback,
+    e.g. ("ZeroDivisionError", "division by zero").
+    """
+    lines = [l.strip() for l in (error or "").strip().splitlines() if l.strip()]
+    if not lines:
+        return "", ""
+    match = EXCEPTION_LINE_RE.match(lines[-1])
+    if not match:
+        return "", ""
+    return match.group(1).split(".")[-1], (match.group(2) or "").strip()
+
+
+def error_lines(error: str, line_nums: str = "") -> list[int]:
+    """
+    Candidate lines that raised, deepest frame first: the extension's
+    comma-separated line numbers if given, else the traceback frames.
+    """
+    nums = [int(n) for n in re.findall(r"\d+", line_nums or "")]
+    if not nums:
+        nums = [int(m.group(2)) for m in map(FRAME_RE.match, (error or "").splitlines()) if m]
+    return list(dict.fromkeys(reversed(nums)))
+
+
+def nodes_on_line(tree: ast.AST, lineno: int, node_type) -> list:
+    return [
+        n for n in ast.walk(tree)
+        if isinstance(n, node_type) and getattr(n, "lineno", None) == lineno
+    ]
+
+
+def replace_node(code: str, node: ast.AST, new_text: str) -> str:
+    """
+    Replace the source of a single-line node. AST column offsets are UTF-8 byte
+    offsets, so the line is edited as bytes.
+    """
+    lines = code.splitlines(keepends=True)
+    raw = lines[node.lineno - 1].encode("utf-8")
+    raw = raw[:node.col_offset] + new_text.encode("utf-8") + raw[node.end_col_offset:]
+    lines[node.lineno - 1] = raw.decode("utf-8")
+    return "".join(lines)
+
+
+def insert_before(code: str, lineno: int, new_lines: list[str]) -> str:
+    lines = code.splitlines(keepends=True)
+    target = lines[lineno - 1]
+    indent = target[:len(target) - len(target.lstrip())]
+    lines[lineno - 1:lineno - 1] = [f"{indent}{l}\n" for l in new_lines]
+    return "".join(lines)
+
+
+def enclosing_statement(tree: ast.AST, node: ast.AST) -> Optional[ast.stmt]:
+    """
+    Innermost statement containing node, so code can be inserted before it
+    even when node sits on a continuation line of a multi-line statement.
+    """
+    best = None
+    for stmt in ast.walk(tree):
+        if isinstance(stmt, ast.stmt) and stmt.lineno <= node.lineno <= stmt.end_lineno:
+            if best is None or (stmt.lineno, -stmt.end_lineno) > (best.lineno, -best.end_lineno):
+                best = stmt
+    return best
+
+
+def parses(code: str) -> bool:
+    try:
+        ast.parse(code)
+    except SyntaxError:
+        return False
+    return True
+
+
+def defined_names(tree: ast.AST) -> set[str]:
+    names = set(dir(builtins))
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, ast.alias):
+            names.add((node.asname or node.name).split(".")[0])
+    return names
+
+
+# -----------------------------
+# Rules
+# -----------------------------
+# Each rule gets the parsed context and returns the answer sections as a dict,
+# or None if it cannot say anything more specific than the general pipeline.
+
+def zero_division(ctx: dict) -> Optional[dict]:
+    tree, line, code = ctx["tree"], ctx["line"], ctx["code"]
+    ops = (ast.Div, ast.FloorDiv, ast.Mod)
+    divisions = [n for n in nodes_on_line(tree, line, ast.BinOp) if isinstance(n.op, ops)]
+    divisions += [n for n in nodes_on_line(tree, line, ast.AugAssign) if isinstance(n.op, ops)]
+    # a literal 0 needs no guard; leave those to the general pipeline
+    divisions = [
+        n for n in divisions
+        if not isinstance(n.value if isinstance(n, ast.AugAssign) else n.right, ast.Constant)
+    ]
+    if not divisions:
+        return None
+
+    node = divisions[0]
+    denominator = ast.get_source_segment(code, node.value if isinstance(node, ast.AugAssign) else node.right)
+    statement = enclosing_statement(tree, node)
+    at = statement.lineno if statement else line
+    corrected = insert_before(code, at, [
+        f"if {denominator} == 0:",
+        f"    raise ValueError(\"{denominator} must not be zero\")",
+    ])
+    if code.splitlines()[at - 1].lstrip().startswith("elif"):
+        # a guard before an elif would split the if chain
+        corrected = None
+    return {
+        "cause": f"`{denominator}` is 0 when line {line} divides by it.",
+        "why": "Python raises ZeroDivisionError for /, // and % when the right-hand operand is zero; "
+               "it never returns inf or NaN for ints.",
+        "fix": f"Check `{denominator}` before dividing (or make sure the caller never passes 0) "
+               "and decide what the function should do in that case.",
+        # the guard goes before the whole statement; answer without code if that still does not parse
+        "code": corrected if corrected and parses(corrected) else None,
+    }
+
+
+def name_error(ctx: dict) -> Optional[dict]:
+    match = re.search(r"name '(\w+)' is not defined", ctx["message"])
+    if not match:
+        return None
+    missing, line = match.group(1), ctx["line"]
+
+    candidates = defined_names(ctx["tree"]) - {missing}
+    close = [c for c in candidates if c.lower() == missing.lower()]
+    close = close or difflib.get_close_matches(missing, candidates, n=1, cutoff=0.75)
+
+    if not close:
+        return {
+            "cause": f"`{missing}` is used on line {line} but never assigned or imported.",
+            "why": "Python looks names up in the local, enclosing, global and builtin scopes at run time; "
+                   "if none of them defines the name, NameError is raised.",
+            "fix": f"Define `{missing}` before line {line}, import it, or pass it in as a parameter.",
+            "code": None,
+        }
+
+    fixed = close[0]
+    nodes = [n for n in nodes_on_line(ctx["tree"], line, ast.Name) if n.id == missing]
+    corrected = ctx["code"]
+    for node in sorted(nodes, key=lambda n: n.col_offset, reverse=True):
+        corrected = replace_node(corrected, node, fixed)
+
+    return {
+        "cause": f"`{missing}` on line {line} is a typo for `{fixed}`.",
+        "why": "Names are case-sensitive and must match exactly; "
+               f"`{missing}` is a different, undefined name.",
+        "fix": f"Use `{fixed}` instead of `{missing}`.",
+        "code": corrected if nodes else None,
+    }
+
+
+def not_callable(ctx: dict) -> Optional[dict]:
+    match = re.search(r"'(\w+)' object is not callable", ctx["message"])
+    if not match:
+        return None
+    type_name, line = match.group(1), ctx["line"]
+
+    assigned = {
+        n.id for n in ast.walk(ctx["tree"])
+        if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store)
+    }
+    calls = [
+        n for n in nodes_on_line(ctx["tree"], line, ast.Call)
+        if isinstance(n.func, ast.Name) and n.func.id in assigned
+    ]
+    shadowed = [n.func.id for n in calls if n.func.id in dir(builtins)]
+    if shadowed:
+        return {
+            "cause": f"`{shadowed[0]}` was reassigned to a {type_name}, hiding the builtin function.",
+            "why": "Assigning to a builtin name (list, str, sum, ...) shadows it for the rest of the scope.",
+            "fix": f"Rename the variable that is assigned to `{shadowed[0]}`.",
+            "code": None,
+        }
+
+    calls = [n for n in calls if len(n.args) == 1 and not n.keywords]
+    if type_name in ("list", "tuple", "dict", "str") and calls:
+        call = calls[0]
+        name = call.func.id
+        index = ast.get_source_segment(ctx["code"], call.args[0])
+        return {
+            "cause": f"`{name}({index})` on line {line} calls the {type_name} `{name}` like a function.",
+            "why": f"Round brackets call an object; a {type_name} is indexed with square brackets.",
+            "fix": f"Use `{name}[{index}]` to get the element.",
+            "code": replace_node(ctx["code"], call, f"{name}[{index}]"),
+        }
+    return None
+
+
+def str_concat(ctx: dict) -> Optional[dict]:
+    match = re.search(r'can only concatenate str \(not "(\w+)"\) to str', ctx["message"])
+    if not match:
+        return None
+    type_name, line = match.group(1), ctx["line"]
+
+    adds = [n for n in nodes_on_line(ctx["tree"], line, ast.BinOp) if isinstance(n.op, ast.Add)]
+    if not adds:
+        return None
+    operand = adds[0].right
+    segment = ast.get_source_segment(ctx["code"], operand)
+    return {
+        "cause": f"`{segment}` on line {line} is of type {type_name}, and `+` cannot join it to a str.",
+        "why": "Python does not convert types implicitly when concatenating strings.",
+        "fix": f"Convert it with `str({segment})` or use an f-string.",
+        "code": replace_node(ctx["code"], operand, f"str({segment})"),
+    }
+
+
+def index_error(ctx: dict) -> Optional[dict]:
+    if "index out of range" not in ctx["message"]:
+        return None
+    line = ctx["line"]
+    subs = nodes_on_line(ctx["tree"], line, ast.Subscript)
+    target = ast.get_source_segment(ctx["code"], subs[0].value) if subs else "the sequence"
+    index = ast.get_source_segment(ctx["code"], subs[0].slice) if subs else "the index"
+    return {
+        "cause": f"`{index}` is past the end of `{target}` on line {line}.",
+        "why": "Valid indexes run from 0 to len(seq) - 1 (or -len(seq) to -1); "
+               "anything else raises IndexError.",
+        "fix": f"Check `len({target})` first, or fix the loop/range that produced `{index}` "
+               "(a common cause is range(len(x) + 1) or starting at 1).",
+        "code": None,
+    }
+
+
+def key_error(ctx: dict) -> Optional[dict]:
+    line, key = ctx["line"], ctx["message"]
+    subs = [
+        n for n in nodes_on_line(ctx["tree"], line, ast.Subscript)
+        if isinstance(n.ctx, ast.Load)
+    ]
+    # the subscript whose literal key is the one in the message; otherwise the
+    # only one with a computed key (literals that differ cannot have raised)
+    literal = [n for n in subs if isinstance(n.slice, ast.Constant)]
+    candidates = [n for n in literal if repr(n.slice.value) == key]
+    if not candidates:
+        candidates = [n for n in subs if n not in literal]
+    if len(candidates) != 1:
+        return None
+    node = candidates[0]
+    mapping = ast.get_source_segment(ctx["code"], node.value)
+    index = ast.get_source_segment(ctx["code"], node.slice)
+    return {
+        "cause": f"The key {key or index} is not in `{mapping}` on line {line}.",
+        "why": "Indexing a dict with [] raises KeyError when the key is missing.",
+        "fix": f"Check `{index} in {mapping}` first, or use `{mapping}.get({index})` with a default.",
+        "code": replace_node(ctx["code"], node, f"{mapping}.get({index})"),
+    }
+
+
+def none_attribute(ctx: dict) -> Optional[dict]:
+    match = re.search(r"'NoneType' object has no attribute '(\w+)'", ctx["message"])
+    if not match:
+        return None
+    return {
+        "cause": f"A value used on line {ctx['line']} is None, so `.{match.group(1)}` does not exist.",
+        "why": "Functions without a return statement, and in-place methods such as list.sort() "
+               "or list.append(), return None.",
+        "fix": "Make sure the value is assigned from something that returns an object "
+               "(e.g. use sorted(x) instead of x.sort()), or check for None first.",
+        "code": None,
+    }
+
+
+def missing_module(ctx: dict) -> Optional[dict]:
+    match = re.search(r"No module named '([\w.]+)'", ctx["message"])
+    if not match:
+        return None
+    module = match.group(1)
+    return {
+        "cause": f"The module `{module}` is not installed in the interpreter running this file.",
+        "why": "import searches sys.path of the current interpreter (or virtual environment) only.",
+        "fix": f"Install it (`python -m pip install {module.split('.')[0]}`) in the same environment, "
+               "or fix the spelling of the import.",
+        "code": None,
+    }
+
+
+RULES: dict[str, list[Callable[[dict], Optional[dict]]]] = {
+    "ZeroDivisionError": [zero_division],
+    "NameError": [name_error],
+    "TypeError": [not_callable, str_concat],
+    "IndexError": [index_error],
+    "KeyError": [key_error],
+    "AttributeError": [none_attribute],
+    "ModuleNotFoundError": [missing_module],
+    "ImportError": [missing_module],
+}
+
+
+def format_answer(sections: dict) -> str:
+    corrected = sections.get("code") or "No automatic rewrite; apply the fix above."
+    return (
+        f"Cause:\n{sections['cause']}\n\n"
+        f"Why it happens:\n{sections['why']}\n\n"
+        f"Fix:\n{sections['fix']}\n\n"
+        f"Corrected code:\n{corrected.rstrip()}"
+    )
+
+
+def quick_answer(code: str, error: str, line_nums: str = "") -> Optional[str]:
+    """
+    Return a templated answer for a known error pattern, or None.
+    """
+    exc_type, message = parse_error(error)
+    rules = RULES.get(exc_type)
+    if not rules:
+        return None
+
+    try:
+        tree = ast.parse(code or "")
+    except SyntaxError:
+        return None
+    n_lines = len((code or "").splitlines())
+
+    for line in error_lines(error, line_nums):
+        if not 1 <= line <= n_lines:
+            continue
+        ctx = {"code": code, "tree": tree, "line": line, "type": exc_type, "message": message}
+        for rule in rules:
+            try:
+                sections = rule(ctx)
+            except Exception:
+                # a rule that trips over unusual code must never break the request
+                sections = None
+            if sections:
+                return format_answer(sections)
+    return None
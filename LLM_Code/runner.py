@@ -0,0 +1,479 @@
+from __future__ import annotations
+import atexit
+import gc
+import io
+import json
+import linecache
+import os
+import runpy
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import types
+
+# What the user's script would get from a plain `python file.py`: the
+# extension's environment and the interpreter's default import path, captured
+# before the assistant adds PROJECT_ROOT and its .env (load_dotenv) to them.
+USER_ENVIRON = dict(os.environ)
+USER_SYS_PATH = list(sys.path[1:])
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from LLM_Code.deadline import Cancelled, Deadline
+
+# -----------------------------
+# Warm runner (fork server)
+# -----------------------------
+# The extension starts this once and keeps it alive:
+#   python LLM_Code/runner.py serve
+# It imports the assistant pipeline (and RUNNER_PRELOAD modules) up front, then
+# for every run request forks itself and executes the user's file in the
+# child, so neither the user's script nor the assistant pays for interpreter
+# startup. A failing run is captured as structured frames (file, line,
+# function, source line, a small snapshot of the locals) and answered right
+# here, without a second process or parsing stderr.
+#
+# Without fork (Windows) each run is a fresh `python runner.py exec <file>`;
+# the frames and the warm assistant are the same, only the user's script pays
+# for startup.
+#
+# Answers are generated on a thread per request, so the next run never waits
+# for them; a run of a file cancels any answer still in progress for that
+# file (LLM_Code/cancellation.py), as does an explicit cancel message.
+#
+# Protocol: one JSON object per line.
+#   stdin:  {"id", "file", "workspace"?, "profile"?}
+#           (workspace: the file's project folder; profile: LLM_Code/profiler.py)
+#           {"cancel": id}
+#   stdout: {"event": "ready"}
+#           {"id", "event": "stdout" | "stderr", "text"}
+#           {"id", "event": "exit", "code", "failure", "run_sec"}
+#           {"id", "event": "quick_answer" | "answer", "text"}
+#           {"id", "event": "cancelled", "stage", "reason"}
+#           {"id", "event": "done"}
+
+# Comma-separated modules imported before forking, e.g. "numpy,pandas",
+# so user scripts that import them start instantly too.
+RUNNER_PRELOAD = [m.strip() for m in os.getenv("RUNNER_PRELOAD", "").split(",") if m.strip()]
+
+USE_FORK = hasattr(os, "fork") and os.getenv("RUNNER_FORK", "1") == "1"
+
+# locals snapshot limits, per frame
+LOCALS_MAX = 15
+LOCALS_REPR_CHARS = 120
+SKIPPED_LOCAL_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+# how long a new run waits for a cancelled answer of the same file to wind down
+CANCEL_JOIN_SEC = 1.0
+
+_emit_lock = threading.Lock()
+_protocol_out = sys.stdout
+
+# request id -> {"file", "deadline", "thread"} of the answers in progress
+_answering = {}
+_answering_lock = threading.Lock()
+
+
+def emit(**event):
+    with _emit_lock:
+        _protocol_out.write(json.dumps(event) + "\n")
+        _protocol_out.flush()
+
+
+# -----------------------------
+# Child side: run the file, capture the failure
+# -----------------------------
+
+def safe_repr(value) -> str:
+    try:
+        text = repr(value)
+    except Exception as e:
+        text = f"<repr failed: {type(e).__name__}>"
+    return text if len(text) <= LOCALS_REPR_CHARS else text[:LOCALS_REPR_CHARS] + "..."
+
+
+def snapshot_locals(frame_locals: dict) -> dict:
+    """
+    The user's variables in a frame: no dunders, modules, functions or classes.
+    """
+    snapshot = {}
+    for name, value in frame_locals.items():
+        if name.startswith("__") or isinstance(value, SKIPPED_LOCAL_TYPES):
+            continue
+        snapshot[name] = safe_repr(value)
+        if len(snapshot) >= LOCALS_MAX:
+            break
+    return snapshot
+
+
+def capture_failure(exc: BaseException, path: str) -> dict:
+    """
+    Structured traceback of an exception raised by the file at path. Runner
+    and runpy frames are dropped, so the text matches what `python path`
+    would have printed.
+    """
+    tb = exc.__traceback__
+    while tb is not None and os.path.abspath(tb.tb_frame.f_code.co_filename) != path:
+        tb = tb.tb_next
+
+    frames = []
+    for frame, line in traceback.walk_tb(tb):
+        file = os.path.abspath(frame.f_code.co_filename)
+        in_file = file == path
+        frames.append({
+            "file": file,
+            "line": line,
+            "function": frame.f_code.co_name,
+            "code": linecache.getline(file, line).strip(),
+            "user_file": in_file,
+            "locals": snapshot_locals(frame.f_locals) if in_file else {},
+        })
+
+    if isinstance(exc, SyntaxError) and exc.lineno and os.path.abspath(exc.filename or "") == path:
+        # compile errors have no frame of their own
+        frames.append({
+            "file": path, "line": exc.lineno, "function": "<module>",
+            "code": (exc.text or "").strip(), "user_file": True, "locals": {},
+        })
+
+    return {
+        "exc_type": type(exc).__name__,
+        "message": str(exc),
+        "frames": frames,
+        "traceback": "".join(traceback.format_exception(type(exc), exc, tb)),
+    }
+
+
+def assistant_module(module) -> bool:
+    files = [getattr(module, "__file__", None) or ""] + list(getattr(module, "__path__", None) or [])
+    return any(os.path.abspath(f).startswith(PROJECT_ROOT + os.sep) for f in files if f)
+
+
+def isolate(directory: str):
+    """
+    Give the user's script the environment, import path and module table of a
+    fresh interpreter, minus the libraries already imported (the point of the
+    warm runner): no API keys from the assistant's .env, no PROJECT_ROOT, no
+    Main / LLM_Code / Database_Code modules shadowing the user's own, and
+    none of the assistant's atexit handlers.
+    """
+    os.environ.clear()
+    os.environ.update(USER_ENVIRON)
+    sys.path[:] = [directory] + USER_SYS_PATH
+    for name, module in list(sys.modules.items()):
+        if name != "__main__" and assistant_module(module):
+            del sys.modules[name]
+    atexit._clear()
+    global _files_before
+    _files_before = {id(f) for f in open_files()}
+
+
+def open_files() -> list:
+    # type(o), not isinstance(o, ...): isinstance falls back to o.__class__,
+    # which on lazy-import proxies (scipy, sklearn, ...) imports the module
+    return [o for o in gc.get_objects() if issubclass(type(o), io.IOBase) and not o.closed]
+
+
+# open file objects that are not the script's (set by isolate)
+_files_before = set()
+
+
+def finish():
+    """
+    Interpreter shutdown as `python file.py` would do it: wait for non-daemon
+    threads, run atexit handlers, then close the files the script left open.
+    The interpreter would flush those when it clears __main__, but the runpy
+    namespace is not a module it clears (and gc can free a file's buffer after
+    its descriptor, losing the data), and a forked child skips shutdown
+    entirely (os._exit).
+    """
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread() and not thread.daemon:
+            thread.join()
+    atexit._run_exitfuncs()
+    atexit._clear()
+
+    # text wrappers before their buffers before the raw files
+    layers = (io.TextIOBase, io.BufferedIOBase, io.RawIOBase)
+    files = [f for f in open_files() if id(f) not in _files_before]
+    files.sort(key=lambda f: next((i for i, layer in enumerate(layers) if isinstance(f, layer)), len(layers)))
+    for f in files:
+        if f in (sys.stdout, sys.stderr):
+            continue
+        try:
+            f.close()
+        except Exception:
+            pass
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+
+def execute(path: str) -> tuple[int, dict | None]:
+    """
+    Run path as __main__ in this process. Returns (exit code, failure or None).
+    """
+    path = os.path.abspath(path)
+    directory = os.path.dirname(path)
+    os.chdir(directory)
+    sys.argv = [path]
+    isolate(directory)
+
+    try:
+        runpy.run_path(path, run_name="__main__")
+        return 0, None
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0, None
+        print(e.code, file=sys.stderr)
+        return 1, None
+    except BaseException as e:
+        failure = capture_failure(e, path)
+        sys.stderr.write(failure["traceback"])
+        return 1, failure
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+# -----------------------------
+# Server side
+# -----------------------------
+
+def pump(request_id: str, stream: str, f):
+    # unbuffered: forward output as soon as the script writes it
+    with f:
+        for chunk in iter(lambda: f.read(4096), b""):
+            emit(id=request_id, event=stream, text=chunk.decode("utf-8", errors="replace"))
+
+
+def run_forked(request_id: str, path: str) -> tuple[int, dict | None]:
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    res_r, res_w = os.pipe()
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    pid = os.fork()
+    if pid == 0:
+        # child: never return into the server loop
+        code = 1
+        try:
+            for fd in (out_r, err_r, res_r):
+                os.close(fd)
+            devnull = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(devnull, 0)
+            os.dup2(out_w, 1)
+            os.dup2(err_w, 2)
+            sys.stdout = open(1, "w", encoding="utf-8", errors="replace", closefd=False)
+            sys.stderr = open(2, "w", encoding="utf-8", errors="replace", closefd=False)
+            code, failure = execute(path)
+            with os.fdopen(res_w, "w", encoding="utf-8") as f:
+                json.dump(failure, f)
+            finish()
+        finally:
+            # never unwind into the server's threads and handlers
+            os._exit(code if isinstance(code, int) else 1)
+
+    for fd in (out_w, err_w, res_w):
+        os.close(fd)
+    pumps = [
+        threading.Thread(target=pump, args=(request_id, "stdout", os.fdopen(out_r, "rb", buffering=0))),
+        threading.Thread(target=pump, args=(request_id, "stderr", os.fdopen(err_r, "rb", buffering=0))),
+    ]
+    for t in pumps:
+        t.start()
+    with os.fdopen(res_r, "r", encoding="utf-8") as f:
+        result = f.read()
+    _, status = os.waitpid(pid, 0)
+    for t in pumps:
+        t.join()
+
+    failure = json.loads(result) if result else None
+    code = os.waitstatus_to_exitcode(status)
+    return code, failure
+
+
+def run_spawned(request_id: str, path: str) -> tuple[int, dict | None]:
+    fd, result_path = tempfile.mkstemp(prefix="runner_", suffix=".json")
+    os.close(fd)
+    try:
+        proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "exec", path, result_path],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0,
+            env=USER_ENVIRON,
+        )
+        pumps = [
+            threading.Thread(target=pump, args=(request_id, "stdout", proc.stdout)),
+            threading.Thread(target=pump, args=(request_id, "stderr", proc.stderr)),
+        ]
+        for t in pumps:
+            t.start()
+        code = proc.wait()
+        for t in pumps:
+            t.join()
+        with open(result_path, "r", encoding="utf-8") as f:
+            result = f.read()
+        return code, json.loads(result) if result else None
+    finally:
+        os.remove(result_path)
+
+
+def failure_line_nums(failure: dict) -> str:
+    # same order as the extension's traceback parser: outermost frame first
+    lines = [f["line"] for f in failure["frames"] if f["user_file"]]
+    return ",".join(str(n) for n in dict.fromkeys(lines))
+
+
+def failure_locals(failure: dict) -> dict:
+    # deepest frame in the user's file
+    for frame in reversed(failure["frames"]):
+        if frame["user_file"]:
+            return frame["locals"]
+    return {}
+
+
+def cancel(request_id: str, reason: str) -> bool:
+    with _answering_lock:
+        entry = _answering.get(request_id)
+    return bool(entry) and entry["deadline"].cancel(reason)
+
+
+def supersede(request_id: str, path: str):
+    """
+    Cancel the answers still running for earlier runs of path and give them
+    CANCEL_JOIN_SEC to finish.
+    """
+    with _answering_lock:
+        older = [(rid, e["thread"]) for rid, e in _answering.items() if e["file"] == path]
+    for rid, _ in older:
+        cancel(rid, f"superseded by {request_id}")
+    for _, thread in older:
+        thread.join(CANCEL_JOIN_SEC)
+
+
+def answer(request_id: str, path: str, failure: dict, deadline: Deadline, profile: bool = False,
+           workspace_root: str | None = None):
+    from Main import answer_error
+
+    fd, out_file = tempfile.mkstemp(prefix="runner_answer_", suffix=".txt")
+    os.close(fd)
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            source = f.read()
+        text = answer_error(
+            source, failure["traceback"], failure_line_nums(failure), out_file,
+            local_vars=failure_locals(failure),
+            on_quick_answer=lambda text: emit(id=request_id, event="quick_answer", text=text),
+            deadline=deadline, request_id=request_id, source="runner", profile=profile,
+            workspace_root=workspace_root,
+        )
+        emit(id=request_id, event="answer", text=text)
+    except Cancelled as e:
+        emit(id=request_id, event="cancelled", stage=e.stage, reason=e.reason)
+    except Exception as e:
+        emit(id=request_id, event="answer", text=f"[Coding Assistant] {type(e).__name__}: {e}")
+    finally:
+        os.remove(out_file)
+        with _answering_lock:
+            _answering.pop(request_id, None)
+        emit(id=request_id, event="done")
+
+
+def handle(request: dict):
+    from LLM_Code import cross_encoder
+
+    request_id, path = request["id"], os.path.abspath(request["file"])
+    supersede(request_id, path)
+
+    with _answering_lock:
+        busy = bool(_answering)
+    # forking next to a running answer thread, or the cross-encoder thread
+    # while it imports torch / loads the model, could copy one of their locks
+    # (import locks included) into the child mid-use; spawn instead until
+    # they have finished
+    busy = busy or cross_encoder.in_flight()
+    run = run_forked if USE_FORK and not busy else run_spawned
+
+    start = time.time()
+    code, failure = run(request_id, path)
+    emit(id=request_id, event="exit", code=code, failure=failure, run_sec=round(time.time() - start, 4))
+
+    if not failure:
+        emit(id=request_id, event="done")
+        return
+
+    deadline = Deadline()
+    profile = bool(request.get("profile"))
+    thread = threading.Thread(target=answer,
+                              args=(request_id, path, failure, deadline, profile, request.get("workspace")),
+                              name=f"answer-{request_id}", daemon=True)
+    with _answering_lock:
+        _answering[request_id] = {"file": path, "deadline": deadline, "thread": thread}
+    thread.start()
+
+
+def serve():
+    global _protocol_out
+
+    # keep the protocol channel clean: pipeline prints go to stderr
+    _protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+
+    import Main  # noqa: F401  (the whole assistant pipeline)
+    from LLM_Code import cross_encoder
+    from LLM_Code.code_context import count_tokens
+    from LLM_Code.query_planner import load_planner
+
+    for module in RUNNER_PRELOAD:
+        try:
+            __import__(module)
+        except ImportError as e:
+            print(f"Runner preload skipped {module}: {e}")
+    try:
+        count_tokens("warm up")  # loads the tiktoken encoding
+    except Exception as e:
+        print(f"Tokenizer not warmed: {e}")
+    # loading a saved query planner imports scikit-learn (about a second)
+    load_planner()
+    if cross_encoder.CROSS_ENCODER_ENABLED:
+        cross_encoder.warm_up()  # torch + model load, in the background
+
+    emit(event="ready", fork=USE_FORK)
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        if "cancel" in request:
+            cancel(request["cancel"], "cancelled by the client")
+            continue
+        try:
+            handle(request)
+        except Exception as e:
+            emit(id=request.get("id"), event="stderr", text=f"[runner] {type(e).__name__}: {e}\n")
+            emit(id=request.get("id"), event="done")
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "serve":
+        serve()
+        return
+
+    if len(sys.argv) >= 4 and sys.argv[1] == "exec":
+        path, result_path = sys.argv[2], os.path.abspath(sys.argv[3])
+        code, failure = execute(path)  # replaces sys.argv and the cwd
+        with open(result_path, "w", encoding="utf-8") as f:
+            json.dump(failure, f)
+        finish()
+        sys.exit(code)
+
+    print("Usage: python LLM_Code/runner.py serve | exec <file.py> <result.json>")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
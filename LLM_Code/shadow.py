@@ -0,0 +1,300 @@
+from __future__ import annotations
+import importlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+# -----------------------------
+# Shadow retrieval experiments
+# -----------------------------
+# Production retrieval serves the answer; for a sampled share of requests the
+# same inputs are handed to one or more candidate strategies that run after
+# the fact, in a detached low-priority process, so the user never waits on
+# them. For every candidate the log records its latency, the overlap of its
+# retrieved ids with production's, and the rank correlation on the ids both
+# returned.
+#
+#   SHADOW_STRATEGIES=testing,testing_cross_encoder SHADOW_SAMPLE_RATE=0.2
+#   python LLM_Code/shadow.py stats
+#
+# A strategy is a name from STRATEGIES or "module:function", called as
+# fn(conn, code, error, k, line_nums, user_question=..., corpora=...,
+# workspace_root=...) (the rest of the production request, which most
+# strategies ignore) and returning rows with instance_id first.
+
+SHADOW_STRATEGIES = [s.strip() for s in os.getenv("SHADOW_STRATEGIES", "").split(",") if s.strip()]
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0"))
+
+# nice value for the shadow process on POSIX (Windows: below-normal priority class)
+SHADOW_NICE = int(os.getenv("SHADOW_NICE", "15"))
+
+LOG_PATH = os.getenv("SHADOW_LOG", os.path.join(os.path.dirname(__file__), "shadow_log.jsonl"))
+
+
+def testing_strategy(conn, code, error, k, line_nums, **request):
+    from Testing.llm_testing import retrieve_topk_debug
+
+    return retrieve_topk_debug(conn, code, error, k=k, use_cross_encoder=False)
+
+
+def testing_cross_encoder_strategy(conn, code, error, k, line_nums, **request):
+    from Testing.llm_testing import retrieve_topk_debug
+
+    return retrieve_topk_debug(conn, code, error, k=k, use_cross_encoder=True)
+
+
+def production_strategy(conn, code, error, k, line_nums, user_question="", corpora=None, workspace_root=None):
+    # production retrieval re-run on the same inputs, e.g. to measure the noise floor of the metrics
+    from LLM_Code.llm import retrieve_topk_scored
+
+    return retrieve_topk_scored(conn, code, error, user_question, k=k, corpora=corpora,
+                                line_nums=line_nums, workspace_root=workspace_root)
+
+
+def load_cross_encoder():
+    # the shadow process starts cold: without this, torch and the model load
+    # during the timed run, every rerank misses its budget and the strategy
+    # returns the plain testing order
+    from LLM_Code import cross_encoder
+
+    cross_encoder.score_pairs("warm up", ["warm up"])
+
+
+STRATEGIES = {
+    "testing": testing_strategy,
+    "testing_cross_encoder": testing_cross_encoder_strategy,
+    "production": production_strategy,
+}
+
+# run once before a strategy's timed run
+STRATEGY_SETUP = {
+    "testing_cross_encoder": load_cross_encoder,
+}
+
+
+def resolve_strategy(name: str):
+    if name in STRATEGIES:
+        return STRATEGIES[name]
+    module, _, attr = name.partition(":")
+    if not attr:
+        raise ValueError(f"Unknown shadow strategy {name!r}")
+    return getattr(importlib.import_module(module), attr)
+
+
+# -----------------------------
+# Comparison
+# -----------------------------
+
+def overlap(production: list[str], candidate: list[str]) -> float | None:
+    """
+    Share of production's ids the candidate also retrieved (overlap@k).
+    """
+    if not production:
+        return None
+    return round(len(set(production) & set(candidate)) / len(production), 4)
+
+
+def kendall_tau(production: list[str], candidate: list[str]) -> float | None:
+    """
+    Kendall rank correlation of the ids both lists contain: 1 = same order,
+    -1 = reversed. None when fewer than two ids are shared.
+    """
+    shared = [i for i in production if i in candidate]
+    if len(shared) < 2:
+        return None
+    ranks = [candidate.index(i) for i in shared]
+    concordant = discordant = 0
+    for a in range(len(ranks)):
+        for b in range(a + 1, len(ranks)):
+            if ranks[a] < ranks[b]:
+                concordant += 1
+            else:
+                discordant += 1
+    return round((concordant - discordant) / (concordant + discordant), 4)
+
+
+# -----------------------------
+# Request side (production process)
+# -----------------------------
+
+def sampled(rate: float = SHADOW_SAMPLE_RATE) -> bool:
+    return bool(SHADOW_STRATEGIES) and random.random() < rate
+
+
+def maybe_shadow(code: str, error: str, line_nums: str, k: int, production_rows: list, latency: float,
+                 user_question: str = "", corpora: list[str] | None = None,
+                 workspace_root: str | None = None) -> bool:
+    """
+    With probability SHADOW_SAMPLE_RATE, hand this request's inputs and
+    production result to a detached shadow process. Never raises; costs the
+    request a temp file write and a process spawn.
+    """
+    if not sampled():
+        return False
+    try:
+        payload = {
+            "request_id": uuid.uuid4().hex,
+            "timestamp": time.time(),
+            "strategies": SHADOW_STRATEGIES,
+            "code": code,
+            "error": error,
+            "line_nums": line_nums,
+            "user_question": user_question,
+            "corpora": corpora,
+            "workspace_root": workspace_root,
+            "k": k,
+            "production_ids": [r[0] for r in production_rows],
+            "production_latency_sec": round(latency, 4),
+        }
+        fd, path = tempfile.mkstemp(prefix="shadow_", suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+
+        options = {"stdin": subprocess.DEVNULL, "stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+        if os.name == "nt":
+            options["creationflags"] = (
+                subprocess.DETACHED_PROCESS | subprocess.CREATE_NO_WINDOW | subprocess.BELOW_NORMAL_PRIORITY_CLASS
+            )
+        else:
+            # own session: keeps running after the extension's process exits
+            options["start_new_session"] = True
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "run", path], cwd=PROJECT_ROOT, **options)
+        return True
+    except Exception as e:
+        print(f"Shadow run not started: {e}")
+        return False
+
+
+# -----------------------------
+# Shadow side (detached process)
+# -----------------------------
+
+def log_result(record: dict):
+    try:
+        with open(LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"Could not write shadow log: {e}")
+
+
+def run_shadow(conn, payload: dict) -> list[dict]:
+    production = payload["production_ids"]
+    records = []
+    for name in payload["strategies"]:
+        record = {
+            "request_id": payload["request_id"],
+            "timestamp": payload["timestamp"],
+            "strategy": name,
+            "k": payload["k"],
+            "production_latency_sec": payload["production_latency_sec"],
+            "production_ids": production,
+        }
+        start = time.time()
+        try:
+            fn = resolve_strategy(name)
+            if name in STRATEGY_SETUP:
+                STRATEGY_SETUP[name]()
+                start = time.time()
+            rows = fn(
+                conn, payload["code"], payload["error"], payload["k"], payload["line_nums"],
+                user_question=payload.get("user_question", ""),
+                corpora=payload.get("corpora"),
+                workspace_root=payload.get("workspace_root"),
+            )
+            candidate = [r[0] for r in rows]
+            record.update({
+                "ok": True,
+                "latency_sec": round(time.time() - start, 4),
+                "candidate_ids": candidate,
+                "overlap": overlap(production, candidate),
+                "kendall_tau": kendall_tau(production, candidate),
+                "top1_match": bool(production and candidate and production[0] == candidate[0]),
+            })
+        except Exception as e:
+            conn.rollback()
+            record.update({"ok": False, "latency_sec": round(time.time() - start, 4), "error": str(e)})
+        log_result(record)
+        records.append(record)
+    return records
+
+
+def lower_priority():
+    try:
+        os.nice(SHADOW_NICE)
+    except (AttributeError, OSError):
+        pass  # Windows gets BELOW_NORMAL_PRIORITY_CLASS at spawn
+
+
+def shadow_stats() -> dict:
+    """
+    Per strategy: runs, failures, mean overlap / rank correlation, top-1
+    agreement and p50 latency next to production's p50 on the same requests.
+    """
+    import numpy as np
+
+    by_strategy = {}
+    try:
+        with open(LOG_PATH, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                by_strategy.setdefault(record["strategy"], []).append(record)
+    except OSError:
+        pass
+
+    def mean(values):
+        values = [v for v in values if v is not None]
+        return round(float(np.mean(values)), 4) if values else None
+
+    def p50(values):
+        return round(float(np.percentile(values, 50)), 4) if values else None
+
+    stats = {}
+    for name, records in by_strategy.items():
+        ok = [r for r in records if r["ok"]]
+        stats[name] = {
+            "runs": len(records),
+            "failed": len(records) - len(ok),
+            "overlap": mean([r["overlap"] for r in ok]),
+            "kendall_tau": mean([r["kendall_tau"] for r in ok]),
+            "top1_match": mean([float(r["top1_match"]) for r in ok]),
+            "latency_p50_sec": p50([r["latency_sec"] for r in ok]),
+            "production_latency_p50_sec": p50([r["production_latency_sec"] for r in ok]),
+        }
+    return stats
+
+
+def main():
+    if len(sys.argv) >= 3 and sys.argv[1] == "run":
+        from Database_Code.db import connection
+
+        lower_priority()
+        with open(sys.argv[2], "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        os.remove(sys.argv[2])
+
+        conn = connection()
+        try:
+            run_shadow(conn, payload)
+        finally:
+            conn.close()
+        return
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "stats":
+        print(json.dumps(shadow_stats(), indent=2))
+        return
+
+    print("Usage: python LLM_Code/shadow.py stats | run <payload.json>")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+from __future__ import annotations
+import keyword
+import os
+import re
+import time
+
+from LLM_Code.code_context import LIBRARY_PATH_RE
+
+# -----------------------------
+# Symbol lookups
+# -----------------------------
+# A traceback through QuerySet.filter or Axes.hist is best matched by a patch
+# that changed that function, which the embedding of a 2000-character patch
+# slice rarely captures. Identifiers from the error and the code around it are
+# looked up in patch_symbols (Schema.sql), the inverted index of the classes /
+# functions every patch touches, with one primary-key index scan. Each hit
+# scores its kind weight divided by how many patches share the symbol, and
+# symbols shared by more than SYMBOL_MAX_DF patches are ignored. The ranked
+# hits are merged with the vector results by reciprocal rank fusion.
+
+SYMBOL_MAX_DF = 25
+SYMBOL_MAX_QUERY = 60
+SYMBOL_KIND_WEIGHTS = {"method": 3.0, "function": 2.0, "class": 1.0}
+
+# reciprocal rank fusion: score = sum(weight / (RRF_K + rank)) over both lists
+RRF_K = 60
+SYMBOL_FUSION_WEIGHT = float(os.getenv("SYMBOL_FUSION_WEIGHT", "1.0"))
+
+# names that are everywhere and never point at one patch (builtins such as
+# filter or format stay: as methods they are often exactly what broke)
+COMMON_NAMES = set(keyword.kwlist) | {
+    "self", "cls", "args", "kwargs", "main", "run", "get", "set", "test", "__init__", "__call__",
+}
+
+# '  File "/.../site-packages/django/db/models/query.py", line 942, in filter'
+FRAME_FUNC_RE = re.compile(r'^\s*File "(.+?)", line \d+, in ([A-Za-z_]\w*)')
+DOTTED_RE = re.compile(r"\b([A-Za-z_]\w*(?:\.[A-Za-z_]\w*)+)")
+# 'Axes' object has no attribute 'hist'
+QUOTED_RE = re.compile(r"'([A-Za-z_]\w*)'")
+
+SYMBOL_SQL = """
+    WITH hits AS (
+        SELECT instance_id, kind, count(*) OVER (PARTITION BY symbol) AS df
+        FROM patch_symbols
+        WHERE symbol = ANY(%(symbols)s::text[])
+    ), scored AS (
+        SELECT instance_id, sum(
+            CASE kind WHEN 'method' THEN %(w_method)s WHEN 'function' THEN %(w_function)s ELSE %(w_class)s END / df
+        ) AS score
+        FROM hits
+        WHERE df <= %(max_df)s
+        GROUP BY instance_id
+    )
+    SELECT d.instance_id, d.repo, d.problem_statement, d.patch,
+           COALESCE(d.embedding <=> %(vec)s::vector, 1.0) AS distance
+    FROM scored s
+    JOIN swebench_data d USING (instance_id)
+    ORDER BY s.score DESC, distance
+    LIMIT %(k)s;
+"""
+
+
+def query_symbols(code: str, error: str) -> list[str]:
+    """
+    Identifiers that may name a patched class or function: library frames'
+    function names, dotted names in the error and code (each part after the
+    first, plus Class.attr pairs) and quoted names in the error message.
+    """
+    symbols = []
+    for m in map(FRAME_FUNC_RE.match, (error or "").splitlines()):
+        if m and LIBRARY_PATH_RE.search(m.group(1)):
+            symbols.append(m.group(2))
+
+    for dotted in DOTTED_RE.findall(f"{error}\n{code}"):
+        parts = dotted.split(".")
+        # the first part is usually a module or a variable, unless it is a class
+        symbols += parts if parts[0][:1].isupper() else parts[1:]
+        symbols += [f"{a}.{b}" for a, b in zip(parts, parts[1:]) if a[:1].isupper()]
+
+    quoted = QUOTED_RE.findall(error or "")
+    symbols += quoted
+    symbols += [f"{a}.{b}" for a, b in zip(quoted, quoted[1:]) if a[:1].isupper()]
+
+    kept = [
+        s for s in dict.fromkeys(symbols)
+        if len(s) > 2 and s not in COMMON_NAMES and not (s.startswith("__") and "." not in s)
+    ]
+    return kept[:SYMBOL_MAX_QUERY]
+
+
+def symbol_lookup(conn, code: str, error: str, vec=None, k: int = 5) -> list[tuple]:
+    """
+    Instances whose patch touched the identifiers in code / error, best first,
+    as (instance_id, repo, problem_statement, patch, distance) rows. distance
+    is to vec (the error query's embedding) when given, else 1.0.
+    """
+    symbols = query_symbols(code, error)
+    if not symbols:
+        return []
+
+    start = time.time()
+    with conn.cursor() as cur:
+        cur.execute(SYMBOL_SQL, {
+            "symbols": symbols,
+            "w_method": SYMBOL_KIND_WEIGHTS["method"],
+            "w_function": SYMBOL_KIND_WEIGHTS["function"],
+            "w_class": SYMBOL_KIND_WEIGHTS["class"],
+            "max_df": SYMBOL_MAX_DF,
+            "vec": vec,
+            "k": k,
+        })
+        rows = cur.fetchall()
+    conn.commit()
+    print(f"Symbol lookup: {len(rows)} hits for {len(symbols)} identifiers in {(time.time() - start) * 1000:.1f} ms")
+    return rows
+
+
+def fuse(vector_rows: list[tuple], symbol_rows: list[tuple], weight: float = SYMBOL_FUSION_WEIGHT) -> list[tuple]:
+    """
+    Reciprocal rank fusion of the vector results and the symbol hits, keyed
+    on instance_id; a row found by both keeps its vector-side tuple.
+    """
+    scores, rows = {}, {}
+    for rank, r in enumerate(vector_rows):
+        scores[r[0]] = scores.get(r[0], 0.0) + 1.0 / (RRF_K + rank)
+        rows.setdefault(r[0], r)
+    for rank, r in enumerate(symbol_rows):
+        scores[r[0]] = scores.get(r[0], 0.0) + weight / (RRF_K + rank)
+        rows.setdefault(r[0], r)
+    # sorted() is stable: ties keep the vector order
+    return [rows[i] for i in sorted(rows, key=lambda i: -scores[i])]
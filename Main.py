@@ -1,6 +1,21 @@
+import os
 import sys
-from Database_Code.ingest_data import connection, insert_data, run_schema
+import uuid
+from Database_Code.db import connection, run_schema
+from LLM_Code.cancellation import log_cancelled, watch_stdin
+from LLM_Code.code_context import PROMPT_CONTEXT_TOKENS, extract_context
+from LLM_Code.deadline import Cancelled, Deadline
 from LLM_Code.llm import rag_answer
+from LLM_Code.profiler import request_profile, stage
+from LLM_Code.quick_answers import quick_answer
+
+# Printed to stdout once a quick (templated) answer is in the output file, so the
+# extension can show it straight away instead of waiting for the process to exit.
+QUICK_ANSWER_MARKER = "@@QUICK_ANSWER_READY@@"
+
+# Set QUICK_ANSWER_FULL_RAG=1 to still run the full RAG answer after a quick
+# answer; it is appended to the same output file.
+FULL_RAG_AFTER_QUICK = os.getenv("QUICK_ANSWER_FULL_RAG", "0") == "1"
 
 def main():
     # Called by the extension with 4 arguments:
@@ -8,6 +23,8 @@ def main():
     # sys.argv[2] = stderr/error string
     # sys.argv[3] = comma-separated error line numbers
     # sys.argv[4] = path to output file to write LLM response to
+    # sys.argv[5] = request id (optional)
+    # sys.argv[6] = workspace folder of the file (optional)
     
 
     if len(sys.argv) >= 5:
@@ -18,25 +35,17 @@ def main():
         error     = sys.argv[2]
         line_nums = sys.argv[3]
         out_file  = sys.argv[4]
+        request_id = sys.argv[5] if len(sys.argv) >= 6 else uuid.uuid4().hex
+        workspace_root = sys.argv[6] if len(sys.argv) >= 7 and sys.argv[6] else None
 
-        question = f"""The following Python code has an error:
-        
-    {code}
-    
-    Error:
-    {error}
-    
-    Error on lines: {line_nums}
-    
-    Please explain the error and suggest a fix.
-    """
-
-        conn = connection()
-        result = rag_answer(conn, code, error, question)
-        conn.close()
-
-        with open(out_file, 'w', encoding='utf-8') as f:
-            f.write(result)
+        # a newer run of the same file makes the extension write "cancel" to stdin
+        deadline = Deadline()
+        watch_stdin(deadline)
+        try:
+            answer_error(code, error, line_nums, out_file, deadline=deadline, request_id=request_id,
+                         workspace_root=workspace_root)
+        except Cancelled:
+            pass  # superseded; nobody reads the output file
 
     else:
         # Called directly from the terminal (original behaviour)
@@ -53,7 +62,84 @@ def main():
 
 
 
+
+def build_question(code, error, line_nums, local_vars=None):
+    # the failing function/class and what it uses, not the whole file
+    context = extract_context(code, error, line_nums, PROMPT_CONTEXT_TOKENS)
+
+    question = f"""The following Python code has an error:
+        
+    {context}
+    
+    Error:
+    {error}
+    
+    Error on lines: {line_nums}
+    
+    Please explain the error and suggest a fix.
+    """
+    if local_vars:
+        # locals of the failing frame, captured by LLM_Code/runner.py
+        values = "\n".join(f"    {name} = {value}" for name, value in local_vars.items())
+        question += f"\n    Local variables at the error line:\n{values}\n"
+    return question
+
+
+def answer_error(code, error, line_nums, out_file, local_vars=None, on_quick_answer=None,
+                 deadline=None, request_id=None, source="main", profile=False, workspace_root=None):
+    """
+    Quick answer and/or full RAG answer for one failed run, written to out_file.
+    on_quick_answer is called once a quick answer is in the file (default:
+    print QUICK_ANSWER_MARKER for the extension). Cancelling deadline stops the
+    RAG answer with Cancelled, which is logged (LLM_Code/cancellation.py).
+    profile=True profiles the request (LLM_Code/profiler.py), as do
+    ASSISTANT_PROFILE and PROFILE_SAMPLE_RATE. workspace_root is the folder
+    of the user's project, searched when the workspace corpus is selected.
+    """
+    deadline = deadline or Deadline()
+    request_id = request_id or uuid.uuid4().hex
+    with request_profile(request_id, force=profile):
+        # textbook errors are answered locally in milliseconds
+        with stage("quick_answer"):
+            quick = quick_answer(code, error, line_nums)
+        if quick:
+            with open(out_file, 'w', encoding='utf-8') as f:
+                f.write(quick)
+            if on_quick_answer:
+                on_quick_answer(quick)
+            else:
+                print(QUICK_ANSWER_MARKER, flush=True)
+
+            if not FULL_RAG_AFTER_QUICK:
+                return quick
+
+        with stage("build_question"):
+            question = build_question(code, error, line_nums, local_vars)
+
+        with stage("connect"):
+            conn = connection()
+        try:
+            with stage("rag_answer"):
+                result = rag_answer(conn, code, error, question, line_nums=line_nums, deadline=deadline,
+                                    workspace_root=workspace_root)
+        except Cancelled as e:
+            log_cancelled(request_id, source, e, deadline)
+            raise
+        finally:
+            conn.close()
+
+        if quick:
+            result = f"{quick}\n\n========== Full analysis ==========\n\n{result}"
+
+        with open(out_file, 'w', encoding='utf-8') as f:
+            f.write(result)
+        return result
+
+
 def grab_database(conn):
+    # ingestion pulls in datasets/pyarrow, so only import it when rebuilding the DB
+    from Database_Code.ingest_data import insert_data
+
     run_schema(conn)
     insert_data(conn, "test")
 
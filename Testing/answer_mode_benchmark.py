@@ -0,0 +1,100 @@
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from Database_Code.db import connection
+from LLM_Code.deadline import Deadline
+from LLM_Code.llm import generate_answer, retrieve_topk_scored
+from LLM_Code.model_router import route
+from Main import build_question
+
+# Output tokens and answer latency of the full-code and diff answer modes
+# (LLM_Code/diff_answer.py) on benchmark_cases.json. Retrieval and routing run
+# once per case, so both modes answer the same prompt context with the same
+# model. Diff-mode figures include the full-mode retry when a diff is rejected.
+#
+# Usage: python Testing/answer_mode_benchmark.py [output.json]
+
+CASES_PATH = os.path.join(os.path.dirname(__file__), "benchmark_cases.json")
+
+MODES = ["full", "diff"]
+
+
+def summarize(results: list[dict], mode: str) -> dict:
+    runs = [r["modes"][mode] for r in results]
+    tokens = [r["output_tokens"] for r in runs if r["output_tokens"] is not None]
+    latency = [r["latency_sec"] for r in runs]
+
+    def pct(values, q):
+        return round(float(np.percentile(values, q)), 4) if values else None
+
+    return {
+        "cases": len(runs),
+        "output_tokens_mean": round(float(np.mean(tokens)), 1) if tokens else None,
+        "output_tokens_p50": pct(tokens, 50),
+        "latency_p50_sec": pct(latency, 50),
+        "latency_p95_sec": pct(latency, 95),
+        "fell_back_to_full": sum(r["fell_back"] for r in runs),
+    }
+
+
+def main():
+    out_path = sys.argv[1] if len(sys.argv) > 1 else None
+
+    with open(CASES_PATH, "r", encoding="utf-8") as f:
+        cases = json.load(f)
+
+    conn = connection()
+    results = []
+    try:
+        for case in cases:
+            code, error = case["code"], case["error"]
+            line_nums = case.get("line_nums", "")
+            question = build_question(code, error, line_nums)
+
+            scored = retrieve_topk_scored(conn, code, error, question, k=5, line_nums=line_nums)
+            rows = [r[:4] for r in scored]
+            choice = route("answer", code, error, best_distance=min((r[4] for r in scored), default=None))
+
+            result = {"id": case["id"], "model": choice["model"], "modes": {}}
+            for mode in MODES:
+                attempts = []
+                start = time.time()
+                answer = generate_answer(code, rows, question, choice, Deadline(), mode, attempts)
+                tokens = [a.get("output_tokens") for a in attempts]
+                result["modes"][mode] = {
+                    "latency_sec": round(time.time() - start, 4),
+                    "output_tokens": sum(tokens) if None not in tokens else None,
+                    "fell_back": len(attempts) > 1,
+                    "attempts": attempts,
+                    "answer": answer,
+                }
+            results.append(result)
+
+            full, diff = result["modes"]["full"], result["modes"]["diff"]
+            print(
+                f"{case['id']}: full {full['output_tokens']} tokens / {full['latency_sec']:.1f}s, "
+                f"diff {diff['output_tokens']} tokens / {diff['latency_sec']:.1f}s"
+                + (" (fell back to full)" if diff["fell_back"] else "")
+            )
+    finally:
+        conn.close()
+
+    summary = {mode: summarize(results, mode) for mode in MODES}
+    print("\n" + json.dumps(summary, indent=2))
+
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "results": results}, f, indent=2, ensure_ascii=False)
+        print(f"\nSaved results to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from Database_Code import embed_batcher, embeddings
+
+# embed_text throughput with and without cross-request micro-batching
+# (Database_Code/embed_batcher.py). N threads stand in for N concurrent
+# assistant requests, each embedding the error texts of benchmark_cases.json
+# one call at a time. Reports texts/s, API requests sent and per-call latency.
+#
+# Usage: python Testing/embed_batch_benchmark.py [calls_per_thread] [output.json]
+
+CASES_PATH = os.path.join(os.path.dirname(__file__), "benchmark_cases.json")
+
+CONCURRENCY = [1, 4, 16, 32]
+DEFAULT_CALLS = 10
+
+
+def load_texts() -> list[str]:
+    with open(CASES_PATH, "r", encoding="utf-8") as f:
+        cases = json.load(f)
+    return [f"Python error: {c['error']}" for c in cases]
+
+
+def count_batches() -> int:
+    try:
+        with open(embed_batcher.LOG_PATH, "r", encoding="utf-8") as f:
+            return sum(1 for _ in f)
+    except OSError:
+        return 0
+
+
+def bench(texts: list[str], threads: int, calls: int, window_ms: float) -> dict:
+    embeddings.EMBED_BATCH_WINDOW_MS = window_ms
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(offset: int):
+        for i in range(calls):
+            t = time.time()
+            embeddings.embed_text(texts[(offset + i) % len(texts)])
+            with lock:
+                latencies.append(time.time() - t)
+
+    batches_before = count_batches()
+    start = time.time()
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.time() - start
+
+    n_texts = threads * calls
+    return {
+        "window_ms": window_ms,
+        "threads": threads,
+        "texts": n_texts,
+        "api_requests": count_batches() - batches_before if window_ms > 0 else n_texts,
+        "texts_per_sec": round(n_texts / elapsed, 1),
+        "latency_p50_sec": round(float(np.percentile(latencies, 50)), 4),
+        "latency_p95_sec": round(float(np.percentile(latencies, 95)), 4),
+    }
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_CALLS
+    out_path = sys.argv[2] if len(sys.argv) > 2 else None
+
+    texts = load_texts()
+    window_ms = embeddings.EMBED_BATCH_WINDOW_MS or 5.0
+    embeddings.embed_text_direct("warm up")  # client and tokenizer
+
+    results = []
+    for threads in CONCURRENCY:
+        for window in (0.0, window_ms):
+            result = bench(texts, threads, calls, window)
+            results.append(result)
+            print(
+                f"{threads:>3} threads, {'batched' if window else 'direct '}: "
+                f"{result['texts_per_sec']:>7} texts/s, {result['api_requests']:>4} API requests, "
+                f"p50 {result['latency_p50_sec']:.3f}s, p95 {result['latency_p95_sec']:.3f}s"
+            )
+
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from LLM_Code.exact_match import test_ids
+
+# Fails (exit code 1) when a failing test in runner output is not turned into
+# the test ID SWE-bench stores in fail_to_pass / pass_to_pass, so the exact
+# lookup (LLM_Code/exact_match.py) would miss it. No database needed.
+#
+# Usage: python Testing/exact_match_check.py
+
+CASES = [
+    # unittest / Django runner before Python 3.11
+    ("FAIL: test_b (app.tests.TestA)\n", ["test_b (app.tests.TestA)"]),
+    # Python 3.11+ appends the method name inside the parentheses
+    ("FAIL: test_b (app.tests.TestA.test_b)\n", ["test_b (app.tests.TestA)"]),
+    # a dotted path that merely ends in another name is kept as is
+    ("ERROR: test_b (app.tests.test_c)\n", ["test_b (app.tests.test_c)"]),
+    ("FAILED tests/test_x.py::TestA::test_b[1-2] - AssertionError\n", ["tests/test_x.py::TestA::test_b[1-2]"]),
+]
+
+
+def main():
+    failed = False
+    for error, expected in CASES:
+        got = test_ids(error)
+        ok = got == expected
+        print(f"{'ok  ' if ok else 'FAIL'} {error.strip()!r} -> {got}")
+        failed |= not ok
+
+    if failed:
+        print("Exact match check FAILED")
+        sys.exit(1)
+
+    print("Exact match check OK")
+
+
+if __name__ == "__main__":
+    main()
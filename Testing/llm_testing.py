@@ -1,14 +1,36 @@
 from __future__ import annotations
 import os
-import re
+import time
 from typing import List, Tuple
 
 from openai import OpenAI
 import psycopg2
 
 from Database_Code.embeddings import embed_text
+from Database_Code.features import ERROR_TYPE_RE, REPO_KEYWORDS, extract_error_types, tokenize
+from LLM_Code import cross_encoder
+from LLM_Code.code_context import EXPANSION_CONTEXT_TOKENS, extract_context
+from LLM_Code.model_router import log_route, route
 
-RAG_VERSION = "testing_retrieval_v4_repo_boost"
+RAG_VERSION = "testing_retrieval_v6_faceted_prefilter"
+
+# Rerank weights passed to rerank_score() in Schema.sql.
+# error_word / code_word are per overlapping token, capped by the max_* values.
+RERANK_WEIGHTS = {
+    "repo": 0.18,
+    "error_type": 0.08,
+    "error_word": 0.02,
+    "max_error_words": 0.10,
+    "code_word": 0.01,
+    "max_code_words": 0.05,
+}
+
+# How many nearest neighbours are rescored in Postgres before taking the top-k.
+CANDIDATE_POOL = 200
+
+# A faceted (repo / exception type) search must return at least this many rows,
+# otherwise retrieval widens to the next facet level and finally the whole table.
+MIN_FACET_RESULTS = 5
 
 
 def get_openai_client() -> OpenAI:
@@ -20,15 +42,23 @@ def get_openai_client() -> OpenAI:
     return OpenAI(api_key=api_key)
 
 
-def call_llm(prompt: str, model: str = "gpt-5-2025-08-07") -> str:
+def call_llm(
+    prompt: str,
+    model: str = "gpt-5-2025-08-07",
+    max_output_tokens: int = 3000,
+    route: dict | None = None,
+) -> str:
     client = get_openai_client()
 
+    start = time.time()
     resp = client.responses.create(
         model=model,
         input=prompt,
-        max_output_tokens=3000,
+        max_output_tokens=max_output_tokens,
         text={"format": {"type": "text"}}
     )
+    if route:
+        log_route(dict(route, model=model), time.time() - start, getattr(resp, "usage", None))
 
     # 1. Fast path
     text = getattr(resp, "output_text", None)
@@ -108,31 +138,15 @@ def call_llm(prompt: str, model: str = "gpt-5-2025-08-07") -> str:
 def extract_error_type(error: str) -> str:
     if not error:
         return ""
-    match = re.search(r"\b([A-Za-z]+Error)\b", error)
+    match = ERROR_TYPE_RE.search(error)
     return match.group(1) if match else ""
 
 
-def tokenize(text: str) -> set[str]:
-    return set(re.findall(r"[A-Za-z_]+", text.lower()))
-
-
 def detect_repo_hints(text: str) -> set[str]:
     text_lower = text.lower()
     hints = set()
 
-    mapping = {
-        "django": "django/django",
-        "pytest": "pytest-dev/pytest",
-        "sphinx": "sphinx-doc/sphinx",
-        "sympy": "sympy/sympy",
-        "xarray": "pydata/xarray",
-        "astropy": "astropy/astropy",
-        "matplotlib": "matplotlib/matplotlib",
-        "sklearn": "scikit-learn/scikit-learn",
-        "scikit-learn": "scikit-learn/scikit-learn",
-    }
-
-    for key, repo in mapping.items():
+    for key, repo in REPO_KEYWORDS.items():
         if key in text_lower:
             hints.add(repo)
 
@@ -142,81 +156,154 @@ def detect_repo_hints(text: str) -> set[str]:
 RetrievedRow = Tuple[str, str, str, str]
 
 
-def retrieve_topk_debug(
-    conn: psycopg2.extensions.connection,
-    code: str,
-    error: str,
-    k: int = 5
-):
-    error_type = extract_error_type(error)
-
-    query_text = f"""Python bug report
+def debug_query_text(code: str, error: str) -> str:
+    # text embedded for the query (also used by Testing/offline_eval.py)
+    return f"""Python bug report
 
 Error:
 {error}
 
 Code:
-{code[:1500]}
+{extract_context(code, error, max_tokens=EXPANSION_CONTEXT_TOKENS)}
 """.strip()
 
-    q_emb = embed_text(query_text)
-    q_vec = "[" + ",".join(map(str, q_emb)) + "]"
-
-    sql = """
-        SELECT
-            instance_id,
-            repo,
-            problem_statement,
-            patch,
-            embedding <=> %s AS distance
-        FROM swebench_data
-        WHERE embedding IS NOT NULL
-        ORDER BY embedding <=> %s
-        LIMIT %s;
+
+def retrieve_topk_debug(
+    conn: psycopg2.extensions.connection,
+    code: str,
+    error: str,
+    k: int = 5,
+    candidate_pool: int = CANDIDATE_POOL,
+    weights: dict | None = None,
+    prefilter: bool = True,
+    min_facet_results: int = MIN_FACET_RESULTS,
+    use_cross_encoder: bool = cross_encoder.CROSS_ENCODER_ENABLED,
+):
+    """
+    Vector candidates -> SQL rerank_score() -> top-k. With use_cross_encoder the
+    SQL stage returns CROSS_ENCODER_POOL rows and the local cross-encoder picks
+    the final k (falling back to the SQL order if it misses its time budget).
     """
+    if use_cross_encoder:
+        cross_encoder.warm_up()
+
+    error_type = extract_error_type(error)
+
+    query_text = debug_query_text(code, error)
+    q_vec = embed_text(query_text)
+
+    w = {**RERANK_WEIGHTS, **(weights or {})}
+    repo_hints = sorted(detect_repo_hints(code + "\n" + error))
+
+    params = {
+        "q_vec": q_vec,
+        "pool": max(candidate_pool, k),
+        "k": max(k, cross_encoder.CROSS_ENCODER_POOL) if use_cross_encoder else k,
+        "repo_hints": repo_hints,
+        "error_type": error_type.lower(),
+        "error_words": sorted(tokenize(error)),
+        "code_words": sorted(tokenize(code)),
+        "w_repo": w["repo"],
+        "w_error_type": w["error_type"],
+        "w_error_word": w["error_word"],
+        "max_error_words": w["max_error_words"],
+        "w_code_word": w["code_word"],
+        "max_code_words": w["max_code_words"],
+    }
+
+    facets = facet_levels(repo_hints, extract_error_types(error)) if prefilter else []
 
+    rows = None
     with conn.cursor() as cur:
-        cur.execute(sql, (q_vec, q_vec, 20))
-        rows = cur.fetchall()
+        # Narrowest slice first; widen until a slice returns a full top-k.
+        for repos, error_types in facets:
+            facet_params = dict(params, facet_error_types=error_types)
+            facet_params.update({f"facet_repo_{i}": r for i, r in enumerate(repos)})
 
-    repo_hints = detect_repo_hints(code + "\n" + error)
-    error_words = tokenize(error)
-    code_words = tokenize(code)
+            cur.execute(rerank_sql(candidate_sql(len(repos), bool(error_types))), facet_params)
+            rows = cur.fetchall()
+            if len(rows) >= min(k, min_facet_results):
+                break
+        else:
+            cur.execute(rerank_sql(candidate_sql()), params)
+            rows = cur.fetchall()
 
-    scored_rows = []
-    for row in rows:
-        instance_id, repo, problem_statement, patch, distance = row
-        ps = problem_statement or ""
-        ps_lower = ps.lower()
-        ps_words = tokenize(ps)
+    if not use_cross_encoder:
+        return rows
 
-        rerank_bonus = 0.0
+    top, info = cross_encoder.rerank(query_text, rows, k)
+    print(f"Cross-encoder rerank: {info['reason']} in {info['latency_sec']:.3f}s")
+    return top
 
-        if repo in repo_hints:
-            rerank_bonus += 0.18
 
-        if error_type and error_type.lower() in ps_lower:
-            rerank_bonus += 0.08
+def facet_levels(repo_hints: list[str], error_types: list[str]) -> list[tuple[list[str], list[str]]]:
+    """
+    Filtered searches to try before the global one, narrowest first.
+    Each entry is (repos, error_types); an empty list means no filter on that facet.
+    """
+    levels = []
+    if repo_hints and error_types:
+        levels.append((repo_hints, error_types))
+    if repo_hints:
+        levels.append((repo_hints, []))
+    elif error_types:
+        levels.append(([], error_types))
+    return levels
 
-        overlap_error = len(error_words & ps_words)
-        overlap_code = len(code_words & ps_words)
 
-        rerank_bonus += min(overlap_error * 0.02, 0.10)
-        rerank_bonus += min(overlap_code * 0.01, 0.05)
+def candidate_sql(n_repos: int = 0, filter_error_types: bool = False) -> str:
+    """
+    Vector search for the candidate pool, optionally restricted to facets.
 
-        final_score = distance - rerank_bonus
+    With repo facets there is one sub-select per repo, each with a literal
+    "repo = '...'" predicate (psycopg2 interpolates client-side), so Postgres
+    can use that repo's partial index from create_facet_indexes().
+    """
+    error_filter = "AND error_types && %(facet_error_types)s::text[]" if filter_error_types else ""
+
+    def one_slice(repo_filter: str) -> str:
+        return f"""
+            SELECT
+                instance_id,
+                repo,
+                problem_statement,
+                patch,
+                error_types,
+                ps_tokens,
+                embedding <=> %(q_vec)s::vector AS distance
+            FROM swebench_data
+            WHERE embedding IS NOT NULL {repo_filter} {error_filter}
+            ORDER BY embedding <=> %(q_vec)s::vector
+            LIMIT %(pool)s
+        """
+
+    if not n_repos:
+        return one_slice("")
+
+    return "\nUNION ALL\n".join(
+        f"({one_slice(f'AND repo = %(facet_repo_{i})s')})" for i in range(n_repos)
+    )
 
-        scored_rows.append((
-            instance_id,
-            repo,
-            problem_statement,
-            patch,
-            distance,
-            final_score
-        ))
 
-    scored_rows.sort(key=lambda x: x[5])
-    return [(r[0], r[1], r[2], r[3], r[4]) for r in scored_rows[:k]]
+def rerank_sql(candidates: str) -> str:
+    # The vector search picks the candidate pool, then rerank_score() orders it
+    # using the features stored at ingestion. Only the final k rows leave Postgres.
+    return f"""
+        WITH candidates AS (
+            {candidates}
+        )
+        SELECT instance_id, repo, problem_statement, patch, distance
+        FROM candidates
+        ORDER BY rerank_score(
+            distance, repo, error_types, ps_tokens,
+            %(repo_hints)s::text[], %(error_type)s,
+            %(error_words)s::text[], %(code_words)s::text[],
+            %(w_repo)s, %(w_error_type)s,
+            %(w_error_word)s, %(max_error_words)s,
+            %(w_code_word)s, %(max_code_words)s
+        )
+        LIMIT %(k)s;
+    """
 
 
 def retrieve_topk(
@@ -236,9 +323,15 @@ def rag_answer(
     error: str,
     user_question: str,
     k: int = 5,
-    model: str = "gpt-5-2025-08-07",
+    model: str | None = None,
 ) -> str:
-    rows = retrieve_topk(conn, code, error, user_question, k=k)
+    scored = retrieve_topk_debug(conn, code, error, k=k)
+    rows = [(r[0], r[1], r[2], r[3]) for r in scored]
+
+    # model=None -> let the router pick the model / output budget
+    choice = route("answer", code, error, best_distance=min((r[4] for r in scored), default=None))
+    if model:
+        choice = dict(choice, model=model, reason="explicit model")
 
     context_blocks = []
     for (iid, repo, problem_statement, patch) in rows:
@@ -287,5 +380,5 @@ Corrected code:
 ...
 """
 
-    answer = call_llm(prompt, model=model)
+    answer = call_llm(prompt, choice["model"], choice["max_output_tokens"], choice)
     return answer if answer else "No text output returned by the model."
\ No newline at end of file
@@ -0,0 +1,285 @@
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from Database_Code.features import REPO_KEYWORDS, tokenize
+from Testing.llm_testing import (
+    CANDIDATE_POOL, RERANK_WEIGHTS, debug_query_text, detect_repo_hints, extract_error_type,
+)
+
+# Offline retrieval evaluation + weight sweep for retrieve_topk_debug().
+#
+# Corpus rows and benchmark-case query embeddings are loaded once (and cached
+# in CACHE_PATH, so later runs make no API or database calls). All case x
+# corpus cosine distances come from one matrix multiply; the rerank_score()
+# features (repo hint, exception type, error/code word overlap) become arrays
+# of the same shape, so every parameter combination is a few array operations
+# over all cases at once. Matches the unfaceted path (prefilter=False).
+#
+# A row is relevant to a case when its repo is the library the case's
+# expected_category names and its problem statement contains every word of
+# at least one of the case's expected_keywords.
+#
+# Usage: python Testing/offline_eval.py [k] [output.json]
+#   OFFLINE_EVAL_REFRESH=1 reloads the corpus and re-embeds the cases.
+
+CASES_PATH = os.path.join(os.path.dirname(__file__), "benchmark_cases.json")
+CACHE_PATH = os.path.join(os.path.dirname(__file__), "offline_eval_cache.npz")
+
+DEFAULT_K = 5
+
+SWEEP_GRID = {
+    "repo": [0.0, 0.05, 0.1, 0.18, 0.25, 0.35],
+    "error_type": [0.0, 0.04, 0.08, 0.12, 0.2],
+    "error_word": [0.0, 0.01, 0.02, 0.04],
+    "max_error_words": [0.05, 0.1, 0.2],
+    "code_word": [0.0, 0.005, 0.01, 0.02],
+    "max_code_words": [0.025, 0.05, 0.1],
+    "pool": [20, 50, 100, 200],
+}
+
+# parameter combinations scored per broadcast
+SWEEP_BATCH = 256
+
+
+# -----------------------------
+# Data
+# -----------------------------
+
+def load_cases(path: str = CASES_PATH) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def cache_key(cases: list[dict], model: str) -> str:
+    h = hashlib.sha256(model.encode("utf-8"))
+    for case in cases:
+        h.update(debug_query_text(case["code"], case["error"]).encode("utf-8"))
+    return h.hexdigest()
+
+
+def load_data(cases: list[dict]) -> dict:
+    """
+    Corpus rows and case embeddings, from CACHE_PATH when it matches the
+    cases and embedding model, else from the database and the embeddings API.
+    """
+    from Database_Code import embeddings
+    from Database_Code.db import connection
+
+    conn = connection()  # also selects the corpus' embedding model
+    try:
+        key = cache_key(cases, embeddings.ACTIVE_MODEL)
+        if os.path.exists(CACHE_PATH) and os.getenv("OFFLINE_EVAL_REFRESH", "0") != "1":
+            cached = np.load(CACHE_PATH, allow_pickle=True)
+            if str(cached["key"]) == key:
+                print(f"Loaded {len(cached['instance_ids'])} corpus rows from {CACHE_PATH}")
+                return {name: cached[name] for name in cached.files}
+
+        start = time.time()
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT instance_id, repo, error_types, ps_tokens, embedding
+                FROM swebench_data
+                WHERE embedding IS NOT NULL
+                ORDER BY instance_id;
+            """)
+            rows = cur.fetchall()
+        conn.commit()
+    finally:
+        conn.close()
+
+    queries = embeddings.embed_texts([debug_query_text(c["code"], c["error"]) for c in cases])
+    data = {
+        "key": np.array(key),
+        "instance_ids": np.array([r[0] for r in rows]),
+        "repos": np.array([r[1] for r in rows]),
+        # 1-D object arrays of lists (the trailing None stops numpy making a 2-D array)
+        "error_types": np.array([list(r[2]) for r in rows] + [None], dtype=object)[:-1],
+        "ps_tokens": np.array([list(r[3]) for r in rows] + [None], dtype=object)[:-1],
+        "corpus": np.vstack([np.asarray(r[4], dtype=np.float32) for r in rows]),
+        "queries": queries,
+    }
+    np.savez(CACHE_PATH, **data)
+    print(f"Loaded {len(rows)} corpus rows and embedded {len(cases)} cases in {time.time() - start:.1f}s")
+    return data
+
+
+# -----------------------------
+# Feature arrays
+# -----------------------------
+
+def category_repo(category: str) -> str | None:
+    # "django_paginator_invalid_page" -> "django/django"
+    prefix = (category or "").split("_", 1)[0]
+    return REPO_KEYWORDS.get(prefix)
+
+
+def build_arrays(cases: list[dict], data: dict) -> dict:
+    """
+    Every (case, row) quantity the rerank and the labels need, as
+    (n_cases, n_rows) arrays.
+    """
+    corpus = data["corpus"] / np.linalg.norm(data["corpus"], axis=1, keepdims=True)
+    queries = data["queries"] / np.linalg.norm(data["queries"], axis=1, keepdims=True)
+    distance = 1.0 - queries @ corpus.T  # cosine distance, same as <=>
+
+    repos = data["repos"]
+    n_rows = len(repos)
+
+    # token overlap as a product of 0/1 matrices over the case vocabulary only
+    case_error_words = [tokenize(c["error"]) for c in cases]
+    case_code_words = [tokenize(c["code"]) for c in cases]
+    keyword_words = [[tokenize(k) for k in c.get("expected_keywords", [])] for c in cases]
+    vocab = sorted(set().union(*case_error_words, *case_code_words, *itertools.chain(*keyword_words)))
+    index = {w: i for i, w in enumerate(vocab)}
+
+    row_tokens = np.zeros((n_rows, len(vocab)), dtype=np.float32)
+    for r, tokens in enumerate(data["ps_tokens"]):
+        for t in tokens:
+            if t in index:
+                row_tokens[r, index[t]] = 1.0
+
+    def case_matrix(word_sets):
+        m = np.zeros((len(word_sets), len(vocab)), dtype=np.float32)
+        for c, words in enumerate(word_sets):
+            m[c, [index[w] for w in words]] = 1.0
+        return m
+
+    error_overlap = case_matrix(case_error_words) @ row_tokens.T
+    code_overlap = case_matrix(case_code_words) @ row_tokens.T
+
+    repo_match = np.zeros((len(cases), n_rows), dtype=bool)
+    error_type_match = np.zeros((len(cases), n_rows), dtype=bool)
+    relevant = np.zeros((len(cases), n_rows), dtype=bool)
+    for c, case in enumerate(cases):
+        hints = detect_repo_hints(case["code"] + "\n" + case["error"])
+        repo_match[c] = np.isin(repos, sorted(hints))
+        error_type = extract_error_type(case["error"]).lower()
+        if error_type:
+            error_type_match[c] = [error_type in types for types in data["error_types"]]
+
+        # label: right library and every word of one expected keyword
+        in_repo = repos == category_repo(case.get("expected_category"))
+        keyword_hit = np.zeros(n_rows, dtype=bool)
+        for words in keyword_words[c]:
+            if words:
+                keyword_hit |= row_tokens[:, [index[w] for w in words]].all(axis=1)
+        relevant[c] = in_repo & keyword_hit
+
+    # rank of every row by pure distance, for the candidate-pool cut-off
+    distance_rank = np.argsort(np.argsort(distance, axis=1), axis=1)
+
+    return {
+        "distance": distance.astype(np.float32),
+        "distance_rank": distance_rank,
+        "repo_match": repo_match.astype(np.float32),
+        "error_type_match": error_type_match.astype(np.float32),
+        "error_overlap": error_overlap,
+        "code_overlap": code_overlap,
+        "relevant": relevant,
+    }
+
+
+# -----------------------------
+# Scoring
+# -----------------------------
+
+def score_batch(arrays: dict, params: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    params: (batch, 7) rows of repo, error_type, error_word, max_error_words,
+    code_word, max_code_words, pool. Returns (recall@k, MRR@k) per
+    combination, averaged over the cases that have at least one relevant row.
+    """
+    p = params[:, :, None, None]  # broadcast over (case, row)
+    score = (
+        arrays["distance"][None]
+        - p[:, 0] * arrays["repo_match"][None]
+        - p[:, 1] * arrays["error_type_match"][None]
+        - np.minimum(p[:, 2] * arrays["error_overlap"][None], p[:, 3])
+        - np.minimum(p[:, 4] * arrays["code_overlap"][None], p[:, 5])
+    )
+    # rows outside the candidate pool never reach the rerank
+    score = np.where(arrays["distance_rank"][None] < p[:, 6], score, np.inf)
+
+    # top-k without sorting whole rows: partition, then order the k
+    top = np.argpartition(score, k, axis=2)[:, :, :k]
+    top = np.take_along_axis(top, np.argsort(np.take_along_axis(score, top, axis=2), axis=2), axis=2)
+    relevant = arrays["relevant"]
+    hits = np.take_along_axis(np.broadcast_to(relevant, score.shape), top, axis=2)
+
+    n_relevant = relevant.sum(axis=1)
+    evaluated = n_relevant > 0
+    recall = hits.sum(axis=2) / np.maximum(1, np.minimum(k, n_relevant))
+    first = np.where(hits.any(axis=2), hits.argmax(axis=2) + 1, np.inf)
+    mrr = 1.0 / first
+
+    return recall[:, evaluated].mean(axis=1), mrr[:, evaluated].mean(axis=1)
+
+
+def sweep(arrays: dict, grid: dict, k: int) -> list[dict]:
+    names = list(grid)
+    combos = np.array(list(itertools.product(*grid.values())), dtype=np.float32)
+
+    results = []
+    for i in range(0, len(combos), SWEEP_BATCH):
+        batch = combos[i:i + SWEEP_BATCH]
+        recall, mrr = score_batch(arrays, batch, k)
+        for row, r, m in zip(batch, recall, mrr):
+            results.append({
+                **{n: round(float(v), 4) for n, v in zip(names, row)},
+                f"recall@{k}": round(float(r), 4),
+                "mrr": round(float(m), 4),
+            })
+    results.sort(key=lambda x: (x["mrr"], x[f"recall@{k}"]), reverse=True)
+    return results
+
+
+def evaluate(arrays: dict, weights: dict, pool: int, k: int) -> dict:
+    params = np.array([[
+        weights["repo"], weights["error_type"], weights["error_word"], weights["max_error_words"],
+        weights["code_word"], weights["max_code_words"], pool,
+    ]], dtype=np.float32)
+    recall, mrr = score_batch(arrays, params, k)
+    return {f"recall@{k}": round(float(recall[0]), 4), "mrr": round(float(mrr[0]), 4)}
+
+
+def main():
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_K
+    out_path = sys.argv[2] if len(sys.argv) > 2 else None
+
+    cases = load_cases()
+    data = load_data(cases)
+
+    start = time.time()
+    arrays = build_arrays(cases, data)
+    n_labelled = int((arrays["relevant"].sum(axis=1) > 0).sum())
+    print(f"{len(cases)} cases ({n_labelled} with relevant rows) x {len(data['instance_ids'])} rows, "
+          f"features in {time.time() - start:.2f}s")
+
+    no_rerank = {name: 0.0 for name in RERANK_WEIGHTS}
+    print(f"vector only:     {evaluate(arrays, no_rerank, CANDIDATE_POOL, k)}")
+    print(f"current weights: {evaluate(arrays, RERANK_WEIGHTS, CANDIDATE_POOL, k)}")
+
+    start = time.time()
+    results = sweep(arrays, SWEEP_GRID, k)
+    print(f"\nSwept {len(results)} combinations in {time.time() - start:.2f}s; best by MRR:")
+    for r in results[:10]:
+        print("  " + ", ".join(f"{name}={value}" for name, value in r.items()))
+
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump({"k": k, "grid": SWEEP_GRID, "results": results}, f, indent=2)
+        print(f"\nSaved results to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
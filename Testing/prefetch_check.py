@@ -0,0 +1,111 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from LLM_Code.code_context import retrieval_context
+from LLM_Code.prefetch import code_windows
+from LLM_Code.quick_answers import FRAME_RE
+
+# Fails (exit code 1) when the code-side query of a live error is not one of
+# the windows the save-time prefetch (LLM_Code/prefetch.py) caches. Runs a
+# multi-frame version of Testing/runtime_error.py, then builds the live query
+# the way the extension asks for it (every frame's line, outermost first) and
+# from the traceback alone. No database or API key needed.
+#
+# Usage: python Testing/prefetch_check.py
+
+MULTI_FRAME_SCRIPT = '''# runtime_error.py with helper frames between main() and the failing line
+
+def calculate_average(total, count):
+    return total / count
+
+
+def summarize(numbers, count):
+    total = sum(numbers)
+    return calculate_average(total, count)
+
+
+def report(numbers):
+    count = 0  # Intentional bug to trigger runtime error
+    avg = summarize(numbers, count)
+    return f"Average: {avg}"
+
+
+def describe(numbers):
+    """Unused helpers, so the file is longer than one retrieval query."""
+    lines = []
+    for i, n in enumerate(numbers):
+        if n % 2 == 0:
+            lines.append(f"item {i}: {n} is even")
+        else:
+            lines.append(f"item {i}: {n} is odd")
+    lines.append(f"smallest {min(numbers)}, largest {max(numbers)}")
+    lines.append(f"spread {max(numbers) - min(numbers)}")
+    return "\\n".join(lines)
+
+
+def histogram(numbers, width=40):
+    top = max(numbers)
+    rows = []
+    for n in numbers:
+        bar = "#" * int(width * n / top)
+        rows.append(f"{n:>6} {bar}")
+    return "\\n".join(rows)
+
+
+def main():
+    numbers = [10, 20, 30]
+    print(describe(numbers))
+    print(histogram(numbers))
+    print(report(numbers))
+
+
+if __name__ == "__main__":
+    main()
+'''
+
+
+def run_script(code: str) -> str:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "runtime_error.py")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(code)
+        proc = subprocess.run([sys.executable, path], capture_output=True, text=True)
+    return proc.stderr
+
+
+def main():
+    code = MULTI_FRAME_SCRIPT
+    error = run_script(code)
+    frames = [m for m in map(FRAME_RE.match, error.splitlines()) if m]
+    if len(frames) < 3:
+        print(f"Expected a multi-frame traceback, got:\n{error}")
+        sys.exit(1)
+
+    # the extension's snippets: one line per frame, outermost first
+    line_nums = ",".join(m.group(2) for m in frames)
+    windows = set(code_windows(code))
+
+    failed = False
+    for label, error_text, nums in [
+        (f"line numbers {line_nums}", error, line_nums),
+        ("traceback only", error, ""),
+    ]:
+        hit = retrieval_context(code, error_text, nums) in windows
+        print(f"{label}: {'hit' if hit else 'MISS'}")
+        failed |= not hit
+
+    if failed:
+        print("Prefetch check FAILED")
+        sys.exit(1)
+
+    print("Prefetch check OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import json
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from LLM_Code import query_planner
+
+# How often the saved query planner (LLM_Code/query_planner.py) answers locally
+# on the benchmark and demo cases, and how often its label is right when it
+# does. The cases are part of its training data, so this shows that the local
+# path gets used; the held-out precision / coverage printed by training is
+# the unbiased number.
+#
+# Usage: python Testing/query_planner_benchmark.py [output.json]
+
+
+def llm_fallback(code, error):
+    return ["<llm expansion>"]
+
+
+def main():
+    out_path = sys.argv[1] if len(sys.argv) > 1 else None
+
+    start = time.time()
+    planner = query_planner.load_planner()
+    if planner is None:
+        print(f"No trained planner at {query_planner.MODEL_PATH}; run python LLM_Code/query_planner.py first")
+        sys.exit(1)
+    print(f"Loaded planner in {time.time() - start:.2f}s, threshold {query_planner.planner_threshold(planner):.2f}")
+
+    results = []
+    for path in query_planner.CASE_FILES:
+        with open(path, "r", encoding="utf-8") as f:
+            cases = json.load(f)
+        for case in cases:
+            _, decision = query_planner.plan_queries(case["code"], case["error"], fallback=llm_fallback)
+            expected = query_planner.case_label(case)
+            results.append({
+                "id": case["id"],
+                "expected": expected,
+                "label": decision["label"],
+                "confidence": decision["confidence"],
+                "path": decision["path"],
+                "correct": decision["label"] == expected,
+                "planning_time_sec": decision["planning_time_sec"],
+            })
+
+    local = [r for r in results if r["path"] == "local"]
+    summary = {
+        "cases": len(results),
+        "local": len(local),
+        "local_correct": sum(r["correct"] for r in local),
+        "planning_ms_mean": round(1000 * sum(r["planning_time_sec"] for r in results) / len(results), 2),
+    }
+    print(json.dumps(summary, indent=2))
+
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "results": results}, f, indent=2)
+        print(f"\nSaved results to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
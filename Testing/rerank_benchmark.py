@@ -0,0 +1,90 @@
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from Database_Code.db import connection
+from LLM_Code.cross_encoder import CROSS_ENCODER_MODEL, candidate_text, load_cross_encoder, score_pairs
+
+# Cross-encoder latency on this machine's CPU, fp32 vs int8, for growing
+# candidate pools. Queries come from benchmark_cases.json, candidates from the
+# database. Model load time is excluded (it is paid once, in warm_up).
+#
+# Usage: python Testing/rerank_benchmark.py [runs] [output.json]
+
+CASES_PATH = os.path.join(os.path.dirname(__file__), "benchmark_cases.json")
+
+POOL_SIZES = [5, 10, 20, 50, 100]
+DEFAULT_RUNS = 5
+
+
+def load_queries() -> list[str]:
+    with open(CASES_PATH, "r", encoding="utf-8") as f:
+        cases = json.load(f)
+    return [f"Python error: {c['error']}\n\n{c['code']}" for c in cases]
+
+
+def load_candidates(conn, n: int) -> list[str]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT instance_id, repo, problem_statement, patch FROM swebench_data LIMIT %s;", (n,))
+        return [candidate_text(r) for r in cur.fetchall()]
+
+
+def bench(queries: list[str], candidates: list[str], int8: bool, runs: int) -> list[dict]:
+    start = time.time()
+    load_cross_encoder(CROSS_ENCODER_MODEL, int8)
+    print(f"\n{'int8' if int8 else 'fp32'}: model loaded in {time.time() - start:.2f}s")
+
+    # one untimed pass so lazy initialisation does not count
+    score_pairs(queries[0], candidates[:POOL_SIZES[0]], CROSS_ENCODER_MODEL, int8)
+
+    results = []
+    for size in POOL_SIZES:
+        if size > len(candidates):
+            break
+        latencies = []
+        for _ in range(runs):
+            for query in queries:
+                t = time.time()
+                score_pairs(query, candidates[:size], CROSS_ENCODER_MODEL, int8)
+                latencies.append(time.time() - t)
+        result = {
+            "int8": int8,
+            "pool": size,
+            "calls": len(latencies),
+            "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 1),
+            "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 1),
+        }
+        print(f"  pool {size:>3}: p50 {result['p50_ms']:>7.1f} ms   p95 {result['p95_ms']:>7.1f} ms")
+        results.append(result)
+    return results
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RUNS
+    out_path = sys.argv[2] if len(sys.argv) > 2 else None
+
+    queries = load_queries()
+    conn = connection()
+    try:
+        candidates = load_candidates(conn, max(POOL_SIZES))
+    finally:
+        conn.close()
+    print(f"{CROSS_ENCODER_MODEL}: {len(queries)} queries x {runs} runs, up to {len(candidates)} candidates")
+
+    results = bench(queries, candidates, int8=False, runs=runs) + bench(queries, candidates, int8=True, runs=runs)
+
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump({"model": CROSS_ENCODER_MODEL, "runs": runs, "results": results}, f, indent=2)
+        print(f"\nSaved results to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,7 @@ import os
 
 # Add project root to Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from Database_Code.ingest_data import connection
+from Database_Code.db import connection
 from Testing.llm_testing import rag_answer, retrieve_topk_debug, RAG_VERSION
 
 
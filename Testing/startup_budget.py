@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+
+# Fails (exit code 1) when importing the serving entry point gets slower than
+# the budget or starts pulling in ingestion-only dependencies again.
+#
+# Usage: python Testing/startup_budget.py [budget_seconds]
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+STARTUP_BUDGET_SEC = 1.5
+
+# Only needed to build the database, never to answer a request.
+FORBIDDEN_MODULES = ["datasets", "pyarrow", "pandas", "torch", "sklearn", "tiktoken"]
+
+
+def measure_imports(module: str = "Main") -> tuple[float, set[str]]:
+    """
+    Import module in a fresh interpreter with -X importtime.
+    Returns (cumulative import seconds, names of every module imported).
+    """
+    env = dict(os.environ)
+    # import must not depend on (or fail without) an API key
+    env.pop("OPENAI_API_KEY", None)
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    total_us = 0
+    imported = set()
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name_stripped = name.strip()
+        imported.add(name_stripped)
+        if name_stripped == module:
+            total_us = int(cumulative)
+
+    return total_us / 1_000_000, imported
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else STARTUP_BUDGET_SEC
+
+    seconds, imported = measure_imports("Main")
+    leaked = sorted(m for m in FORBIDDEN_MODULES if m in imported)
+
+    print(f"import Main: {seconds:.3f}s (budget {budget:.3f}s)")
+    if leaked:
+        print(f"Ingestion-only modules imported at startup: {', '.join(leaked)}")
+
+    if seconds > budget or leaked:
+        print("Startup budget FAILED")
+        sys.exit(1)
+
+    print("Startup budget OK")
+
+
+if __name__ == "__main__":
+    main()
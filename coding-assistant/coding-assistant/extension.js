@@ -6,6 +6,15 @@ const os = require('os');
 
 let sidebarProvider;
 
+// Must match QUICK_ANSWER_MARKER in Main.py
+const QUICK_ANSWER_MARKER = '@@QUICK_ANSWER_READY@@';
+
+// Must match CANCEL_COMMAND in LLM_Code/cancellation.py
+const CANCEL_COMMAND = 'cancel';
+
+// A cancelled Main.py gets this long to stop its queries and exit on its own.
+const CANCEL_GRACE_MS = 5000;
+
 function activate(context) {
   sidebarProvider = new SidebarProvider(context.extensionUri);
 
@@ -21,6 +30,16 @@ function activate(context) {
       runActiveFile();
     })
   );
+
+  // Warm the retrieval cache while the developer is still editing
+  context.subscriptions.push(
+    vscode.workspace.onDidSaveTextDocument((document) => {
+      if (path.extname(document.uri.fsPath).toLowerCase() === '.py') {
+        prefetchFile(document.uri.fsPath);
+        updateWorkspaceIndex(document);
+      }
+    })
+  );
 }
 
 function deactivate() {}
@@ -53,51 +72,285 @@ function runActiveFile() {
   }
 
   editor.document.save().then(() => {
-    const cwd = path.dirname(filePath);
     const filename = path.basename(filePath);
     const repoRoot = path.join(__dirname, '..', '..');
-    const python = getPythonCommand(repoRoot);
 
+    // the answer to the previous run of this file is out of date now
+    supersedePipeline(filePath);
     sidebarProvider?.startRun(filename);
 
-    const proc = spawn(python.cmd, [...python.argsPrefix, filePath], { cwd });
+    const runner = getRunner(repoRoot);
+    if (runner) {
+      runWithRunner(runner, filePath);
+    } else {
+      runWithSpawn(filePath);
+    }
+  });
+}
 
-    let stdout = '';
-    let stderr = '';
+// Original path: a fresh interpreter for the script, then Main.py for the answer.
+function runWithSpawn(filePath) {
+  const cwd = path.dirname(filePath);
+  const repoRoot = path.join(__dirname, '..', '..');
+  const python = getPythonCommand(repoRoot);
 
-    proc.stdout.on('data', (data) => {
-      const chunk = data.toString();
-      stdout += chunk;
-      sidebarProvider?.appendOutput(chunk);
-    });
+  const proc = spawn(python.cmd, [...python.argsPrefix, filePath], { cwd });
 
-    proc.stderr.on('data', (data) => {
-      const chunk = data.toString();
-      stderr += chunk;
-      sidebarProvider?.appendError(chunk);
-    });
+  let stdout = '';
+  let stderr = '';
+
+  proc.stdout.on('data', (data) => {
+    const chunk = data.toString();
+    stdout += chunk;
+    sidebarProvider?.appendOutput(chunk);
+  });
+
+  proc.stderr.on('data', (data) => {
+    const chunk = data.toString();
+    stderr += chunk;
+    sidebarProvider?.appendError(chunk);
+  });
+
+  proc.on('close', (code) => {
+    if (code !== 0 && stderr) {
+      const snippets = parseTraceback(stderr, filePath);
+      sidebarProvider?.finishRun(code, snippets);
+      runLLMPipeline(filePath, stderr, snippets);
+    } else {
+      sidebarProvider?.finishRun(code, []);
+    }
+  });
+
+  proc.on('error', (err) => {
+    const msg = `Error starting Python: ${err.message}`;
+    vscode.window.showErrorMessage(msg);
+    sidebarProvider?.appendError(msg);
+    sidebarProvider?.finishRun(1, []);
+  });
+}
+
+// ─── Warm Runner ──────────────────────────────────────────────────────────────
+
+// LLM_Code/runner.py keeps a pre-imported interpreter alive, forks it for every
+// run and answers failures itself from structured traceback frames. Started on
+// the first run; if it cannot start (or CODING_ASSISTANT_RUNNER=0) runs fall
+// back to runWithSpawn.
+let runner = null;
+
+function getRunner(repoRoot) {
+  if (runner) return runner;
 
-    proc.on('close', (code) => {
-      if (code !== 0 && stderr) {
-        const snippets = parseTraceback(stderr, filePath);
-        sidebarProvider?.finishRun(code, snippets);
-        runLLMPipeline(filePath, stderr, snippets);
+  const runnerPy = path.join(repoRoot, 'LLM_Code', 'runner.py');
+  if (process.env.CODING_ASSISTANT_RUNNER === '0' || !fs.existsSync(runnerPy)) return null;
+
+  const python = getPythonCommand(repoRoot);
+  const proc = spawn(python.cmd, [...python.argsPrefix, runnerPy, 'serve'], { cwd: repoRoot });
+  const handlers = new Map();
+  const pending = [];
+  let ready = false;
+  let buffered = '';
+
+  const self = {
+    run(request, onEvent) {
+      handlers.set(request.id, onEvent);
+      const line = JSON.stringify(request) + '\n';
+      if (ready) {
+        proc.stdin.write(line);
       } else {
-        sidebarProvider?.finishRun(code, []);
+        pending.push(line);
       }
-    });
+    },
+  };
+  runner = self;
+
+  proc.stdout.setEncoding('utf8');
+  proc.stdout.on('data', (data) => {
+    buffered += data;
+    let newline;
+    while ((newline = buffered.indexOf('\n')) >= 0) {
+      const line = buffered.slice(0, newline);
+      buffered = buffered.slice(newline + 1);
+
+      let event;
+      try { event = JSON.parse(line); } catch (_) { continue; }
+
+      if (event.event === 'ready') {
+        ready = true;
+        pending.splice(0).forEach((l) => proc.stdin.write(l));
+        continue;
+      }
+      const handler = handlers.get(event.id);
+      if (!handler) continue;
+      if (event.event === 'done') handlers.delete(event.id);
+      handler(event);
+    }
+  });
 
-    proc.on('error', (err) => {
-      const msg = `Error starting Python: ${err.message}`;
-      vscode.window.showErrorMessage(msg);
-      sidebarProvider?.appendError(msg);
-      sidebarProvider?.finishRun(1, []);
-    });
+  // pipeline logging, not shown to the user
+  proc.stderr.on('data', () => {});
+
+  const crashed = (reason) => {
+    if (runner === self) runner = null;
+    for (const [id, handler] of handlers) handler({ id, event: 'crashed', reason });
+    handlers.clear();
+  };
+  proc.on('close', (code) => crashed(`Runner exited with code ${code}`));
+  proc.on('error', (err) => crashed(`Runner failed to start: ${err.message}`));
+
+  return self;
+}
+
+// Project folder of a file, sent with every answer request: the workspace
+// corpus is searched for that folder's code only ('' outside any folder).
+function workspaceRoot(filePath) {
+  const folder = vscode.workspace.getWorkspaceFolder(vscode.Uri.file(filePath));
+  return folder ? folder.uri.fsPath : '';
+}
+
+// Latest runner request per file. The runner cancels the answer of an older
+// run of the same file itself; whatever that request still sends is ignored.
+const latestRunnerRequest = new Map();
+
+function runWithRunner(runner, filePath) {
+  const id = `${Date.now()}`;
+  let started = false;
+  let exited = false;
+  let shown = '';
+  latestRunnerRequest.set(filePath, id);
+
+  runner.run({ id, file: filePath, workspace: workspaceRoot(filePath) }, (event) => {
+    if (latestRunnerRequest.get(filePath) !== id) return;
+    if (event.event === 'done') latestRunnerRequest.delete(filePath);
+
+    switch (event.event) {
+      case 'stdout':
+        started = true;
+        sidebarProvider?.appendOutput(event.text);
+        break;
+
+      case 'stderr':
+        started = true;
+        sidebarProvider?.appendError(event.text);
+        break;
+
+      case 'exit': {
+        started = exited = true;
+        const snippets = event.failure ? snippetsFromFrames(event.failure.frames) : [];
+        sidebarProvider?.finishRun(event.code, snippets);
+        if (event.failure) sidebarProvider?.startLLM();
+        break;
+      }
+
+      case 'quick_answer':
+        shown = event.text;
+        sidebarProvider?.appendLLM(shown);
+        break;
+
+      case 'answer':
+        if (!shown) {
+          sidebarProvider?.appendLLM(event.text);
+        } else if (event.text.startsWith(shown) && event.text.length > shown.length) {
+          sidebarProvider?.appendLLM(event.text.slice(shown.length));
+        }
+        sidebarProvider?.finishLLM();
+        break;
+
+      case 'cancelled':
+        sidebarProvider?.appendLLM(`[Coding Assistant] Request cancelled: ${event.reason}\n`);
+        sidebarProvider?.finishLLM();
+        break;
+
+      case 'crashed':
+        if (!started) {
+          // never got going (e.g. missing dependency): run it the old way
+          runWithSpawn(filePath);
+        } else if (exited) {
+          sidebarProvider?.appendLLM(`[Coding Assistant] ${event.reason}\n`);
+          sidebarProvider?.finishLLM();
+        } else {
+          sidebarProvider?.appendError(`[Coding Assistant] ${event.reason}\n`);
+          sidebarProvider?.finishRun(1, []);
+        }
+        break;
+    }
   });
 }
 
+// ─── Speculative Pre-retrieval ────────────────────────────────────────────────
+
+// One prefetch per file at a time; a save while one is running is dropped,
+// the next save picks up the changes (LLM_Code/prefetch.py skips cached windows).
+const prefetching = new Set();
+
+function prefetchFile(filePath) {
+  if (prefetching.has(filePath)) return;
+
+  const repoRoot = path.join(__dirname, '..', '..');
+  const prefetchPy = path.join(repoRoot, 'LLM_Code', 'prefetch.py');
+  if (!fs.existsSync(prefetchPy)) return;
+
+  const python = getPythonCommand(repoRoot);
+  prefetching.add(filePath);
+
+  const proc = spawn(python.cmd, [...python.argsPrefix, prefetchPy, filePath], { cwd: repoRoot });
+  proc.on('close', () => prefetching.delete(filePath));
+  proc.on('error', () => prefetching.delete(filePath));
+}
+
+// ─── Workspace Index ──────────────────────────────────────────────────────────
+
+// Re-embeds the changed functions of a saved file if its workspace folder has
+// been indexed (python Database_Code/workspace_index.py index <folder>);
+// otherwise the script exits straight away. Saves during an update are queued
+// per folder and sent together afterwards.
+const indexing = new Map();
+
+function updateWorkspaceIndex(document) {
+  const folder = vscode.workspace.getWorkspaceFolder(document.uri);
+  if (folder) indexWorkspaceFiles(folder.uri.fsPath, [document.uri.fsPath]);
+}
+
+function indexWorkspaceFiles(root, files) {
+  if (indexing.has(root)) {
+    files.forEach((f) => indexing.get(root).add(f));
+    return;
+  }
+
+  const repoRoot = path.join(__dirname, '..', '..');
+  const indexPy = path.join(repoRoot, 'Database_Code', 'workspace_index.py');
+  if (!fs.existsSync(indexPy)) return;
+
+  const python = getPythonCommand(repoRoot);
+  indexing.set(root, new Set());
+
+  const done = () => {
+    const queued = [...(indexing.get(root) || [])];
+    indexing.delete(root);
+    if (queued.length) indexWorkspaceFiles(root, queued);
+  };
+  const proc = spawn(python.cmd, [...python.argsPrefix, indexPy, 'update', root, ...files], { cwd: repoRoot });
+  proc.on('close', done);
+  proc.on('error', done);
+}
+
 // ─── LLM Pipeline ─────────────────────────────────────────────────────────────
 
+// Main.py process still answering each file (spawn path).
+const llmProcesses = new Map();
+
+// Ask the Main.py answering an earlier run of filePath to stop: it cancels its
+// database query and LLM calls and logs the cancellation. Killed if it has not
+// exited after CANCEL_GRACE_MS.
+function supersedePipeline(filePath) {
+  const proc = llmProcesses.get(filePath);
+  if (!proc) return;
+  llmProcesses.delete(filePath);
+  proc.superseded = true;
+  try { proc.stdin.write(CANCEL_COMMAND + '\n'); } catch (_) {}
+  const timer = setTimeout(() => proc.kill(), CANCEL_GRACE_MS);
+  proc.on('close', () => clearTimeout(timer));
+}
+
 /**
  * 1. Copies the user's code into a temp .txt file
  * 2. Calls Main.py (in the repo root) passing the temp file path and the error
@@ -126,19 +379,46 @@ function runLLMPipeline(filePath, stderr, snippets) {
   const python = getPythonCommand(repoRoot);
   const llmProc = spawn(
     python.cmd,
-    [...python.argsPrefix, mainPy, tmpCodeFile, stderr, errorLines, tmpOutputFile],
+    [...python.argsPrefix, mainPy, tmpCodeFile, stderr, errorLines, tmpOutputFile, `${timestamp}`,
+      workspaceRoot(filePath)],
     { cwd: repoRoot }
   );
+  supersedePipeline(filePath);
+  llmProcesses.set(filePath, llmProc);
+
+  // Main.py prints QUICK_ANSWER_MARKER once a locally templated answer is in the
+  // output file; show it right away and only append what comes after it on close.
+  let shown = '';
+
+  llmProc.stdout.on('data', (data) => {
+    if (llmProc.superseded || shown || !data.toString().includes(QUICK_ANSWER_MARKER)) return;
+    try {
+      shown = fs.readFileSync(tmpOutputFile, 'utf8');
+      sidebarProvider?.appendLLM(shown);
+    } catch (_) {}
+  });
 
   llmProc.stderr.on('data', (data) => {
+    if (llmProc.superseded) return;
     sidebarProvider?.appendLLM(`[Main.py error] ${data.toString()}`);
   });
 
   llmProc.on('close', () => {
+    if (llmProcesses.get(filePath) === llmProc) llmProcesses.delete(filePath);
+    if (llmProc.superseded) {
+      try { fs.unlinkSync(tmpCodeFile); } catch (_) {}
+      try { fs.unlinkSync(tmpOutputFile); } catch (_) {}
+      return;
+    }
+
     try {
       if (fs.existsSync(tmpOutputFile)) {
         const result = fs.readFileSync(tmpOutputFile, 'utf8');
-        sidebarProvider?.appendLLM(result);
+        if (!shown) {
+          sidebarProvider?.appendLLM(result);
+        } else if (result.startsWith(shown) && result.length > shown.length) {
+          sidebarProvider?.appendLLM(result.slice(shown.length));
+        }
       } else {
         sidebarProvider?.appendLLM('[Coding Assistant] Main.py did not produce an output file.');
       }
@@ -153,6 +433,7 @@ function runLLMPipeline(filePath, stderr, snippets) {
   });
 
   llmProc.on('error', (err) => {
+    if (llmProc.superseded) return;
     sidebarProvider?.appendLLM(`[Coding Assistant] Failed to run Main.py: ${err.message}\n`);
     sidebarProvider?.finishLLM();
   });
@@ -179,27 +460,50 @@ function parseTraceback(stderr, filePath) {
     if (seen.has(key)) continue;
     seen.add(key);
 
-    try {
-      const src = fs.readFileSync(frameFile, 'utf8').split('\n');
-      const start = Math.max(0, lineNum - 3);
-      const end = Math.min(src.length, lineNum + 2);
-
-      const codeLines = [];
-      for (let l = start; l < end; l++) {
-        codeLines.push({
-          number: l + 1,
-          text: src[l],
-          isError: l + 1 === lineNum,
-        });
-      }
+    const snippet = buildSnippet(frameFile, lineNum);
+    if (snippet) snippets.push(snippet);
+  }
 
-      snippets.push({ file: path.basename(frameFile), line: lineNum, codeLines });
-    } catch (_) {}
+  return snippets;
+}
+
+// Same snippets from the runner's structured frames, no stderr parsing.
+function snippetsFromFrames(frames) {
+  const snippets = [];
+  const seen = new Set();
+
+  for (const frame of frames) {
+    if (!frame.user_file || seen.has(frame.line)) continue;
+    seen.add(frame.line);
+
+    const snippet = buildSnippet(frame.file, frame.line);
+    if (snippet) snippets.push(snippet);
   }
 
   return snippets;
 }
 
+function buildSnippet(frameFile, lineNum) {
+  try {
+    const src = fs.readFileSync(frameFile, 'utf8').split('\n');
+    const start = Math.max(0, lineNum - 3);
+    const end = Math.min(src.length, lineNum + 2);
+
+    const codeLines = [];
+    for (let l = start; l < end; l++) {
+      codeLines.push({
+        number: l + 1,
+        text: src[l],
+        isError: l + 1 === lineNum,
+      });
+    }
+
+    return { file: path.basename(frameFile), line: lineNum, codeLines };
+  } catch (_) {
+    return null;
+  }
+}
+
 // ─── Sidebar Webview Provider ─────────────────────────────────────────────────
 
 class SidebarProvider {